@@ -1,20 +1,29 @@
 import logging
 import os
 import sqlite3
+import time
 from dataclasses import dataclass, field
-from typing import Optional, List
+from typing import AsyncIterable, Optional, List
 from datetime import datetime
 from dotenv import load_dotenv
-from livekit.agents import JobContext, WorkerOptions, cli
+from livekit import rtc
+from livekit.agents import JobContext, JobProcess, WorkerOptions, cli
 from livekit.agents.llm import function_tool
-from livekit.agents.voice import Agent, AgentSession, RunContext
-from livekit.plugins import deepgram, groq, silero, elevenlabs
+from livekit.agents.voice import Agent, AgentSession, ModelSettings, RunContext
+from livekit.plugins import groq, silero
 from livekit.plugins.turn_detector.multilingual import MultilingualModel
 import aiohttp
-import asyncio
 import re
-import smtplib
-from email.message import EmailMessage
+from db import get_database
+from migrations import init_db
+from doctors import get_doctor_directory
+from scheduler import get_scheduler
+from symptoms import suggest_mental_health_specialty, suggest_specialty
+from outbox import get_email_outbox
+from speech import get_speech_pool
+from phrases import GREETINGS, get_phrase_audio
+from medicines import get_medicine_index
+from voice_metrics import VoiceMetrics, start_metrics_server
 
 logger = logging.getLogger("nurse-assistant")
 logger.setLevel(logging.INFO)
@@ -30,152 +39,6 @@ for var in required_env_vars:
         raise ValueError(f"Environment variable {var} is not set")
 
 
-def init_db():
-    conn = sqlite3.connect("hospital.db")
-    cursor = conn.cursor()
-
-    
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS patients (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            phone TEXT UNIQUE NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            insurance_provider TEXT,
-            insurance_number TEXT
-        )
-    """)
-
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS doctors (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            specialty TEXT NOT NULL
-        )
-    """)
-
- 
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS appointments (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            patient_id INTEGER,
-            doctor_id INTEGER,
-            specialty TEXT NOT NULL,
-            preferred_date TEXT NOT NULL,
-            preferred_time TEXT NOT NULL,
-            FOREIGN KEY (patient_id) REFERENCES patients(id),
-            FOREIGN KEY (doctor_id) REFERENCES doctors(id)
-        )
-    """)
-
-
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS insurance_claims (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            patient_id INTEGER,
-            insurance_provider TEXT,
-            insurance_number TEXT,
-            claim_amount REAL,
-            status TEXT,
-            claim_date TEXT NOT NULL,
-            FOREIGN KEY (patient_id) REFERENCES patients(id)
-        )
-    """)
-
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS medicines (
-            name TEXT PRIMARY KEY,
-            description TEXT,
-            side_effects TEXT
-        )
-    """)
-
-    doctors_data = [
-        ("Dr. Anil Sharma", "General Medicine"), ("Dr. Priya Gupta", "General Medicine"),
-        ("Dr. Rajesh Kumar", "General Medicine"), ("Dr. Neha Patel", "General Medicine"),
-        ("Dr. Sanjay Desai", "General Medicine"), ("Dr. Anjali Mehta", "General Medicine"),
-        ("Dr. Vikram Singh", "General Medicine"), ("Dr. Pooja Shah", "General Medicine"),
-        ("Dr. Rakesh Verma", "General Medicine"), ("Dr. Sunita Joshi", "General Medicine"),
-        ("Dr. Amit Choudhary", "Orthopedics"), ("Dr. Shalini Kapoor", "Orthopedics"),
-        ("Dr. Manoj Patil", "Orthopedics"), ("Dr. Kavita Rana", "Orthopedics"),
-        ("Dr. Deepak Malhotra", "Orthopedics"), ("Dr. Meera Nair", "Orthopedics"),
-        ("Dr. Rohan Kulkarni", "Orthopedics"), ("Dr. Swati Thakur", "Orthopedics"),
-        ("Dr. Vinod Agarwal", "Orthopedics"), ("Dr. Lakshmi Iyer", "Orthopedics"),
-        ("Dr. Sameer Khan", "Psychiatry"), ("Dr. Ritu Saxena", "Psychiatry"),
-        ("Dr. Arjun Menon", "Psychiatry"), ("Dr. Nisha Varghese", "Psychiatry"),
-        ("Dr. Siddharth Bose", "Psychiatry"), ("Dr. Ananya Das", "Psychiatry"),
-        ("Dr. Karan Oberoi", "Psychiatry"), ("Dr. Preeti Malhotra", "Psychiatry"),
-        ("Dr. Vivek Sharma", "Psychiatry"), ("Dr. Smriti Jain", "Psychiatry"),
-        ("Dr. Rahul Mehra", "Cardiology"), ("Dr. Suman Gupta", "Cardiology"),
-        ("Dr. Ashok Reddy", "Cardiology"), ("Dr. Divya Sharma", "Cardiology"),
-        ("Dr. Kunal Desai", "Cardiology"), ("Dr. Rekha Pillai", "Cardiology"),
-        ("Dr. Manish Thakur", "Cardiology"), ("Dr. Seema Kapoor", "Cardiology"),
-        ("Dr. Ajay Bhatt", "Cardiology"), ("Dr. Lakshmi Nair", "Cardiology"),
-        ("Dr. Vikrant Singh", "Neurology"), ("Dr. Anjali Rao", "Neurology"),
-        ("Dr. Sanjay Gupta", "Neurology"), ("Dr. Priyanka Shah", "Neurology"),
-        ("Dr. Rohit Kumar", "Neurology"), ("Dr. Neeta Patel", "Neurology"),
-        ("Dr. Aravind Menon", "Neurology"), ("Dr. Shalini Desai", "Neurology"),
-        ("Dr. Rajiv Malhotra", "Neurology"), ("Dr. Meena Iyer", "Neurology")
-    ]
-    cursor.executemany("INSERT OR IGNORE INTO doctors (name, specialty) VALUES (?, ?)", doctors_data)
-
-    # Insert sample patient data
-    patients_data = [
-        ("Arav Saxena", "+919876543210", "arav.saxena@example.com", "Star Health", "SH123456"),
-        ("Priya Sharma", "+918765432109", "priya.sharma@example.com", "HDFC Ergo", "HE789012"),
-        ("Rahul Mehta", "+917654321098", "rahul.mehta@example.com", None, None)
-    ]
-    cursor.executemany(
-        "INSERT OR IGNORE INTO patients (name, phone, email, insurance_provider, insurance_number) VALUES (?, ?, ?, ?, ?)",
-        patients_data
-    )
-
- 
-    cursor.execute("SELECT id FROM patients WHERE name = 'Arav Saxena'")
-    arav_id = cursor.fetchone()[0]
-    cursor.execute("SELECT id FROM doctors WHERE name = 'Dr. Anil Sharma' AND specialty = 'General Medicine'")
-    doctor1_id = cursor.fetchone()[0]
-    cursor.execute("SELECT id FROM doctors WHERE name = 'Dr. Amit Choudhary' AND specialty = 'Orthopedics'")
-    doctor2_id = cursor.fetchone()[0]
-    appointments_data = [
-        (arav_id, doctor1_id, "General Medicine", "2025-06-15", "10:00"),
-        (arav_id, doctor2_id, "Orthopedics", "2025-06-20", "14:30"),
-        (2, doctor1_id, "General Medicine", "2025-06-16", "11:00"),  # Priya Sharma
-        (3, doctor2_id, "Orthopedics", "2025-06-18", "09:30")  # Rahul Mehta
-    ]
-    cursor.executemany(
-        "INSERT INTO appointments (patient_id, doctor_id, specialty, preferred_date, preferred_time) VALUES (?, ?, ?, ?, ?)",
-        appointments_data
-    )
-
-   
-    current_date = datetime.now().strftime("%Y-%m-%d")
-    insurance_claims_data = [
-        (arav_id, "Star Health", "SH123456", 5000.0, "Pending", current_date),
-        (2, "HDFC Ergo", "HE789012", 7500.0, "Approved", current_date)
-    ]
-    cursor.executemany(
-        "INSERT INTO insurance_claims (patient_id, insurance_provider, insurance_number, claim_amount, status, claim_date) "
-        "VALUES (?, ?, ?, ?, ?, ?)",
-        insurance_claims_data
-    )
-
-
-    medicines_data = [
-        ("Paracetamol", "Pain reliever and fever reducer", "Nausea, rash, liver damage (rare)"),
-        ("Ibuprofen", "Nonsteroidal anti-inflammatory drug", "Stomach pain, dizziness, headache"),
-        ("Aspirin", "Pain reliever and blood thinner", "Stomach upset, bleeding risk"),
-        ("Amoxicillin", "Antibiotic for bacterial infections", "Diarrhea, rash, allergic reactions")
-    ]
-    cursor.executemany(
-        "INSERT OR IGNORE INTO medicines (name, description, side_effects) VALUES (?, ?, ?)",
-        medicines_data
-    )
-
-    conn.commit()
-    conn.close()
-
-
 PROMPTS = {
     "en": (
         "You are Riya, a compassionate nurse assistant at Symbiosis Hospital. Do not use emojis or special characters. "
@@ -310,50 +173,26 @@ class UserData:
 RunContext_T = RunContext[UserData]
 
 class TriageAgent(Agent):
-    def __init__(self, language: str = "en") -> None:
+    def __init__(self, language: str = "en", vad: Optional[silero.VAD] = None) -> None:
         super().__init__(
             instructions=PROMPTS.get(language, PROMPTS["en"]),
             llm=groq.LLM(model="gemma2-9b-it", api_key=""),
             tts=self._get_tts(language),
             stt=self._get_stt(language),
-            vad=silero.VAD.load(),
+            vad=vad or silero.VAD.load(),
+            # The turn detector weights live in the worker's shared inference
+            # process; this is only a thin per-job handle onto it.
             turn_detection=MultilingualModel(),
         )
         self.language = language
 
     def _get_tts(self, language: str):
-        """Return the appropriate TTS factory for the language."""
-        tts_factories = {
-            "en": lambda: deepgram.TTS(model="aura-asteria-en",api_key=""),
-            "hi": lambda: elevenlabs.TTS(
-                voice_id="mActWQg9kibLro6Z2ouY",
-                model="eleven_multilingual_v2",
-                api_key="",
-            ),
-            "mr": lambda: elevenlabs.TTS(
-                voice_id="mActWQg9kibLro6Z2ouY",
-                model="eleven_multilingual_v2",
-                api_key="",
-            ),
-            "pa": lambda: deepgram.TTS(model="aura-asteria-en"),
-            "ta": lambda: elevenlabs.TTS(
-                voice_id="mActWQg9kibLro6Z2ouY",
-                model="eleven_multilingual_v2",
-                api_key="",
-            ),
-        }
-        return tts_factories.get(language, tts_factories["en"])()
+        """Return the worker's shared TTS client for the language."""
+        return get_speech_pool().tts(language)
 
     def _get_stt(self, language: str):
-        """Return the appropriate STT factory for the language."""
-        stt_factories = {
-            "en": lambda: groq.STT(model="whisper-large-v3-turbo", language="en", api_key=""),
-            "hi": lambda: groq.STT(model="whisper-large-v3-turbo", language="hi", api_key=""),
-            "mr": lambda: groq.STT(model="whisper-large-v3-turbo", language="mr", api_key=""),
-            "pa": lambda: groq.STT(model="whisper-large-v3-turbo", language="pa", api_key=""),
-            "ta": lambda: groq.STT(model="whisper-large-v3-turbo", language="ta", api_key=""),
-        }
-        return stt_factories.get(language, stt_factories["en"])()
+        """Return the worker's shared STT client for the language."""
+        return get_speech_pool().stt(language)
 
     async def on_enter(self) -> None:
         logger.info("Entering TriageAgent")
@@ -375,14 +214,33 @@ class TriageAgent(Agent):
 
     def get_greeting(self) -> str:
         """Return a language-specific greeting."""
-        greetings = {
-            "en": "Hello, I am Riya, a nurse assistant at Symbiosis Hospital. How can I assist you today?",
-            "hi": "नमस्ते, मैं सिम्बायोसिस अस्पताल की नर्स सहायक रिया हूँ। मैं आपकी आज कैसे मदद कर सकती हूँ?",
-            "mr": "नमस्कार, मी सिम्बायोसिस हॉस्पिटलची नर्स सहाय्यक रिया आहे. मी तुम्हाला आज कशी मदत करू शकते?",
-            "pa": "ਸਤ ਸ੍ਰੀ ਅਕਾਲ, ਮੈਂ ਸਿਮਬਾਇਓਸਿਸ ਹਸਪਤਾਲ ਦੀ ਨਰਸ ਸਹਾਇਕ ਰੀਆ ਹਾਂ। ਮੈਂ ਅੱਜ ਤੁਹਾਡੀ ਕਿਵੇਂ ਮਦਦ ਕਰ ਸਕਦੀ ਹਾਂ?",
-            "ta": "வணக்கம், நான் சிம்பயோசிஸ் மருத்துவமனையின் செவிலியர் உதவியாளர் ரியா. இன்று உங்களுக்கு எப்படி உதவ முடியும்?"
-        }
-        return greetings.get(self.language, greetings["en"])
+        return GREETINGS.get(self.language, GREETINGS["en"])
+
+    async def tts_node(self, text: AsyncIterable[str], model_settings: ModelSettings) -> AsyncIterable[rtc.AudioFrame]:
+        """Play pre-rendered audio for fixed phrases, synthesizing everything else."""
+        phrase_audio = get_phrase_audio()
+        chunks = text.__aiter__()
+        buffered: List[str] = []
+        async for chunk in chunks:
+            buffered.append(chunk)
+            # Stop holding text back as soon as it cannot be a cached phrase.
+            if not phrase_audio.might_match(self.language, "".join(buffered)):
+                break
+        else:
+            clip = phrase_audio.get(self.language, "".join(buffered))
+            if clip is not None:
+                async for frame in phrase_audio.frames(clip):
+                    yield frame
+                return
+
+        async def replay():
+            for chunk in buffered:
+                yield chunk
+            async for chunk in chunks:
+                yield chunk
+
+        async for frame in Agent.default.tts_node(self, replay(), model_settings):
+            yield frame
 
     @function_tool
     async def identify_patient(self, name: str, phone: str, email: str, insurance_provider: Optional[str] = None, insurance_number: Optional[str] = None) -> str:
@@ -394,15 +252,11 @@ class TriageAgent(Agent):
             return "Please provide a valid email address (e.g., example@domain.com)."
 
         try:
-            conn = sqlite3.connect("hospital.db")
-            cursor = conn.cursor()
-            cursor.execute(
+            cursor = await get_database().execute(
                 "INSERT INTO patients (name, phone, email, insurance_provider, insurance_number) VALUES (?, ?, ?, ?, ?)",
                 (name, phone, email, insurance_provider, insurance_number)
             )
-            conn.commit()
             patient_id = cursor.lastrowid
-            conn.close()
 
             userdata.name = name
             userdata.phone = phone
@@ -418,34 +272,9 @@ class TriageAgent(Agent):
     @function_tool
     async def assess_injury(self, symptoms: str) -> str:
         """Assess physical injury symptoms and suggest a specialty."""
-        symptom_map = {
-            "pain in arm": "Orthopedics",
-            "leg pain": "Orthopedics",
-            "back pain": "Orthopedics",
-            "sports injury": "Orthopedics",
-            "fracture": "Orthopedics",
-            "chest pain": "Cardiology",
-            "heart": "Cardiology",
-            "headache": "Neurology",
-            "seizure": "Neurology",
-            "fever": "General Medicine",
-            "cough": "General Medicine",
-            "fall": "Orthopedics",
-            "accident": "Orthopedics"
-        }
-        specialty = None
-        for symptom, spec in symptom_map.items():
-            if symptom.lower() in symptoms.lower():
-                specialty = spec
-                break
-        if not specialty:
-            specialty = "General Medicine"
+        specialty = suggest_specialty(symptoms)
 
-        conn = sqlite3.connect("hospital.db")
-        cursor = conn.cursor()
-        cursor.execute("SELECT name FROM doctors WHERE specialty = ? LIMIT 10", (specialty,))
-        doctors = [row[0] for row in cursor.fetchall()]
-        conn.close()
+        doctors = [name for _, name in (await get_doctor_directory().get(specialty))[:10]]
 
         doctor_list = ", ".join(doctors) if doctors else "No doctors available."
         return (
@@ -456,16 +285,9 @@ class TriageAgent(Agent):
     @function_tool
     async def assess_mental_health(self, symptoms: str) -> str:
         """Assess mental health symptoms and suggest a specialty."""
-        if any(keyword in symptoms.lower() for keyword in ["anxiety", "depression", "stress", "mood", "sleep"]):
-            specialty = "Psychiatry"
-        else:
-            specialty = "General Medicine"
+        specialty = suggest_mental_health_specialty(symptoms)
 
-        conn = sqlite3.connect("hospital.db")
-        cursor = conn.cursor()
-        cursor.execute("SELECT name FROM doctors WHERE specialty = ? LIMIT 10", (specialty,))
-        doctors = [row[0] for row in cursor.fetchall()]
-        conn.close()
+        doctors = [name for _, name in (await get_doctor_directory().get(specialty))[:10]]
 
         doctor_list = ", ".join(doctors) if doctors else "No doctors available."
         return (
@@ -481,46 +303,34 @@ class TriageAgent(Agent):
             return "Please identify yourself first using name, phone, and email."
 
         try:
-            datetime.strptime(preferred_date, "%Y-%m-%d")
-            datetime.strptime(preferred_time, "%H:%M")
+            preferred_date = datetime.strptime(preferred_date, "%Y-%m-%d").strftime("%Y-%m-%d")
+            preferred_time = datetime.strptime(preferred_time, "%H:%M").strftime("%H:%M")
         except ValueError:
             return "Please provide date in YYYY-MM-DD format and time in HH:MM format."
 
-        conn = sqlite3.connect("hospital.db")
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, name FROM doctors WHERE specialty = ? LIMIT 1", (specialty,))
-        doctor = cursor.fetchone()
-        if not doctor:
-            conn.close()
+        if not await get_doctor_directory().get(specialty):
             return f"Specialty '{specialty}' is not available. Please choose another specialty."
 
-        doctor_id, doctor_name = doctor
-
-        # Update insurance details if provided
-        if insurance_provider and insurance_number:
-            cursor.execute(
-                "UPDATE patients SET insurance_provider = ?, insurance_number = ? WHERE id = ?",
-                (insurance_provider, insurance_number, userdata.patient_id)
-            )
-            conn.commit()
-            userdata.insurance_provider = insurance_provider
-            userdata.insurance_number = insurance_number
-
+        # Insurance details, if provided, are saved with the booking and only if it succeeds
+        insurance = (insurance_provider, insurance_number) if insurance_provider and insurance_number else None
         try:
-            cursor.execute(
-                "INSERT INTO appointments (patient_id, doctor_id, specialty, preferred_date, preferred_time) "
-                "VALUES (?, ?, ?, ?, ?)",
-                (userdata.patient_id, doctor_id, specialty, preferred_date, preferred_time)
+            reservation = await get_scheduler().book(
+                userdata.patient_id, specialty, preferred_date, preferred_time, insurance=insurance
             )
-            conn.commit()
-            booking_id = cursor.lastrowid
         except sqlite3.Error as e:
-            conn.close()
             return f"Failed to book appointment: {str(e)}"
 
-        conn.close()
+        if not reservation:
+            return self._slot_unavailable(
+                await get_scheduler().suggest_alternatives(specialty, preferred_date, preferred_time),
+                specialty, preferred_date, preferred_time
+            )
+
+        if insurance:
+            userdata.insurance_provider, userdata.insurance_number = insurance
+        booking_id, doctor_name = reservation.booking_id, reservation.doctor_name
 
-        email_sent = await self._send_confirmation_email(userdata.email, booking_id, specialty, preferred_date, preferred_time)
+        email_sent = await self._queue_confirmation_email(userdata.email, booking_id, specialty, preferred_date, preferred_time)
         userdata.current_booking = None
 
         if email_sent:
@@ -537,9 +347,7 @@ class TriageAgent(Agent):
     @function_tool
     async def view_appointments(self, phone: str) -> str:
         """View upcoming appointments for a patient by phone number."""
-        conn = sqlite3.connect("hospital.db")
-        cursor = conn.cursor()
-        cursor.execute(
+        bookings = await get_database().fetchall(
             """
             SELECT a.id, d.name, a.specialty, a.preferred_date, a.preferred_time 
             FROM appointments a 
@@ -549,8 +357,6 @@ class TriageAgent(Agent):
             """,
             (phone,)
         )
-        bookings = cursor.fetchall()
-        conn.close()
 
         if not bookings:
             return "You have no upcoming appointments."
@@ -562,66 +368,55 @@ class TriageAgent(Agent):
     @function_tool
     async def update_appointment(self, booking_id: int, new_date: Optional[str] = None, new_time: Optional[str] = None, new_specialty: Optional[str] = None) -> str:
         """Update an existing appointment by booking ID."""
-        conn = sqlite3.connect("hospital.db")
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT patient_id, doctor_id, specialty, preferred_date, preferred_time FROM appointments WHERE id = ?",
-            (booking_id,)
-        )
-        booking = cursor.fetchone()
-        if not booking:
-            conn.close()
-            return "Appointment not found. Please check the booking ID."
-
-        patient_id, current_doctor_id, current_specialty, current_date, current_time = booking
-        new_specialty = new_specialty or current_specialty
-        new_date = new_date or current_date
-        new_time = new_time or current_time
+        try:
+            if new_date:
+                new_date = datetime.strptime(new_date, "%Y-%m-%d").strftime("%Y-%m-%d")
+            if new_time:
+                new_time = datetime.strptime(new_time, "%H:%M").strftime("%H:%M")
+        except ValueError:
+            return "Please provide date in YYYY-MM-DD format and time in HH:MM format."
 
-        cursor.execute("SELECT id FROM doctors WHERE specialty = ? LIMIT 1", (new_specialty,))
-        doctor = cursor.fetchone()
-        if not doctor:
-            conn.close()
+        if new_specialty and not await get_doctor_directory().get(new_specialty):
             return f"Specialty '{new_specialty}' is not available. Please choose another specialty."
 
-        new_doctor_id = doctor[0]
-
         try:
-            datetime.strptime(new_date, "%Y-%m-%d")
-            datetime.strptime(new_time, "%H:%M")
+            reservation = await get_scheduler().reschedule(booking_id, new_date, new_time, new_specialty)
+        except LookupError:
+            return "Appointment not found. Please check the booking ID."
         except ValueError:
-            conn.close()
             return "Please provide date in YYYY-MM-DD format and time in HH:MM format."
 
-        cursor.execute(
-            "UPDATE appointments SET doctor_id = ?, specialty = ?, preferred_date = ?, preferred_time = ? WHERE id = ?",
-            (new_doctor_id, new_specialty, new_date, new_time, booking_id)
+        if not reservation:
+            booking = await get_database().fetchone(
+                "SELECT specialty, preferred_date, preferred_time FROM appointments WHERE id = ?", (booking_id,)
+            )
+            if not booking:
+                return "Appointment not found. Please check the booking ID."
+            specialty = new_specialty or booking[0]
+            preferred_date = new_date or booking[1]
+            preferred_time = new_time or booking[2]
+            return self._slot_unavailable(
+                await get_scheduler().suggest_alternatives(specialty, preferred_date, preferred_time),
+                specialty, preferred_date, preferred_time
+            )
+        return (
+            f"Appointment updated successfully. It is now on {reservation.preferred_date} at "
+            f"{reservation.preferred_time} with {reservation.doctor_name} ({reservation.specialty})."
         )
-        conn.commit()
-        conn.close()
-        return "Appointment updated successfully."
 
     @function_tool
     async def cancel_appointment(self, booking_id: int) -> str:
         """Cancel an appointment by booking ID."""
-        conn = sqlite3.connect("hospital.db")
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM appointments WHERE id = ?", (booking_id,))
-        if cursor.rowcount == 0:
-            conn.close()
+        if not await get_scheduler().cancel(booking_id):
             return "Appointment not found. Please check the booking ID."
-        conn.commit()
-        conn.close()
         return "Appointment canceled successfully."
 
     @function_tool
     async def check_insurance(self, phone: str) -> str:
         """Check if a patient has health insurance by phone number."""
-        conn = sqlite3.connect("hospital.db")
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, insurance_provider, insurance_number FROM patients WHERE phone = ?", (phone,))
-        patient = cursor.fetchone()
-        conn.close()
+        patient = await get_database().fetchone(
+            "SELECT id, insurance_provider, insurance_number FROM patients WHERE phone = ?", (phone,)
+        )
         if not patient:
             return "No patient found with this phone number."
         patient_id, insurance_provider, insurance_number = patient
@@ -632,77 +427,86 @@ class TriageAgent(Agent):
     @function_tool
     async def submit_insurance_claim(self, phone: str, claim_amount: float) -> str:
         """Submit an insurance claim for a patient."""
-        conn = sqlite3.connect("hospital.db")
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, insurance_provider, insurance_number FROM patients WHERE phone = ?", (phone,))
-        patient = cursor.fetchone()
-        if not patient:
-            conn.close()
-            return "No patient found with this phone number."
+        def _submit(conn):
+            patient = conn.execute(
+                "SELECT id, insurance_provider, insurance_number FROM patients WHERE phone = ?", (phone,)
+            ).fetchone()
+            if not patient:
+                return "No patient found with this phone number."
+
+            patient_id, insurance_provider, insurance_number = patient
+            if not insurance_provider or not insurance_number:
+                return "No insurance details found. Please provide insurance information first."
+
+            current_date = datetime.now().strftime("%Y-%m-%d")
+            cursor = conn.execute(
+                "INSERT INTO insurance_claims (patient_id, insurance_provider, insurance_number, claim_amount, status, claim_date) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (patient_id, insurance_provider, insurance_number, claim_amount, "Pending", current_date)
+            )
+            return f"Insurance claim #{cursor.lastrowid} submitted for {claim_amount} INR. Status: Pending."
 
-        patient_id, insurance_provider, insurance_number = patient
-        if not insurance_provider or not insurance_number:
-            conn.close()
-            return "No insurance details found. Please provide insurance information first."
-
-        current_date = datetime.now().strftime("%Y-%m-%d")
-        cursor.execute(
-            "INSERT INTO insurance_claims (patient_id, insurance_provider, insurance_number, claim_amount, status, claim_date) "
-            "VALUES (?, ?, ?, ?, ?, ?)",
-            (patient_id, insurance_provider, insurance_number, claim_amount, "Pending", current_date)
-        )
-        conn.commit()
-        claim_id = cursor.lastrowid
-        conn.close()
-        return f"Insurance claim #{claim_id} submitted for {claim_amount} INR. Status: Pending."
+        return await get_database().run(_submit)
 
     @function_tool
     async def get_medicine_info(self, name: str) -> str:
         """Get information about a specific medicine."""
-        conn = sqlite3.connect("hospital.db")
-        cursor = conn.cursor()
-        cursor.execute("SELECT name, description, side_effects FROM medicines WHERE name = ?", (name,))
-        medicine = cursor.fetchone()
-        conn.close()
+        matches = await get_medicine_index().search(name)
 
-        if not medicine:
+        if not matches:
             return f"No information found for medicine: {name}"
+        medicine = matches[0]
+        details = (
+            f"Medicine: {medicine.name}\n"
+            f"Description: {medicine.description}\n"
+            f"Side Effects: {medicine.side_effects}"
+        )
+        if medicine.score == 1.0:
+            return details
+        others = ", ".join(match.name for match in matches[1:])
+        return (
+            f"No exact match for {name}; the closest is {medicine.name}. Confirm with the patient.\n{details}"
+            + (f"\nOther possible matches: {others}" if others else "")
+        )
+
+    def _slot_unavailable(self, alternatives, specialty: str, preferred_date: str, preferred_time: str) -> str:
+        """Describe a taken slot and the nearest free alternatives."""
+        if not alternatives:
+            return (
+                f"No {specialty} doctor is free on {preferred_date} at {preferred_time}, and there are no open slots "
+                f"in the following week. Please choose another date."
+            )
+        options = "\n".join(f"- {date} at {time} with {doctor}" for date, time, doctor in alternatives)
         return (
-            f"Medicine: {medicine[0]}\n"
-            f"Description: {medicine[1]}\n"
-            f"Side Effects: {medicine[2]}"
+            f"No {specialty} doctor is free on {preferred_date} at {preferred_time}. "
+            f"The nearest available slots are:\n{options}\nWould you like one of these instead?"
         )
 
-    async def _send_confirmation_email(self, patient_email: str, booking_id: int, specialty: str, preferred_date: str, preferred_time: str) -> bool:
-        """Send a confirmation email for the appointment."""
+    async def _queue_confirmation_email(self, patient_email: str, booking_id: int, specialty: str, preferred_date: str, preferred_time: str) -> bool:
+        """Queue a confirmation email for the appointment on the background outbox."""
         try:
-            email_sender = os.getenv("EMAIL_SENDER")
-            email_password = os.getenv("EMAIL_PASSWORD")
-            if not email_sender or not email_password:
-                logger.error("Email credentials are missing in the environment variables.")
-                return False
-
-            msg = EmailMessage()
-            msg['Subject'] = "Appointment Confirmation"
-            msg['From'] = email_sender
-            msg['To'] = patient_email
-            msg.set_content(
+            message_id = await get_email_outbox().enqueue(
+                patient_email,
+                "Appointment Confirmation",
                 f"Hello {self.session.userdata.name}, your appointment (#{booking_id}) is scheduled for "
                 f"{preferred_date} at {preferred_time} with a {specialty} specialist."
             )
-
-            with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
-                server.login(email_sender, email_password)
-                server.send_message(msg)
-
-            logger.info(f"Confirmation email sent to {patient_email}")
-            return True
+            return message_id is not None
         except Exception as e:
-            logger.error(f"Failed to send email to {patient_email}: {e}")
+            logger.error(f"Failed to queue email to {patient_email}: {e}")
             return False
 
 
+def prewarm(proc: JobProcess):
+    """Load the VAD and phrase audio once per worker process, before any job is assigned to it."""
+    started = time.perf_counter()
+    proc.userdata["vad"] = silero.VAD.load()
+    get_phrase_audio().load()
+    logger.info(f"Prewarmed Silero VAD in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+
 async def entrypoint(ctx: JobContext):
+    dispatched_at = time.perf_counter()
     logger.info(f"Attempting to connect to LiveKit server at {os.getenv('LIVEKIT_URL')}")
     try:
         await ctx.connect()
@@ -710,11 +514,10 @@ async def entrypoint(ctx: JobContext):
         logger.error(f"Failed to connect to LiveKit server: {e}")
         raise
 
-    # Wait for a participant to join
-    while len(ctx.room.remote_participants) < 1:
-        await asyncio.sleep(0.1)
+    get_email_outbox().start()
 
-    user_participant = next(iter(ctx.room.remote_participants.values()))
+    # Returns at once if the caller is already in the room, otherwise on participant_connected
+    user_participant = await ctx.wait_for_participant()
     language = user_participant.metadata or "en"
 
     logger.info(f"Job {ctx.job.id} received for language: {language}")
@@ -723,11 +526,23 @@ async def entrypoint(ctx: JobContext):
     userdata = UserData(ctx=ctx, language=language)
 
     # Create triage agent
-    triage_agent = TriageAgent(language=language)
+    triage_agent = TriageAgent(language=language, vad=ctx.proc.userdata.get("vad"))
 
     # Create session with userdata
     session = AgentSession[UserData](userdata=userdata)
 
+    @session.on("agent_state_changed")
+    def _on_first_audio(ev):
+        # The first switch to "speaking" is when greeting audio starts playing out.
+        if ev.new_state == "speaking":
+            session.off("agent_state_changed", _on_first_audio)
+            logger.info(
+                f"Job {ctx.job.id}: first greeting audio {(time.perf_counter() - dispatched_at) * 1000:.0f} ms after dispatch"
+            )
+
+    voice_metrics = VoiceMetrics(language)
+    session.on("metrics_collected", lambda ev: voice_metrics.record(ev.metrics))
+
     # Start the session with the triage agent
     try:
         await session.start(
@@ -738,18 +553,24 @@ async def entrypoint(ctx: JobContext):
         logger.error(f"Failed to start agent session: {e}")
         raise
 
-    # Placeholder for metrics collection
+    voice_metrics.start()
+
     async def log_usage():
-        logger.info(f"Job {ctx.job.id}: Metrics collection placeholder")
+        await voice_metrics.stop()
+        logger.info(f"Job {ctx.job.id}: Voice latency {voice_metrics.summary()}")
+        logger.info(f"Job {ctx.job.id}: Doctor directory cache {get_doctor_directory().stats()}")
+        logger.info(f"Job {ctx.job.id}: Speech client pool {get_speech_pool().stats()}")
+        logger.info(f"Job {ctx.job.id}: Pre-rendered phrase audio {get_phrase_audio().stats()}")
 
     ctx.add_shutdown_callback(log_usage)
     logger.info(f"Job {ctx.job.id}: Shutdown callback added")
 
 if __name__ == "__main__":
     init_db()
+    start_metrics_server()
     worker_options = WorkerOptions(
         entrypoint_fnc=entrypoint,
-       
+        prewarm_fnc=prewarm,
     )
     cli.run_app(worker_options)
 
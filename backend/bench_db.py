@@ -0,0 +1,131 @@
+"""Tool latency benchmark for the hospital.db access layer.
+
+Runs the queries behind the TriageAgent tools (view, insurance check, booking)
+from 1, 10 and 100 concurrent sessions, once with the old connect-per-call code
+running on the event loop and once through the pooled ``Database``. Besides the
+per-call latency it reports the worst event loop stall seen by a 10 ms ticker,
+which is what audio handling experiences while tools run.
+
+    python bench_db.py [--calls 20] [--sessions 1 10 100]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from db import Database
+from migrations import init_db
+
+PHONES = ["+919876543210", "+918765432109", "+917654321098"]
+
+VIEW_SQL = """
+    SELECT a.id, d.name, a.specialty, a.preferred_date, a.preferred_time
+    FROM appointments a
+    JOIN patients p ON a.patient_id = p.id
+    JOIN doctors d ON a.doctor_id = d.id
+    WHERE p.phone = ?
+"""
+INSURANCE_SQL = "SELECT id, insurance_provider, insurance_number FROM patients WHERE phone = ?"
+DOCTOR_SQL = "SELECT id, name FROM doctors WHERE specialty = ? LIMIT 1"
+BOOK_SQL = (
+    "INSERT INTO appointments (patient_id, doctor_id, specialty, preferred_date, preferred_time) "
+    "VALUES (?, ?, ?, ?, ?)"
+)
+
+
+async def _legacy_call(path, kind):
+    # Mirrors the old tools: a fresh connection and blocking queries on the loop.
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    if kind == "view":
+        cursor.execute(VIEW_SQL, (random.choice(PHONES),))
+        cursor.fetchall()
+    elif kind == "insurance":
+        cursor.execute(INSURANCE_SQL, (random.choice(PHONES),))
+        cursor.fetchone()
+    else:
+        cursor.execute(DOCTOR_SQL, ("Orthopedics",))
+        doctor_id = cursor.fetchone()[0]
+        cursor.execute(BOOK_SQL, (1, doctor_id, "Orthopedics", "2025-07-01", "10:00"))
+        conn.commit()
+    conn.close()
+
+
+def _pooled_book(conn):
+    doctor_id = conn.execute(DOCTOR_SQL, ("Orthopedics",)).fetchone()[0]
+    return conn.execute(BOOK_SQL, (1, doctor_id, "Orthopedics", "2025-07-01", "10:00")).lastrowid
+
+
+async def _pooled_call(db, kind):
+    if kind == "view":
+        await db.fetchall(VIEW_SQL, (random.choice(PHONES),))
+    elif kind == "insurance":
+        await db.fetchone(INSURANCE_SQL, (random.choice(PHONES),))
+    else:
+        await db.run(_pooled_book)
+
+
+async def _session(call, calls, latencies):
+    for _ in range(calls):
+        kind = random.choice(["view", "view", "insurance", "book"])
+        start = time.perf_counter()
+        await call(kind)
+        latencies.append(time.perf_counter() - start)
+
+
+async def _ticker(stop, stalls):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.01)
+        stalls.append(time.perf_counter() - start - 0.01)
+
+
+async def _run(call, sessions, calls):
+    latencies, stalls = [], []
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(_ticker(stop, stalls))
+    start = time.perf_counter()
+    await asyncio.gather(*(_session(call, calls, latencies) for _ in range(sessions)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await ticker
+    return latencies, stalls, elapsed
+
+
+def _report(label, sessions, latencies, stalls, elapsed):
+    latencies = sorted(latencies)
+    p50 = statistics.median(latencies) * 1000
+    p95 = latencies[int(len(latencies) * 0.95) - 1] * 1000
+    max_stall = max(stalls, default=0.0) * 1000
+    print(
+        f"{label:<8} sessions={sessions:<4} calls={len(latencies):<6} "
+        f"p50={p50:8.2f}ms p95={p95:8.2f}ms throughput={len(latencies) / elapsed:8.0f}/s "
+        f"max_loop_stall={max_stall:8.2f}ms"
+    )
+
+
+async def main(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "hospital.db")
+        init_db(path)
+        db = Database(path=path, pool_size=args.pool_size)
+        try:
+            for sessions in args.sessions:
+                legacy = await _run(lambda kind: _legacy_call(path, kind), sessions, args.calls)
+                _report("legacy", sessions, *legacy)
+                pooled = await _run(lambda kind: _pooled_call(db, kind), sessions, args.calls)
+                _report("pooled", sessions, *pooled)
+        finally:
+            db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=20, help="tool calls per session")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--pool-size", type=int, default=4)
+    asyncio.run(main(parser.parse_args()))
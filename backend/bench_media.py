@@ -0,0 +1,131 @@
+"""Image ingestion benchmark: the old pass-through data URL against media.py.
+
+Serves a set of images from a local HTTP server and fetches each one both
+ways: the old path (download whole, base64 as-is) and the pipeline (streamed,
+capped download, decode, downscale to IMAGE_MAX_SIDE, re-encode without
+EXIF). It reports the data URL size and the fetch + prepare latency per image.
+By default the images are synthetic 12 MP phone-style JPEGs with EXIF, plus
+the sample PNGs in this directory; pass ``--images`` to use real photos.
+
+With ``--vision`` and GROQ_API_KEY set, each data URL is also sent to the
+vision model, to time the whole round trip end to end:
+
+    python bench_media.py [--images a.jpg b.jpg] [--repeat 5] [--vision]
+"""
+import argparse
+import glob
+import os
+import statistics
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from PIL import Image
+
+from media import IMAGE_MAX_SIDE, get_media_pipeline, to_data_url
+
+VISION_MODEL = "meta-llama/llama-4-scout-17b-16e-instruct"
+
+
+def _synthetic_photo(path, width, height, seed):
+    """A JPEG with camera-like entropy (smooth shading plus sensor noise) and EXIF."""
+    shade = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    noise = Image.effect_noise((width, height), 40 + seed * 5).convert("RGB")
+    tint = Image.new("RGB", (width, height), (180 - seed * 20, 120, 100 + seed * 10))
+    photo = Image.blend(Image.blend(shade, tint, 0.5), noise, 0.25)
+    exif = Image.Exif()
+    exif[0x010F] = "BenchPhone"  # Make
+    exif[0x0110] = "Model 12"  # Model
+    exif[0x0112] = 6  # Orientation: rotate 90 CW
+    photo.save(path, format="JPEG", quality=92, exif=exif.tobytes())
+
+
+def _legacy(url):
+    response = requests.get(url, timeout=15)
+    response.raise_for_status()
+    return to_data_url(response.content, response.headers.get("content-type", "image/jpeg"))
+
+
+def _vision(data_url):
+    from groq import Groq
+
+    client = Groq()
+    start = time.perf_counter()
+    client.chat.completions.create(
+        model=VISION_MODEL,
+        messages=[{"role": "user", "content": [
+            {"type": "text", "text": "Describe any visible injury in one sentence."},
+            {"type": "image_url", "image_url": {"url": data_url}},
+        ]}],
+        max_tokens=60,
+    )
+    return time.perf_counter() - start
+
+
+def _measure(fetch, url, repeat, vision):
+    latencies, vision_latencies, data_url = [], [], ""
+    for _ in range(repeat):
+        start = time.perf_counter()
+        data_url = fetch(url)
+        latencies.append(time.perf_counter() - start)
+    if vision:
+        vision_latencies.append(_vision(data_url))
+    return len(data_url), statistics.median(latencies) * 1000, vision_latencies
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as work:
+        _run(args, work)
+
+
+def _run(args, work):
+    directory = os.path.dirname(os.path.abspath(__file__))
+    paths = list(args.images or [])
+    if not paths:
+        for i, (width, height) in enumerate([(4000, 3000), (4032, 3024), (3000, 4000)]):
+            path = os.path.join(work, f"synthetic_{i}.jpg")
+            _synthetic_photo(path, width, height, i)
+            paths.append(path)
+        paths += sorted(glob.glob(os.path.join(directory, "*.png")))
+    for path in paths:
+        target = os.path.join(work, os.path.basename(path))
+        if os.path.abspath(path) != target:
+            with open(path, "rb") as src, open(target, "wb") as dst:
+                dst.write(src.read())
+
+    handler = type("Handler", (SimpleHTTPRequestHandler,), {"log_message": lambda *a: None})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), lambda *a: handler(*a, directory=work))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    vision = args.vision and bool(os.getenv("GROQ_API_KEY"))
+    if args.vision and not vision:
+        print("GROQ_API_KEY not set, skipping the vision round trip")
+
+    pipeline = get_media_pipeline()
+    print(f"IMAGE_MAX_SIDE={IMAGE_MAX_SIDE}\n")
+    print(f"{'image':<24}{'size':>12}{'method':>10}{'data url':>12}{'fetch p50':>12}{'vision':>10}")
+    totals = {"legacy": 0, "pipeline": 0}
+    for path in paths:
+        name = os.path.basename(path)
+        with Image.open(path) as image:
+            size = f"{image.width}x{image.height}"
+        url = f"{base}/{name}"
+        for label, fetch in (("legacy", _legacy), ("pipeline", pipeline.fetch_image)):
+            length, p50, vision_latencies = _measure(fetch, url, args.repeat, vision)
+            totals[label] += length
+            shown = f"{vision_latencies[0] * 1000:.0f}ms" if vision_latencies else "-"
+            print(f"{name[:23]:<24}{size:>12}{label:>10}{length / 1024:>10.0f}KB{p50:>10.1f}ms{shown:>10}")
+    server.shutdown()
+    legacy_bytes, pipeline_bytes = totals["legacy"], totals["pipeline"]
+    print(f"\nData URL bytes: {legacy_bytes / 1024:.0f} KB -> {pipeline_bytes / 1024:.0f} KB "
+          f"({1 - pipeline_bytes / legacy_bytes:.0%} smaller)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", nargs="+", help="image files to use instead of the synthetic set")
+    parser.add_argument("--repeat", type=int, default=5, help="fetches per image and method")
+    parser.add_argument("--vision", action="store_true", help="also time a vision model call per image")
+    main(parser.parse_args())
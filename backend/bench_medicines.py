@@ -0,0 +1,118 @@
+"""Medicine lookup benchmark: exact ``WHERE name = ?`` against the FTS5 index.
+
+Builds a synthetic catalogue (50,000 drugs by default) in a temporary
+hospital.db and queries it the ways a caller's request reaches the tool:
+the exact name, lower case, a spoken prefix, a one-letter STT slip, and a
+phrase from the description. For each kind it reports how often a right answer
+came back first and in the top three, and the p50/p95 lookup latency. Several
+drugs share each description phrase, so for that kind any drug whose
+description contains the phrase counts.
+
+    python bench_medicines.py [--medicines 50000] [--queries 500]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from medicines import MedicineIndex
+from migrations import init_db
+
+SYLLABLES = ["ab", "ce", "dol", "fen", "zo", "pra", "mox", "cil", "lin", "tra", "mi", "vir", "sar", "tan",
+             "lo", "ra", "ni", "dine", "pam", "ox", "eto", "ri", "dro", "ge", "sta", "tin", "val", "zep"]
+SUFFIXES = ["ol", "in", "ine", "ide", "am", "an", "one", "ate", "il", "ex"]
+USES = ["pain reliever", "fever reducer", "antibiotic for bacterial infections", "blood pressure control",
+        "antihistamine for allergies", "acid reflux relief", "cholesterol lowering", "blood sugar control",
+        "anti-inflammatory", "antifungal cream", "cough suppressant", "sleep aid", "muscle relaxant"]
+FORMS = ["tablet", "syrup", "capsule", "injection", "gel", "drops"]
+
+
+def _catalogue(count, rng):
+    names = set()
+    while len(names) < count:
+        name = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) + rng.choice(SUFFIXES)
+        names.add(name.capitalize())
+    return [
+        (name, f"{rng.choice(USES).capitalize()}, {rng.choice(FORMS)} {rng.randint(1, 99)}{rng.choice('kmvx')}", "Nausea")
+        for name in sorted(names)
+    ]
+
+
+def _misspell(name, rng):
+    i = rng.randrange(1, len(name) - 1)
+    if rng.random() < 0.5:
+        return name[:i] + name[i + 1] + name[i] + name[i + 2:]
+    return name[:i] + rng.choice("aeiou") + name[i + 1:]
+
+
+def _named(expected):
+    return lambda name, description: name == expected
+
+
+def _describes(phrase):
+    return lambda name, description: phrase.lower() in description.lower()
+
+
+def _queries(catalogue, count, rng):
+    picks = rng.sample(catalogue, count)
+    return {
+        "exact": [(name, _named(name)) for name, _, _ in picks],
+        "lower case": [(name.lower(), _named(name)) for name, _, _ in picks],
+        "prefix": [(name[:max(3, len(name) - 3)].lower(), _named(name)) for name, _, _ in picks],
+        "misspelt": [(_misspell(name, rng), _named(name)) for name, _, _ in picks],
+        "description": [(description.split(", ")[1], _describes(description.split(", ")[1])) for _, description, _ in picks],
+    }
+
+
+def _legacy(conn, query, limit):
+    return conn.execute("SELECT name, description FROM medicines WHERE name = ?", (query,)).fetchall()
+
+
+def _indexed(conn, query, limit):
+    return [(match.name, match.description) for match in MedicineIndex._search(conn, query, limit)]
+
+
+def _measure(lookup, conn, queries):
+    latencies, first, top3 = [], 0, 0
+    for query, relevant in queries:
+        start = time.perf_counter()
+        results = lookup(conn, query, 3)
+        latencies.append(time.perf_counter() - start)
+        hits = [relevant(name, description) for name, description in results]
+        first += bool(hits) and hits[0]
+        top3 += any(hits)
+    latencies.sort()
+    return first, top3, statistics.median(latencies) * 1000, latencies[int(len(latencies) * 0.95) - 1] * 1000
+
+
+def main(args):
+    rng = random.Random(11)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "hospital.db")
+        init_db(path)
+        conn = sqlite3.connect(path)
+        catalogue = _catalogue(args.medicines, rng)
+        start = time.perf_counter()
+        with conn:
+            conn.executemany("INSERT OR IGNORE INTO medicines (name, description, side_effects) VALUES (?, ?, ?)", catalogue)
+        print(f"Indexed {len(catalogue)} medicines in {time.perf_counter() - start:.1f}s\n")
+
+        print(f"{'query kind':<14}{'method':<10}{'top-1':>8}{'top-3':>8}{'p50':>11}{'p95':>11}")
+        for kind, queries in _queries(catalogue, args.queries, rng).items():
+            for label, lookup in (("exact", _legacy), ("fts5", _indexed)):
+                first, top3, p50, p95 = _measure(lookup, conn, queries)
+                print(
+                    f"{kind:<14}{label:<10}{first / len(queries):>8.0%}{top3 / len(queries):>8.0%}"
+                    f"{p50:>9.2f}ms{p95:>9.2f}ms"
+                )
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--medicines", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=500)
+    main(parser.parse_args())
@@ -0,0 +1,106 @@
+"""Micro-benchmark for symptom routing on long transcripts.
+
+Compares the old per-keyword substring scans (re-lowercasing the input for
+every keyword, as assess_injury did) with the compiled matchers in symptoms.py,
+for transcripts of growing length. The old scans are timed both with their
+original English-only lists and with the full multilingual tables the matcher
+carries, since the cost of a scan per keyword grows with the table. The
+yes/no injury check is also timed on English-only transcripts, which take its
+ASCII path, with the injury at the end and with none at all (the worst case
+for the scans, which then try every keyword).
+
+    python bench_symptoms.py [--repeat 200]
+"""
+import argparse
+import random
+import timeit
+
+from symptoms import SPECIALTY_KEYWORDS, injury_matcher, specialty_matcher
+
+LEGACY_SYMPTOM_MAP = {
+    "pain in arm": "Orthopedics", "leg pain": "Orthopedics", "back pain": "Orthopedics",
+    "sports injury": "Orthopedics", "fracture": "Orthopedics", "chest pain": "Cardiology",
+    "heart": "Cardiology", "headache": "Neurology", "seizure": "Neurology",
+    "fever": "General Medicine", "cough": "General Medicine", "fall": "Orthopedics", "accident": "Orthopedics",
+}
+LEGACY_INJURY_KEYWORDS = [
+    'wound', 'cut', 'bruise', 'burn', 'scrape', 'scratch', 'injury', 'hurt', 'pain',
+    'bleeding', 'swollen', 'sprain', 'fracture', 'broken', 'dislocated', 'torn',
+    'rash', 'bite', 'sting', 'laceration', 'abrasion', 'contusion', 'trauma',
+    'accident', 'fall', 'hit', 'injured', 'medical', 'first aid', 'emergency'
+]
+
+FULL_SYMPTOM_MAP = {
+    keyword.rstrip("*"): category
+    for category, languages in SPECIALTY_KEYWORDS.items()
+    for keywords in languages.values()
+    for keyword in keywords
+}
+
+FILLER = (
+    "so yesterday evening I was walking back from the market and the road was quite crowded "
+    "मैं कल शाम बाज़ार से लौट रहा था और सड़क पर बहुत भीड़ थी "
+    "நேற்று மாலை நான் சந்தையிலிருந்து திரும்பி வந்தேன் "
+).split()
+ENGLISH_FILLER = FILLER[:FILLER.index("मैं")]
+
+
+def legacy_specialty(symptoms, symptom_map=LEGACY_SYMPTOM_MAP):
+    for symptom, spec in symptom_map.items():
+        if symptom.lower() in symptoms.lower():
+            return spec
+    return "General Medicine"
+
+
+def legacy_is_injury(text):
+    text_to_check = text.lower()
+    return any(keyword in text_to_check for keyword in LEGACY_INJURY_KEYWORDS)
+
+
+def transcript(words, rng, filler=FILLER, mention="and now I have chest pain"):
+    body = [rng.choice(filler) for _ in range(words)]
+    # A late mention is the worst case for a single pass: it reads the whole text.
+    if mention:
+        body.append(mention)
+    return " ".join(body)
+
+
+def main(args):
+    rng = random.Random(7)
+    methods = {
+        "legacy specialty scan": legacy_specialty,
+        f"legacy scan, {len(FULL_SYMPTOM_MAP)} keywords": lambda t: legacy_specialty(t, FULL_SYMPTOM_MAP),
+        "compiled specialty": lambda t: specialty_matcher.classify(t, "General Medicine"),
+        "legacy injury scan": legacy_is_injury,
+        "compiled injury": injury_matcher.contains_any,
+    }
+    english = {
+        "legacy injury scan, English": legacy_is_injury,
+        "compiled injury, English": injury_matcher.contains_any,
+    }
+    quiet = {
+        "legacy injury scan, no injury": legacy_is_injury,
+        "compiled injury, no injury": injury_matcher.contains_any,
+    }
+    # A typical WhatsApp message is at the short end.
+    sizes = (10, 50, 500, 5000, 20000)
+    print(f"{'words':<32}" + "".join(f"{words:>12}" for words in sizes))
+    texts = [transcript(words, rng) for words in sizes]
+    english_texts = [transcript(words, rng, ENGLISH_FILLER) for words in sizes]
+    quiet_texts = [transcript(words, rng, ENGLISH_FILLER, mention=None) for words in sizes]
+    for text in texts:
+        assert legacy_specialty(text) == specialty_matcher.classify(text, "General Medicine")
+    for text in texts + english_texts:
+        assert injury_matcher.contains_any(text)
+    for text in quiet_texts:
+        assert not injury_matcher.contains_any(text) and not legacy_is_injury(text)
+    for group, samples in ((methods, texts), (english, english_texts), (quiet, quiet_texts)):
+        for name, fn in group.items():
+            timings = [timeit.timeit(lambda: fn(text), number=args.repeat) / args.repeat * 1e6 for text in samples]
+            print(f"{name:<32}" + "".join(f"{t:>9.1f} us" for t in timings))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=200)
+    main(parser.parse_args())
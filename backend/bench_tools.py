@@ -0,0 +1,208 @@
+"""Concurrent-session load harness for the TriageAgent tools.
+
+Calls the tool methods of ``agent.TriageAgent`` directly, without LiveKit or
+any model, against a synthetic hospital.db (1,000,000 patients and 1,000,000
+appointments by default). Each simulated call follows the script of a real
+one: identify, triage, book, view, check insurance, claim, reschedule,
+medicine lookup and cancel. Sessions run concurrently on one event loop as
+they do in a worker, with no pauses between tool calls, so the higher levels
+show where the tool layer saturates. For each concurrency level it reports
+p50/p95/p99 latency and throughput per tool, plus the worst event loop stall
+seen by a 10 ms ticker.
+
+The synthetic database is built once and reused when ``--db`` already exists:
+
+    python bench_tools.py [--db PATH] [--sessions 1 10 50 100] [--rounds 3]
+"""
+import argparse
+import asyncio
+import os
+import random
+import re
+import sqlite3
+import statistics
+import tempfile
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+INSURERS = ["Star Health", "HDFC Ergo", "ICICI Lombard", "Niva Bupa", None]
+SYMPTOMS = [
+    "I fell off my bike and now I have knee pain", "sharp chest pain since morning",
+    "मुझे तीन दिन से बुखार और खांसी है", "severe headache and dizziness", "my back pain is getting worse",
+]
+MENTAL_SYMPTOMS = ["I can't sleep and feel anxious all the time", "feeling very low and hopeless lately"]
+MEDICINES = ["paracetamol", "ibuprofin", "Aspirin", "amoxycillin"]
+SLOT_TIMES = [f"{hour:02d}:{minute:02d}" for hour in range(9, 17) for minute in (0, 30)]
+CHUNK = 50_000
+
+
+def _build(path, patients, appointments, doctors_per_specialty, rng):
+    from migrations import init_db
+
+    init_db(path)
+    conn = sqlite3.connect(path)
+    if conn.execute("SELECT COUNT(*) FROM patients").fetchone()[0] >= patients:
+        print(f"Reusing {path}")
+        conn.close()
+        return
+    start = time.perf_counter()
+    specialties = [row[0] for row in conn.execute("SELECT DISTINCT specialty FROM doctors")]
+    with conn:
+        conn.executemany(
+            "INSERT INTO doctors (name, specialty) VALUES (?, ?)",
+            [(f"Dr. Bench {specialty} {i}", specialty) for specialty in specialties for i in range(doctors_per_specialty)]
+        )
+        for offset in range(0, patients, CHUNK):
+            rows = []
+            for i in range(offset, min(offset + CHUNK, patients)):
+                insurer = rng.choice(INSURERS)
+                rows.append((f"Patient {i}", f"+91{7000000000 + i}", f"patient{i}@example.com",
+                             insurer, f"POL{i:08d}" if insurer else None))
+            conn.executemany(
+                "INSERT INTO patients (name, phone, email, insurance_provider, insurance_number) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+    patient_ids = [row[0] for row in conn.execute("SELECT id FROM patients")]
+    doctors = conn.execute("SELECT id, specialty FROM doctors").fetchall()
+    today = date.today()
+    with conn:
+        for offset in range(0, appointments, CHUNK):
+            rows = []
+            for _ in range(min(CHUNK, appointments - offset)):
+                doctor_id, specialty = rng.choice(doctors)
+                day = today + timedelta(days=rng.randint(-180, 60))
+                rows.append((rng.choice(patient_ids), doctor_id, specialty, day.isoformat(), rng.choice(SLOT_TIMES)))
+            conn.executemany(
+                "INSERT INTO appointments (patient_id, doctor_id, specialty, preferred_date, preferred_time) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+    conn.execute("ANALYZE")
+    conn.close()
+    print(f"Built {path}: {patients} patients, {appointments} appointments in {time.perf_counter() - start:.0f}s")
+
+
+class _Timed:
+    def __init__(self, latencies):
+        self.latencies = latencies
+
+    async def __call__(self, tool, *args, **kwargs):
+        start = time.perf_counter()
+        result = await tool(*args, **kwargs)
+        self.latencies[getattr(tool, "__name__", repr(tool))].append(time.perf_counter() - start)
+        return result
+
+
+async def _session(agent_cls, user_data_cls, number, existing_phones, specialties, rounds, timed, rng):
+    agent = agent_cls(user_data_cls(language="en"))
+    today = date.today()
+    for round_number in range(rounds):
+        phone = f"+91{8000000000 + number * 1000 + round_number}"
+        await timed(agent.identify_patient, f"Caller {number}", phone, f"caller{number}.{round_number}@example.com")
+        if rng.random() < 0.8:
+            await timed(agent.assess_injury, rng.choice(SYMPTOMS))
+        else:
+            await timed(agent.assess_mental_health, rng.choice(MENTAL_SYMPTOMS))
+        day = (today + timedelta(days=rng.randint(1, 30))).isoformat()
+        booked = await timed(agent.book_appointment, rng.choice(specialties), day, rng.choice(SLOT_TIMES),
+                             "Star Health", f"BENCH{number:06d}")
+        await timed(agent.view_appointments, rng.choice(existing_phones))
+        await timed(agent.check_insurance, rng.choice(existing_phones))
+        await timed(agent.submit_insurance_claim, phone, round(rng.uniform(500, 50000), 2))
+        if rng.random() < 0.3:
+            await timed(agent.get_medicine_info, rng.choice(MEDICINES))
+        match = re.search(r"#(\d+)", booked)
+        if match:
+            booking_id = int(match.group(1))
+            later = (today + timedelta(days=rng.randint(1, 30))).isoformat()
+            await timed(agent.update_appointment, booking_id, later, rng.choice(SLOT_TIMES))
+            await timed(agent.cancel_appointment, booking_id)
+
+
+async def _ticker(stop, stalls):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.01)
+        stalls.append(time.perf_counter() - start - 0.01)
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] * 1000
+
+
+async def _run_level(agent_cls, user_data_cls, sessions, args, existing_phones, specialties, offset):
+    latencies = defaultdict(list)
+    timed = _Timed(latencies)
+    stalls = []
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(_ticker(stop, stalls))
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        _session(agent_cls, user_data_cls, offset + i, existing_phones, specialties, args.rounds, timed,
+                 random.Random(offset + i))
+        for i in range(sessions)
+    ))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await ticker
+
+    total = sum(len(values) for values in latencies.values())
+    print(f"\nsessions={sessions}  calls={total}  throughput={total / elapsed:.0f} calls/s  "
+          f"max_loop_stall={max(stalls, default=0.0) * 1000:.1f}ms")
+    print(f"{'tool':<26}{'calls':>7}{'p50':>10}{'p95':>10}{'p99':>10}{'calls/s':>10}")
+    for tool, values in sorted(latencies.items()):
+        values.sort()
+        print(
+            f"{tool:<26}{len(values):>7}{statistics.median(values) * 1000:>8.2f}ms"
+            f"{_percentile(values, 0.95):>8.2f}ms{_percentile(values, 0.99):>8.2f}ms{len(values) / elapsed:>10.0f}"
+        )
+
+
+async def main(args):
+    # db.py and agent.py read their configuration at import time, so nothing
+    # from the backend is imported before this point.
+    os.environ["HOSPITAL_DB_PATH"] = args.db
+    os.environ["HOSPITAL_DB_POOL_SIZE"] = str(args.pool_size)
+    os.environ.setdefault("EMAIL_SENDER", "bench@example.com")
+    for var in ("LIVEKIT_URL", "LIVEKIT_API_KEY", "LIVEKIT_API_SECRET", "GROQ_API_KEY"):
+        os.environ.setdefault(var, "bench")
+    _build(args.db, args.patients, args.appointments, args.doctors_per_specialty, random.Random(12))
+    from agent import TriageAgent, UserData
+
+    class BenchAgent(TriageAgent):
+        """TriageAgent without models or a LiveKit session; tools see only the userdata."""
+
+        def __init__(self, userdata):
+            self.language = userdata.language
+            self._bench_session = SimpleNamespace(userdata=userdata)
+
+        @property
+        def session(self):
+            return self._bench_session
+
+    conn = sqlite3.connect(args.db)
+    existing_phones = [row[0] for row in conn.execute("SELECT phone FROM patients ORDER BY random() LIMIT 10000")]
+    specialties = [row[0] for row in conn.execute("SELECT DISTINCT specialty FROM doctors")]
+    conn.close()
+
+    # One unmeasured call loads the doctor directory and the scheduler's slot index.
+    await _session(BenchAgent, UserData, 0, existing_phones, specialties, 1, _Timed(defaultdict(list)), random.Random(0))
+    offset = 1
+    for sessions in args.sessions:
+        await _run_level(BenchAgent, UserData, sessions, args, existing_phones, specialties, offset)
+        offset += sessions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=os.path.join(tempfile.gettempdir(), "bench_hospital.db"),
+                        help="synthetic database, built if missing")
+    parser.add_argument("--patients", type=int, default=1_000_000)
+    parser.add_argument("--appointments", type=int, default=1_000_000)
+    parser.add_argument("--doctors-per-specialty", type=int, default=40)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 10, 50, 100])
+    parser.add_argument("--rounds", type=int, default=3, help="scripted calls per session")
+    parser.add_argument("--pool-size", type=int, default=4)
+    asyncio.run(main(parser.parse_args()))
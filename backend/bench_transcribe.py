@@ -0,0 +1,159 @@
+"""Voice note transcription benchmark: one Whisper upload against trimmed, parallel chunks.
+
+Builds long voice notes from synthetic speech (voiced syllables in phrases,
+with short and long pauses and background noise), encodes them as Ogg/Opus
+the way WhatsApp sends them and transcribes each one two ways: the whole
+note in one request, and media.py's path (decode, trim silence, split at
+pauses, cut the Opus packets into chunks, transcribe the chunks on a bounded
+pool and join them in order).
+
+Without GROQ_API_KEY the transcription service is simulated: a request takes
+``--overhead`` seconds plus ``--window-cost`` per 30 s Whisper window of the
+audio it carries. With ``--groq`` and GROQ_API_KEY set, the real API is used.
+Silero is trained on real speech and ignores the synthetic voice, so the
+synthetic notes are scored with the energy detector; pass ``--audio`` with real
+recordings to bench Silero:
+
+    python bench_transcribe.py [--minutes 1 3 5] [--audio a.ogg] [--detector silero] [--groq]
+"""
+import argparse
+import io
+import math
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import av
+import numpy as np
+
+import voice_activity
+from media import MediaPipeline, encode_opus
+from voice_activity import SpeechSplitter, VAD_SAMPLE_RATE
+
+WHISPER_MODEL = "whisper-large-v3-turbo"
+WHISPER_WINDOW_SECONDS = 30
+# First three formants of a few vowels, in Hz.
+VOWELS = [(730, 1090, 2440), (270, 2290, 3010), (530, 1840, 2480), (300, 870, 2240), (570, 840, 2410)]
+
+
+def _syllable(rng, seconds):
+    """A voiced syllable: harmonics of a wavering pitch, shaped by vowel formants, after a consonant burst."""
+    t = np.arange(int(seconds * VAD_SAMPLE_RATE)) / VAD_SAMPLE_RATE
+    pitch = rng.uniform(110, 210) * (1 + 0.08 * np.sin(2 * np.pi * rng.uniform(2, 5) * t))
+    phase = 2 * np.pi * np.cumsum(pitch) / VAD_SAMPLE_RATE
+    formants = VOWELS[rng.integers(len(VOWELS))]
+    signal = np.zeros(len(t))
+    for harmonic in range(1, 30):
+        frequency = harmonic * pitch.mean()
+        if frequency > VAD_SAMPLE_RATE / 2 - 500:
+            break
+        gain = sum(np.exp(-((frequency - formant) / 120) ** 2) / (rank + 1) for rank, formant in enumerate(formants))
+        signal += (gain + 0.02) * np.sin(harmonic * phase)
+    envelope = np.sin(np.pi * np.linspace(0, 1, len(t))) ** 0.7
+    burst = rng.normal(0, 0.15, len(t)) * (t < 0.04)
+    return signal / np.abs(signal).max() * envelope + burst
+
+
+def synthetic_note(seconds, seed):
+    """16 kHz PCM of phrases of 4-14 syllables, separated by short or long pauses."""
+    rng = np.random.default_rng(seed)
+    parts, length = [], 0
+    while length < seconds * VAD_SAMPLE_RATE:
+        for _ in range(rng.integers(4, 15)):
+            parts.append(_syllable(rng, rng.uniform(0.12, 0.3)))
+            parts.append(np.zeros(int(rng.uniform(0.01, 0.08) * VAD_SAMPLE_RATE)))
+        pause = rng.uniform(0.2, 0.5) if rng.random() < 0.5 else rng.uniform(0.8, 3.0)
+        parts.append(np.zeros(int(pause * VAD_SAMPLE_RATE)))
+        length = sum(len(part) for part in parts)
+    audio = np.concatenate(parts) * 0.3 + rng.normal(0, 0.003, length)
+    return (np.clip(audio, -1, 1) * 32767).astype(np.int16).tobytes()
+
+
+def _duration(data):
+    with av.open(io.BytesIO(data)) as container:
+        return container.duration / av.time_base
+
+
+def _simulated(overhead, window_cost):
+    def transcribe(chunk):
+        data, _ = chunk
+        seconds = _duration(data)
+        time.sleep(overhead + math.ceil(seconds / WHISPER_WINDOW_SECONDS) * window_cost)
+        return f"[{seconds:.1f}s]"
+    return transcribe
+
+
+def _groq():
+    from groq import Groq
+
+    client = Groq()
+
+    def transcribe(chunk):
+        data, filename = chunk
+        return client.audio.transcriptions.create(model=WHISPER_MODEL, file=(filename, data)).text.strip()
+    return transcribe
+
+
+def _measure(note, pipeline, pool, transcribe, repeat):
+    whole, chunked, first_chunk = [], [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        transcribe((note, "voice-note.ogg"))
+        whole.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        pending = []
+        for chunk in pipeline.prepare_audio(note, "audio/ogg"):
+            if not pending:
+                first_chunk.append(time.perf_counter() - start)
+            pending.append(pool.submit(transcribe, chunk))
+        " ".join(future.result() for future in pending)
+        chunked.append(time.perf_counter() - start)
+    return statistics.median(whole), statistics.median(chunked), statistics.median(first_chunk), len(pending)
+
+
+def main(args):
+    groq = args.groq and bool(os.getenv("GROQ_API_KEY"))
+    if args.groq and not groq:
+        print("GROQ_API_KEY not set, simulating the transcription service")
+    transcribe = _groq() if groq else _simulated(args.overhead, args.window_cost)
+
+    notes = []
+    for path in args.audio or []:
+        with open(path, "rb") as f:
+            notes.append((os.path.basename(path), f.read()))
+    if not args.audio:
+        for seed, minutes in enumerate(args.minutes):
+            notes.append((f"synthetic {minutes:g} min", encode_opus(synthetic_note(minutes * 60, seed), bitrate=24000)))
+    detector = args.detector or ("silero" if args.audio else "energy")
+
+    # The pipeline's splitter is swapped for one with the chosen detector.
+    splitter = SpeechSplitter(detector=detector)
+    voice_activity._splitter = splitter
+    pipeline = MediaPipeline()
+    pool = ThreadPoolExecutor(max_workers=args.workers)
+    print(f"detector={detector} chunk={voice_activity.CHUNK_SECONDS:g}s workers={args.workers} "
+          f"service={'groq' if groq else f'simulated {args.overhead}s + {args.window_cost}s/window'}\n")
+    print(f"{'note':<22}{'length':>8}{'size':>9}{'speech':>8}{'chunks':>8}{'1st chunk':>10}{'whole':>10}{'chunked':>10}{'speedup':>9}")
+    for name, note in notes:
+        seconds = _duration(note)
+        speech_before = splitter.speech_seconds
+        whole, chunked, first_chunk, chunks = _measure(note, pipeline, pool, transcribe, args.repeat)
+        speech = (splitter.speech_seconds - speech_before) / args.repeat
+        print(f"{name[:21]:<22}{seconds:>7.0f}s{len(note) / 1024:>7.0f}KB{speech / seconds:>8.0%}{chunks:>8}"
+              f"{first_chunk * 1000:>8.0f}ms{whole:>9.2f}s{chunked:>9.2f}s{whole / chunked:>8.1f}x")
+    pool.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", nargs="+", type=float, default=[0.5, 1, 3, 5], help="lengths of the synthetic notes")
+    parser.add_argument("--audio", nargs="+", help="voice notes to use instead of the synthetic set")
+    parser.add_argument("--detector", choices=sorted(voice_activity.SCORERS), help="VAD (default: energy for synthetic notes)")
+    parser.add_argument("--workers", type=int, default=4, help="chunks transcribed at once")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per note and method")
+    parser.add_argument("--groq", action="store_true", help="call the Groq API instead of simulating it")
+    parser.add_argument("--overhead", type=float, default=0.35, help="simulated seconds per request")
+    parser.add_argument("--window-cost", type=float, default=0.25, help="simulated seconds per 30 s of audio")
+    main(parser.parse_args())
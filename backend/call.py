@@ -1,24 +1,45 @@
 from flask import Flask, request, Response, send_from_directory, jsonify
 from twilio.twiml.messaging_response import MessagingResponse
 from twilio.twiml.voice_response import VoiceResponse
+from twilio.request_validator import RequestValidator
 from dotenv import load_dotenv
 from groq import Groq
 import os
 import logging
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import requests
-import base64
 from requests.auth import HTTPBasicAuth
-from google.cloud import texttospeech
-import json
+from symptoms import is_injury_text
+from whatsapp_queue import SenderQueue
+from http_client import get_http_client, HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT
+from media import get_media_pipeline
+from conversations import get_conversation_store
+from prompt_builder import get_prompt_builder, make_turn
+from response_cache import get_response_cache
+from transcripts import get_transcript_cache
+from voice_activity import TRANSCRIBE_WORKERS
+from stream_segments import SegmentSplitter
+from report_log import get_report_log
+from reply_audio import get_audio_cache
+from whatsapp_metrics import get_whatsapp_metrics
+from wound_detector import HINTED_MAX_TOKENS, fast_reply, get_wound_detector, prompt_note
 
 # Load environment variables
 load_dotenv()
 
 
 
-# Initialize clients
-groq_client = Groq(api_key=GROQ_API_KEY)
+# Initialize clients. The Groq SDK keeps its own connection pool; its calls run
+# under the shared client's guard so they get the same per-host cap and breaker.
+GROQ_HOST = "api.groq.com"
+GROQ_MAX_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", "2"))
+WHISPER_MODEL = "whisper-large-v3-turbo"
+# Cache lifetime of /audio responses; their names change whenever their content does
+AUDIO_MAX_AGE = 365 * 24 * 3600
+groq_client = Groq(api_key=GROQ_API_KEY, timeout=HTTP_READ_TIMEOUT + HTTP_CONNECT_TIMEOUT,
+                   max_retries=GROQ_MAX_RETRIES)
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -34,6 +55,18 @@ logging.basicConfig(
 
 ULTRAVOX_API_URL = 'https://api.ultravox.ai/api/calls'
 
+# Async webhook mode: acknowledge at once and reply over the REST API from a
+# worker pool. Point TWILIO_API_BASE at twilio_standin.py to test locally.
+WHATSAPP_ASYNC = os.getenv("WHATSAPP_ASYNC", "0").lower() in ("1", "true", "yes")
+WHATSAPP_WORKERS = int(os.getenv("WHATSAPP_WORKERS", "4"))
+WHATSAPP_QUEUE_DEPTH = int(os.getenv("WHATSAPP_QUEUE_DEPTH", "200"))
+WHATSAPP_VALIDATE_SIGNATURE = os.getenv("WHATSAPP_VALIDATE_SIGNATURE", "1").lower() not in ("0", "false", "no")
+TWILIO_API_BASE = os.getenv("TWILIO_API_BASE", "https://api.twilio.com").rstrip("/")
+QUEUE_FULL_MESSAGE = (
+    "We're receiving a lot of messages right now. Please try again in a few minutes, or contact "
+    "Symbiosis Hospital directly for urgent medical concerns."
+)
+
 # Load prompt templates
 prompt_file_path = os.path.join(os.path.dirname(__file__), "prompt1.md")
 with open(prompt_file_path, "r") as file:
@@ -43,6 +76,8 @@ with open(prompt_file_path, "r") as file:
 
 with open("prompt1.md", "r") as file:
     TEXT_PROMPT = file.read()
+# Part of every response cache key, so editing the prompt retires cached answers
+TEXT_PROMPT_VERSION = hashlib.sha256(TEXT_PROMPT.encode("utf-8")).hexdigest()[:12]
 
 
 with open("vision_prompt.md", "r") as file:
@@ -62,8 +97,12 @@ for directory in ['audio_files', 'injury_reports']:
     if not os.path.exists(directory):
         os.makedirs(directory)
 
-# Conversation state
-conversation_state = {}
+# Conversation state, kept per sender in the store selected by CONVERSATION_STORE
+conversations = get_conversation_store()
+HISTORY_TURNS = 5
+
+# Running totals, rolling windows and latency histograms for /injury-stats
+metrics = get_whatsapp_metrics()
 
 def create_ultravox_call(config):
     """Create Ultravox call and get join URL"""
@@ -71,66 +110,115 @@ def create_ultravox_call(config):
         'Content-Type': 'application/json',
         'X-API-Key': ULTRAVOX_API_KEY
     }
-    response = requests.post(ULTRAVOX_API_URL, json=config, headers=headers)
+    response = get_http_client().post(ULTRAVOX_API_URL, json=config, headers=headers)
     response.raise_for_status()
     return response.json()
 
 def fetch_twilio_media(media_url, return_base64=False):
-    """Fetch media from Twilio and return as raw bytes or Base64-encoded string."""
+    """Fetch media from Twilio as raw bytes, or for images a downscaled Base64 data URL."""
+    auth = HTTPBasicAuth(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
     try:
-        response = requests.get(
-            media_url,
-            auth=HTTPBasicAuth(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN),
-            timeout=15
-        )
-        response.raise_for_status()
         if return_base64:
-            content_type = response.headers.get('content-type', 'image/jpeg')
-            image_data = base64.b64encode(response.content).decode('utf-8')
-            return f"data:{content_type};base64,{image_data}"
-        else:
-            return response.content
+            return get_media_pipeline().fetch_image(media_url, auth=auth)
+        data, _ = get_media_pipeline().fetch(media_url, auth=auth)
+        return data
     except Exception as e:
         logger.error(f"Failed to fetch media: {str(e)}")
         return None
 
-def is_injury_related(image_description, user_message=""):
-    """Determine if an image or message is injury-related using AI"""
-    injury_keywords = [
-        'wound', 'cut', 'bruise', 'burn', 'scrape', 'scratch', 'injury', 'hurt', 'pain',
-        'bleeding', 'swollen', 'sprain', 'fracture', 'broken', 'dislocated', 'torn',
-        'rash', 'bite', 'sting', 'laceration', 'abrasion', 'contusion', 'trauma',
-        'accident', 'fall', 'hit', 'injured', 'medical', 'first aid', 'emergency'
-    ]
-    
-    text_to_check = f"{image_description} {user_message}".lower()
-    return any(keyword in text_to_check for keyword in injury_keywords)
+transcription_pool = ThreadPoolExecutor(max_workers=TRANSCRIBE_WORKERS, thread_name_prefix="transcribe")
+
+def transcribe_chunk(chunk):
+    data, filename = chunk
+    with get_http_client().guard(GROQ_HOST):
+        transcription = groq_client.audio.transcriptions.create(model=WHISPER_MODEL, file=(filename, data))
+    return transcription.text.strip()
 
-def analyze_injury_with_streaming(messages):
-    """Analyze injury using Groq streaming API"""
+def transcribe_voice_note(audio_data, content_type):
+    """Transcribe a voice note from memory: silences trimmed, long notes split at
+    pauses and the chunks transcribed in parallel, then joined in order."""
+    # Each chunk is sent off as soon as it is encoded, while later ones are still encoding
+    pending = [transcription_pool.submit(transcribe_chunk, chunk)
+               for chunk in get_media_pipeline().prepare_audio(audio_data, content_type)]
+    texts = [future.result() for future in pending]
+    return " ".join(text for text in texts if text)
+
+def is_injury_related(image_description, user_message=""):
+    """Determine if an image or message is injury-related using the shared symptom matcher"""
+    return is_injury_text(f"{image_description} {user_message}")
+
+def analyze_injury_with_streaming(messages, send=None, max_tokens=1024):
+    """Analyze injury using Groq streaming API.
+
+    With ``send``, every complete paragraph (or run of sentences) is passed to
+    it while the model is still generating. Returns ``(full text, text not yet
+    sent, timings)``, where timings holds the seconds to the first token and to
+    the first message.
+    """
+    splitter = SegmentSplitter()
+    unsent = []
+    timings = {'first_token': None, 'first_message': None, 'total': None, 'messages': 0}
+    started = time.perf_counter()
     try:
-        completion = groq_client.chat.completions.create(
-            model="meta-llama/llama-4-scout-17b-16e-instruct",
-            messages=messages,
-            temperature=0.3,
-            max_completion_tokens=1024,
-            top_p=0.8,
-            stream=True,
-            stop=None,
+        with get_http_client().guard(GROQ_HOST):
+            completion = groq_client.chat.completions.create(
+                model="meta-llama/llama-4-scout-17b-16e-instruct",
+                messages=messages,
+                temperature=0.3,
+                max_completion_tokens=max_tokens,
+                top_p=0.8,
+                stream=True,
+                stop=None,
+            )
+
+            for chunk in completion:
+                content = chunk.choices[0].delta.content
+                if not content:
+                    continue
+                if timings['first_token'] is None:
+                    timings['first_token'] = time.perf_counter() - started
+                for segment in splitter.feed(content):
+                    if send is None or unsent:
+                        unsent.append(segment)
+                        continue
+                    try:
+                        send(segment)
+                    except Exception as e:
+                        # Keep the rest for the final reply rather than lose part of the analysis
+                        logger.error(f"Sending part of the analysis failed: {str(e)}")
+                        unsent.append(segment)
+                        continue
+                    timings['messages'] += 1
+                    if timings['first_message'] is None:
+                        timings['first_message'] = time.perf_counter() - started
+
+        timings['total'] = time.perf_counter() - started
+        if timings['first_message'] is None:
+            # Nothing went out early: the final reply is the first message
+            timings['first_message'] = timings['total']
+        unsent.append(splitter.finish())
+        response_text = splitter.text.strip()
+        unsent_text = response_text if send is None else "\n\n".join(part for part in unsent if part)
+        logger.info(
+            f"Injury analysis: first token {timings['first_token'] or 0:.2f}s, "
+            f"first message {timings['first_message']:.2f}s, total {timings['total']:.2f}s, "
+            f"{timings['messages']} sent while streaming"
         )
-        
-        response_text = ""
-        for chunk in completion:
-            if chunk.choices[0].delta.content:
-                response_text += chunk.choices[0].delta.content
-        
-        return response_text.strip()
+        return response_text, unsent_text, timings
     except Exception as e:
         logger.error(f"Streaming analysis failed: {str(e)}")
-        return "Sorry, I couldn't analyze the image at this time. Please try again or consult a medical professional."
-
-def save_injury_report(sender_number, user_input, ai_response, image_data=None):
-    """Save injury consultation report"""
+        if not timings['messages']:
+            apology = "Sorry, I couldn't analyze the image at this time. Please try again or consult a medical professional."
+            return apology, apology, timings
+        # Part of the analysis has reached the patient already, so history and
+        # the injury report keep it and the remainder ends with the apology
+        apology = "Sorry, I couldn't finish the analysis. Please try again or consult a medical professional."
+        unsent.extend((splitter.finish(), apology))
+        response_text = f"{splitter.text.strip()}\n\n{apology}"
+        return response_text, "\n\n".join(part for part in unsent if part), timings
+
+def save_injury_report(sender_number, user_input, ai_response, image_data=None, timings=None, triage=None):
+    """Save injury consultation report to the report log"""
     try:
         report = {
             'timestamp': datetime.now().isoformat(),
@@ -139,72 +227,53 @@ def save_injury_report(sender_number, user_input, ai_response, image_data=None):
             'ai_response': ai_response,
             'has_image': image_data is not None
         }
-        
-        filename = f"injury_reports/report_{sender_number.replace(':', '_')}_{datetime.now().timestamp()}.json"
-        with open(filename, 'w') as f:
-            json.dump(report, f, indent=2)
-        
-        logger.info(f"Injury report saved: {filename}")
-        return filename
+        if timings:
+            report['timings_ms'] = {key: round(value * 1000) for key, value in timings.items()
+                                    if key != 'messages' and value is not None}
+            report['messages_streamed'] = timings.get('messages', 0)
+        if triage:
+            report['wound_detector'] = {
+                'verdict': triage.verdict,
+                'detections': [detection._asdict() for detection in triage.detections],
+            }
+
+        # Appended to the segmented report log; run `python report_log.py import`
+        # once to move reports saved as separate files by older versions
+        get_report_log().append(report)
+        logger.info(f"Injury report saved for {sender_number}")
+        return True
     except Exception as e:
         logger.error(f"Failed to save injury report: {str(e)}")
         return None
 
-def synthesize_text(text, language_code="en-US", voice_name="en-US-Wavenet-D", output_file="output.mp3"):
-    """Synthesize text to speech using Google Cloud TTS"""
+def synthesize_text(text, language_code="en-US", voice_name="en-US-Wavenet-D"):
+    """Return the file name of the spoken reply, synthesized only if it is not cached, or None"""
     try:
-        # Uncomment when Google Cloud TTS is properly configured
-        # input_text = texttospeech.SynthesisInput(text=text)
-        # voice = texttospeech.VoiceSelectionParams(
-        #     language_code=language_code,
-        #     name=voice_name
-        # )
-        # audio_config = texttospeech.AudioConfig(
-        #     audio_encoding=texttospeech.AudioEncoding.MP3
-        # )
-        # response = tts_client.synthesize_speech(
-        #     input=input_text,
-        #     voice=voice,
-        #     audio_config=audio_config
-        # )
-        # with open(os.path.join('audio_files', output_file), "wb") as out:
-        #     out.write(response.audio_content)
-        # logger.info(f"Audio content written to audio_files/{output_file}")
-        # return True
-        
-        # Placeholder for TTS functionality
-        logger.info("TTS functionality not configured")
-        return False
+        return get_audio_cache().get_or_synthesize(text, language_code, voice_name)
     except Exception as e:
         logger.error(f"TTS synthesis failed: {str(e)}")
-        return False
+        return None
 
-@app.route("/whatsapp", methods=['POST'])
-def whatsapp_reply():
-    """Handle incoming WhatsApp messages with enhanced injury analysis"""
+def handle_whatsapp_message(form, send=None):
+    """Work out the reply to one incoming WhatsApp message.
+
+    Returns ``(body, media_url)``; ``media_url`` is None for text-only replies.
+    ``send``, when given, delivers a text message to the sender straight away;
+    an injury analysis uses it to send each part as it is generated, and the
+    body returned is then only the remainder.
+    """
     try:
-        incoming_msg = request.form.get('Body', '').strip()
-        sender_number = request.form.get('From', '')
-        media_url = request.form.get('MediaUrl0')
-        media_content_type = request.form.get('MediaContentType0')
+        incoming_msg = form.get('Body', '').strip()
+        sender_number = form.get('From', '')
+        media_url = form.get('MediaUrl0')
+        media_content_type = form.get('MediaContentType0')
 
         logger.info(f"Incoming message from {sender_number}: {incoming_msg}, Media: {media_url}")
         
-        # Initialize conversation state
-        if sender_number not in conversation_state:
-            conversation_state[sender_number] = {
-                'history': [],
-                'last_interaction': datetime.now().isoformat(),
-                'language': 'en',
-                'injury_consultations': 0
-            }
-
         # Handle reset command
         if incoming_msg.lower() in ["start over", "reset", "new consultation"]:
-            conversation_state[sender_number]['history'] = []
-            resp = MessagingResponse()
-            resp.message("Conversation reset. Hello! I'm Tanya, your medical assistant at Symbiosis Hospital. I can help analyze injuries from images or answer medical questions. How can I assist you today?")
-            return Response(str(resp), mimetype="application/xml")
+            conversations.update(sender_number, lambda state: state.update(history=[]))
+            return "Conversation reset. Hello! I'm Tanya, your medical assistant at Symbiosis Hospital. I can help analyze injuries from images or answer medical questions. How can I assist you today?", None
 
         # Language handling
         language_map = {
@@ -212,11 +281,16 @@ def whatsapp_reply():
             "hi": ("hi-IN", "hi-IN-Wavenet-A"),
             "mr": ("mr-IN", "mr-IN-Wavenet-A")
         }
+        chosen_language = None
         for lang, (lang_code, voice_name) in language_map.items():
             if f"use {lang}" in incoming_msg.lower():
-                conversation_state[sender_number]['language'] = lang
+                chosen_language = lang
                 incoming_msg = incoming_msg.replace(f"use {lang}", "").strip()
                 logger.info(f"Language set to {lang} for {sender_number}")
+        if chosen_language:
+            state = conversations.update(sender_number, lambda state: state.update(language=chosen_language))
+        else:
+            state = conversations.get(sender_number)
 
         # Audio response handling
         audio_keywords = ["send as audio", "voice response", "audio reply"]
@@ -228,8 +302,12 @@ def whatsapp_reply():
         # Media processing
         has_image = media_url and media_content_type and media_content_type.startswith('image/')
         has_audio = media_url and media_content_type and media_content_type.startswith('audio/')
+        metrics.event('messages')
+        metrics.incr('messages_image' if has_image else 'messages_audio' if has_audio else
+                     'messages_other_media' if media_url else 'messages_text')
 
         # Process different media types
+        triage = None
         if has_image:
             base64_image = fetch_twilio_media(media_url, return_base64=True)
             if not base64_image:
@@ -242,33 +320,39 @@ def whatsapp_reply():
                     user_input_for_history = incoming_msg
                 else:
                     user_input_for_history = "Sent an image for analysis"
+                # The local wound detector runs first; what it finds goes into the prompt
+                triage = get_wound_detector().triage_data_url(base64_image)
+                if triage.verdict != "unavailable":
+                    metrics.observe('wound_detector', triage.seconds)
+                    logger.info(f"Wound detector: {triage.verdict} {[(d.label, d.confidence) for d in triage.detections]}")
+                note = prompt_note(triage)
+                if note:
+                    user_content.append({"type": "text", "text": note})
                 user_content.append({"type": "image_url", "image_url": {"url": base64_image}})
 
         elif has_audio:
             audio_data = fetch_twilio_media(media_url, return_base64=False)
             if audio_data:
-                audio_file_path = f"audio_files/temp_audio_{datetime.now().timestamp()}.wav"
-                with open(audio_file_path, "wb") as f:
-                    f.write(audio_data)
-                try:
-                    with open(audio_file_path, "rb") as audio_file:
-                        transcription = groq_client.audio.transcriptions.create(
-                            model="whisper-large-v3-turbo",
-                            file=audio_file
-                        )
-                    transcribed_text = transcription.text
+                transcripts = get_transcript_cache()
+                transcript_key = transcripts.key(audio_data, WHISPER_MODEL)
+                transcribed_text = transcripts.get(transcript_key)
+                if transcribed_text is not None:
+                    logger.info(f"Reused the transcript of a voice note from {sender_number}")
                     user_content = transcribed_text
                     user_input_for_history = transcribed_text
-                except Exception as e:
-                    logger.error(f"Transcription failed: {str(e)}")
-                    user_content = "Sorry, I couldn't transcribe the audio. Please try sending it again."
-                    user_input_for_history = "Sent an audio message (transcription failed)"
-                finally:
+                else:
                     try:
-                        if os.path.exists(audio_file_path):
-                            os.remove(audio_file_path)
-                    except PermissionError as e:
-                        logger.warning(f"Could not delete {audio_file_path}: {str(e)}")
+                        started = time.perf_counter()
+                        transcribed_text = transcribe_voice_note(audio_data, media_content_type)
+                        elapsed = time.perf_counter() - started
+                        metrics.observe('transcription', elapsed)
+                        transcripts.put(transcript_key, transcribed_text, elapsed)
+                        user_content = transcribed_text
+                        user_input_for_history = transcribed_text
+                    except Exception as e:
+                        logger.error(f"Transcription failed: {str(e)}")
+                        user_content = "Sorry, I couldn't transcribe the audio. Please try sending it again."
+                        user_input_for_history = "Sent an audio message (transcription failed)"
             else:
                 user_content = "Sorry, I couldn't access the audio. Please try sending it again."
                 user_input_for_history = "Sent an audio message (failed to access)"
@@ -286,97 +370,207 @@ def whatsapp_reply():
         # Select appropriate prompt
         if is_injury:
             system_prompt = VISION_PROMPT
-            conversation_state[sender_number]['injury_consultations'] += 1
-            logger.info(f"Injury consultation #{conversation_state[sender_number]['injury_consultations']} for {sender_number}")
+            consultations = conversations.update(
+                sender_number, lambda state: state.update(injury_consultations=state['injury_consultations'] + 1)
+            )['injury_consultations']
+            logger.info(f"Injury consultation #{consultations} for {sender_number}")
+            metrics.event('injury_consultations')
+            metrics.distinct('senders_with_injuries', sender_number)
         else:
             system_prompt = TEXT_PROMPT if not has_image else VISION_PROMPT
 
-        # Build messages for AI
-        messages = [{"role": "system", "content": system_prompt}]
-        
-        # Add conversation history
-        for turn in conversation_state[sender_number]['history']:
-            messages.append({"role": "user", "content": turn['user']})
-            messages.append({"role": "assistant", "content": str(turn['assistant'])})
-
-        # Add current message
-        messages.append({"role": "user", "content": user_content})
-
-        # Get AI response using streaming for injury analysis
-        if is_injury and has_image:
-            llm_response = analyze_injury_with_streaming(messages)
-            # Save injury report
-            save_injury_report(sender_number, user_input_for_history, llm_response, base64_image)
+        # Repeated questions that need neither an injury assessment nor the
+        # earlier conversation are answered from the response cache
+        response_cache = get_response_cache()
+        cacheable = not is_injury and not media_url
+        cached_response = None
+        if cacheable:
+            cached_response = response_cache.get(incoming_msg, state['language'], TEXT_PROMPT_VERSION,
+                                                 has_history=bool(state['history']))
+
+        # Photos the detector is sure show no wound get a templated reply, but only
+        # without a caption: a question ("dog bit me", "is this infected?") needs the
+        # vision model whatever the detector saw
+        prefilter_reply = None
+        if triage is not None and not incoming_msg:
+            prefilter_reply = fast_reply(triage.verdict, state['language'])
+
+        reply_text = None
+        if cached_response is not None:
+            llm_response = cached_response
+            logger.info(f"Answered {sender_number} from the response cache")
+            metrics.incr('cached_replies')
+        elif prefilter_reply is not None:
+            llm_response = prefilter_reply
+            logger.info(f"Answered {sender_number}'s photo without the vision model ({triage.verdict})")
+            metrics.incr('vision_calls_avoided')
+            save_injury_report(sender_number, user_input_for_history, llm_response, base64_image, triage=triage)
         else:
-            # Regular chat completion
-            chat_completion = groq_client.chat.completions.create(
-                messages=messages,
-                model="meta-llama/llama-4-scout-17b-16e-instruct",
-                temperature=0.7,
-                max_tokens=500
-            )
-            llm_response = chat_completion.choices[0].message.content.strip()
+            # Build messages for AI: system prompt, as much history as the token
+            # budget allows (older turns compacted), and the current message
+            messages, prompt_tokens = get_prompt_builder().build(system_prompt, state['history'], user_content)
+            logger.info(f"Prompt for {sender_number}: ~{prompt_tokens} tokens")
+
+            # Get AI response using streaming for injury analysis
+            if is_injury and has_image:
+                # An audio reply is synthesized from the whole text, so it is not streamed
+                llm_response, reply_text, timings = analyze_injury_with_streaming(
+                    messages, send=None if request_audio else send,
+                    max_tokens=HINTED_MAX_TOKENS if triage is not None and triage.verdict == "wound" else 1024
+                )
+                metrics.incr('llm_calls')
+                metrics.incr('vision_calls')
+                metrics.observe('llm_vision', timings['total'])
+                metrics.observe('vision_first_token', timings['first_token'])
+                metrics.observe('vision_first_message', timings['first_message'])
+                # Save injury report
+                save_injury_report(sender_number, user_input_for_history, llm_response, base64_image, timings, triage)
+            else:
+                # Regular chat completion
+                started = time.perf_counter()
+                with get_http_client().guard(GROQ_HOST):
+                    chat_completion = groq_client.chat.completions.create(
+                        messages=messages,
+                        model="meta-llama/llama-4-scout-17b-16e-instruct",
+                        temperature=0.7,
+                        max_tokens=500
+                    )
+                llm_response = chat_completion.choices[0].message.content.strip()
+                metrics.observe('llm_chat', time.perf_counter() - started)
+                metrics.incr('llm_calls')
+                # Only answers given without history are reusable for other senders
+                if cacheable and not state['history']:
+                    response_cache.put(incoming_msg, state['language'], TEXT_PROMPT_VERSION, llm_response,
+                                       time.perf_counter() - started)
 
         logger.info(f"LLM Response: {llm_response}")
 
-        # Update conversation history
-        conversation_state[sender_number]['history'].append({
-            'user': user_input_for_history,
-            'assistant': llm_response
-        })
-        
-        # Keep only last 5 exchanges
-        if len(conversation_state[sender_number]['history']) > 5:
-            conversation_state[sender_number]['history'] = conversation_state[sender_number]['history'][-5:]
-        
-        conversation_state[sender_number]['last_interaction'] = datetime.now().isoformat()
+        # Update conversation history, keeping only the last 5 exchanges. The
+        # append runs against the stored history, not the copy read above, so a
+        # turn finished meanwhile by another worker is kept.
+        turn = make_turn(user_input_for_history, llm_response)
+        state = conversations.update(
+            sender_number, lambda state: state.update(history=(state['history'] + [turn])[-HISTORY_TURNS:])
+        )
 
         # Prepare response
-        resp = MessagingResponse()
-        
         if request_audio:
             # Generate audio response
-            audio_filename = f"response_{sender_number.replace(':', '_')}_{datetime.now().timestamp()}.mp3"
-            lang = conversation_state[sender_number]['language']
+            lang = state['language']
             lang_code, voice_name = language_map.get(lang, ("en-US", "en-US-Wavenet-D"))
             
-            success = synthesize_text(
+            audio_filename = synthesize_text(
                 text=llm_response,
                 language_code=lang_code,
-                voice_name=voice_name,
-                output_file=audio_filename
+                voice_name=voice_name
             )
             
-            if success:
+            if audio_filename:
                 base_url = os.getenv("BASE_URL", "http://localhost:5000")
                 audio_url = f"{base_url}/audio/{audio_filename}"
-                msg = resp.message()
-                msg.body("Here is your audio response:")
-                msg.media(audio_url)
                 logger.info(f"Audio response generated: {audio_url}")
-            else:
-                resp.message("Sorry, I couldn't generate the audio response. Here's the text instead:\n" + llm_response)
-        else:
-            # Add injury consultation disclaimer if applicable
-            if is_injury:
-                disclaimer = "\n\n⚠️ IMPORTANT: This is an AI assessment, not a medical diagnosis. Please consult a healthcare professional for proper medical evaluation."
-                resp.message(llm_response + disclaimer)
-            else:
-                resp.message(llm_response)
+                return "Here is your audio response:", audio_url
+            return "Sorry, I couldn't generate the audio response. Here's the text instead:\n" + llm_response, None
 
-        logger.info(f"Sending TwiML: {str(resp)}")
-        return Response(str(resp), mimetype="application/xml")
+        # Add injury consultation disclaimer if applicable
+        if is_injury:
+            disclaimer = "\n\n⚠️ IMPORTANT: This is an AI assessment, not a medical diagnosis. Please consult a healthcare professional for proper medical evaluation."
+            return ((reply_text if reply_text is not None else llm_response) + disclaimer).strip(), None
+        return llm_response, None
 
     except Exception as e:
         logger.error(f"Error processing request: {str(e)}", exc_info=True)
-        resp = MessagingResponse()
-        resp.message("Sorry, I encountered an issue processing your request. Please try again or contact Symbiosis Hospital directly for urgent medical concerns.")
-        return Response(str(resp), mimetype="application/xml")
+        return "Sorry, I encountered an issue processing your request. Please try again or contact Symbiosis Hospital directly for urgent medical concerns.", None
+
+
+def twiml_reply(body=None, media_url=None):
+    """Wrap a reply in TwiML; with no body Twilio sends nothing back."""
+    resp = MessagingResponse()
+    if body and media_url:
+        msg = resp.message()
+        msg.body(body)
+        msg.media(media_url)
+    elif body:
+        resp.message(body)
+    return Response(str(resp), mimetype="application/xml")
+
+
+def send_whatsapp_message(to, from_, body, media_url=None):
+    """Send a message through the Twilio REST API (or the stand-in at TWILIO_API_BASE)."""
+    data = {'To': to, 'From': from_, 'Body': body}
+    if media_url:
+        data['MediaUrl'] = media_url
+    response = get_http_client().post(
+        f"{TWILIO_API_BASE}/2010-04-01/Accounts/{TWILIO_ACCOUNT_SID}/Messages.json",
+        data=data,
+        auth=HTTPBasicAuth(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+    )
+    response.raise_for_status()
+    return response.json().get('sid')
+
+
+def rest_sender(form):
+    """A ``send`` for handle_whatsapp_message that replies to the form's sender over REST."""
+    sender_number, to_number = form.get('From', ''), form.get('To', '')
+    if not sender_number or not to_number:
+        return None
+    return lambda text: send_whatsapp_message(sender_number, to_number, text)
+
+
+def process_queued_message(sender_number, form):
+    """Worker side of the async webhook: build the reply and send it over REST."""
+    body, media_url = handle_whatsapp_message(form, send=rest_sender(form))
+    sid = send_whatsapp_message(sender_number, form.get('To', ''), body, media_url)
+    logger.info(f"Sent reply {sid} to {sender_number}")
+
+
+whatsapp_queue = SenderQueue(process_queued_message, workers=WHATSAPP_WORKERS, max_depth=WHATSAPP_QUEUE_DEPTH)
+
+
+def is_valid_twilio_request():
+    """Check the X-Twilio-Signature header when validation is enabled."""
+    if not WHATSAPP_VALIDATE_SIGNATURE:
+        return True
+    url = os.getenv("WHATSAPP_WEBHOOK_URL") or request.url
+    signature = request.headers.get('X-Twilio-Signature', '')
+    return RequestValidator(TWILIO_AUTH_TOKEN).validate(url, request.form.to_dict(), signature)
+
+
+@app.route("/whatsapp", methods=['POST'])
+def whatsapp_reply():
+    """Handle incoming WhatsApp messages with enhanced injury analysis"""
+    if not WHATSAPP_ASYNC:
+        # Parts of an analysis go out over REST while it streams; the TwiML carries the rest
+        body, media_url = handle_whatsapp_message(request.form, send=rest_sender(request.form))
+        resp = twiml_reply(body, media_url)
+        logger.info(f"Sending TwiML: {resp.get_data(as_text=True)}")
+        return resp
+
+    if not is_valid_twilio_request():
+        logger.warning(f"Rejected WhatsApp webhook with a bad signature from {request.remote_addr}")
+        return Response("Invalid signature", status=403)
+    sender_number = request.form.get('From', '')
+    if not sender_number:
+        return Response("Missing sender", status=400)
+
+    whatsapp_queue.start()
+    if not whatsapp_queue.submit(sender_number, request.form.to_dict()):
+        logger.warning(f"WhatsApp queue full, turning away message from {sender_number}")
+        return twiml_reply(QUEUE_FULL_MESSAGE)
+    # Empty TwiML acknowledges the webhook; the reply follows over the REST API.
+    return twiml_reply()
 
 @app.route('/audio/<filename>')
 def serve_audio(filename):
-    """Serve audio files from the audio_files directory"""
-    return send_from_directory('audio_files', filename)
+    """Serve cached reply audio. File names are content hashes and a file never
+    changes, so the hash is its ETag, it may be cached for good, and Twilio's
+    conditional and Range refetches get 304 and 206 answers."""
+    audio_cache = get_audio_cache()
+    response = send_from_directory(audio_cache.directory, filename, conditional=True,
+                                   etag=os.path.splitext(filename)[0], max_age=AUDIO_MAX_AGE)
+    response.cache_control.immutable = True
+    audio_cache.touch(filename)
+    return response
 
 @app.route("/incoming", methods=['POST'])
 def handle_incoming_call():
@@ -408,19 +602,32 @@ def handle_incoming_call():
 
 @app.route("/injury-stats", methods=['GET'])
 def injury_stats():
-    """Get injury consultation statistics"""
+    """Get injury consultation statistics from the running aggregates"""
     try:
-        total_consultations = 0
-        active_users = 0
-        
-        for user_id, state in conversation_state.items():
-            if state.get('injury_consultations', 0) > 0:
-                total_consultations += state['injury_consultations']
-                active_users += 1
-        
+        snapshot = metrics.snapshot()
+        counters = snapshot['counters']
+        vision_calls = counters.get('vision_calls', 0)
+        detector_replies = counters.get('vision_calls_avoided', 0)
+        cached_replies = counters.get('cached_replies', 0)
+        avoided = detector_replies + cached_replies
+        llm_requests = avoided + counters.get('llm_calls', 0)
+
         return jsonify({
-            'total_injury_consultations': total_consultations,
-            'active_users_with_injuries': active_users,
+            'total_injury_consultations': counters.get('injury_consultations', 0),
+            # Distinct senders ever, however often their chat state was evicted or swept
+            'unique_senders_with_injuries': counters.get('senders_with_injuries', 0),
+            'counters': counters,
+            'windows': snapshot['windows'],
+            'latency': snapshot['latency'],
+            'llm_calls_avoided': {
+                'by_wound_detector': detector_replies,
+                'by_response_cache': cached_replies,
+                'share': round(avoided / llm_requests, 3) if llm_requests else 0.0,
+                'image_share': round(detector_replies / (detector_replies + vision_calls), 3)
+                if detector_replies + vision_calls else 0.0,
+            },
+            'wound_detector': get_wound_detector().stats(),
+            'response_cache': get_response_cache().stats(),
             'timestamp': datetime.now().isoformat()
         })
     except Exception as e:
@@ -433,7 +640,15 @@ def health_check():
     return {
         "status": "healthy", 
         "timestamp": datetime.now().isoformat(),
-        "features": ["injury_analysis", "streaming_ai", "multi_language", "audio_support"]
+        "features": ["injury_analysis", "streaming_ai", "multi_language", "audio_support"],
+        "whatsapp_queue": whatsapp_queue.stats() if WHATSAPP_ASYNC else None,
+        "outbound_http": get_http_client().stats(),
+        "media": get_media_pipeline().stats(),
+        "transcripts": get_transcript_cache().stats(),
+        "reply_audio": get_audio_cache().stats(),
+        "conversations": conversations.stats(),
+        "prompts": get_prompt_builder().stats(),
+        "report_log": get_report_log().stats()
     }, 200
 
 if __name__ == "__main__":
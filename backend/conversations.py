@@ -0,0 +1,215 @@
+import copy
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# "sqlite" keeps chats across restarts and shares them between gunicorn or
+# waitress workers; "memory" is per process.
+CONVERSATION_STORE = os.getenv("CONVERSATION_STORE", "sqlite").lower()
+CONVERSATION_DB_PATH = os.getenv("CONVERSATION_DB_PATH", "conversations.db")
+# A chat idle for this long starts over.
+CONVERSATION_TTL = float(os.getenv("CONVERSATION_TTL", str(24 * 3600)))
+CONVERSATION_MAX_ENTRIES = int(os.getenv("CONVERSATION_MAX_ENTRIES", "10000"))
+# Ceiling on the serialized size of all chats held by the memory store.
+CONVERSATION_MAX_BYTES = int(os.getenv("CONVERSATION_MAX_BYTES", str(64 * 1024 * 1024)))
+# The SQLite store sweeps expired and excess chats once per this many writes.
+CONVERSATION_SWEEP_EVERY = 200
+
+Updater = Callable[[dict], None]
+
+
+def new_conversation() -> dict:
+    return {"history": [], "language": "en", "injury_consultations": 0, "last_interaction": None}
+
+
+class ConversationStore(ABC):
+    """Per-sender WhatsApp chat state: history, language and injury consultation count.
+
+    ``update`` is the only way to change a chat. It hands the updater a copy
+    of the current state (a fresh one for a new or expired sender), saves the
+    result and returns it, as one atomic step per sender, so concurrent
+    messages from the same number never overwrite each other's changes.
+    """
+
+    @abstractmethod
+    def get(self, sender: str) -> dict:
+        ...
+
+    @abstractmethod
+    def update(self, sender: str, updater: Updater) -> dict:
+        ...
+
+    @abstractmethod
+    def stats(self) -> dict:
+        ...
+
+
+def _apply(state: dict, updater: Updater) -> Tuple[dict, str]:
+    updater(state)
+    state["last_interaction"] = time.time()
+    return state, json.dumps(state, separators=(",", ":"))
+
+
+class MemoryConversationStore(ConversationStore):
+    """LRU of chats in this process, bounded by count, idle time and serialized size."""
+
+    def __init__(self, ttl: float = CONVERSATION_TTL, max_entries: int = CONVERSATION_MAX_ENTRIES,
+                 max_bytes: int = CONVERSATION_MAX_BYTES) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # sender -> (state, serialized size), least recently touched first.
+        self._chats: "OrderedDict[str, Tuple[dict, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.expired = 0
+        self.evicted = 0
+
+    def _drop(self, sender: str) -> None:
+        _, size = self._chats.pop(sender)
+        self._bytes -= size
+
+    def _expire(self, now: float) -> None:
+        # Touching a chat moves it to the end, so expired chats are all at the front.
+        while self._chats:
+            sender, (state, _) = next(iter(self._chats.items()))
+            if now - state["last_interaction"] < self.ttl:
+                break
+            self._drop(sender)
+            self.expired += 1
+
+    def get(self, sender: str) -> dict:
+        with self._lock:
+            self._expire(time.time())
+            entry = self._chats.get(sender)
+            return copy.deepcopy(entry[0]) if entry else new_conversation()
+
+    def update(self, sender: str, updater: Updater) -> dict:
+        with self._lock:
+            self._expire(time.time())
+            entry = self._chats.get(sender)
+            state, encoded = _apply(copy.deepcopy(entry[0]) if entry else new_conversation(), updater)
+            if entry:
+                self._drop(sender)
+            self._chats[sender] = (state, len(encoded))
+            self._bytes += len(encoded)
+            while len(self._chats) > 1 and (len(self._chats) > self.max_entries or self._bytes > self.max_bytes):
+                self._drop(next(iter(self._chats)))
+                self.evicted += 1
+            return copy.deepcopy(state)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"backend": "memory", "conversations": len(self._chats), "bytes": self._bytes,
+                    "max_bytes": self.max_bytes, "expired": self.expired, "evicted": self.evicted}
+
+
+class SQLiteConversationStore(ConversationStore):
+    """Chats in a WAL-mode SQLite file that every worker process opens.
+
+    An update runs inside ``BEGIN IMMEDIATE``, which takes the database write
+    lock before reading, so read-modify-write of one chat is atomic across
+    threads and processes. Chats idle past the TTL read as new and are deleted,
+    together with the least recently used chats beyond ``max_entries``, by a
+    sweep every ``CONVERSATION_SWEEP_EVERY`` writes.
+    """
+
+    def __init__(self, path: str = CONVERSATION_DB_PATH, ttl: float = CONVERSATION_TTL,
+                 max_entries: int = CONVERSATION_MAX_ENTRIES) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        self.swept = 0
+        conn = self._connection()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS conversations (
+                sender TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            ) WITHOUT ROWID
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_conversations_updated ON conversations(updated_at)")
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread; sqlite3 connections are not shared across threads.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _load(self, conn: sqlite3.Connection, sender: str, now: float) -> dict:
+        row = conn.execute(
+            "SELECT state FROM conversations WHERE sender = ? AND updated_at > ?", (sender, now - self.ttl)
+        ).fetchone()
+        return json.loads(row[0]) if row else new_conversation()
+
+    def get(self, sender: str) -> dict:
+        return self._load(self._connection(), sender, time.time())
+
+    def update(self, sender: str, updater: Updater) -> dict:
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            state, encoded = _apply(self._load(conn, sender, now), updater)
+            conn.execute(
+                "INSERT INTO conversations (sender, state, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(sender) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+                (sender, encoded, now)
+            )
+            self._writes += 1
+            if self._writes % CONVERSATION_SWEEP_EVERY == 0:
+                self._sweep(conn, now)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return state
+
+    def _sweep(self, conn: sqlite3.Connection, now: float) -> None:
+        removed = conn.execute("DELETE FROM conversations WHERE updated_at <= ?", (now - self.ttl,)).rowcount
+        excess = conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0] - self.max_entries
+        if excess > 0:
+            removed += conn.execute(
+                "DELETE FROM conversations WHERE sender IN "
+                "(SELECT sender FROM conversations ORDER BY updated_at LIMIT ?)", (excess,)
+            ).rowcount
+        self.swept += removed
+
+    def stats(self) -> dict:
+        count = self._connection().execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+        return {"backend": "sqlite", "path": self.path, "conversations": count, "swept": self.swept}
+
+
+STORES: Dict[str, Callable[[], ConversationStore]] = {
+    "memory": MemoryConversationStore,
+    "sqlite": SQLiteConversationStore,
+}
+
+_store: Optional[ConversationStore] = None
+_store_lock = threading.Lock()
+
+
+def get_conversation_store() -> ConversationStore:
+    """Return the store selected by ``CONVERSATION_STORE``."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if CONVERSATION_STORE not in STORES:
+                    raise ValueError(f"Unknown CONVERSATION_STORE {CONVERSATION_STORE!r}; use one of {sorted(STORES)}")
+                _store = STORES[CONVERSATION_STORE]()
+    return _store
@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+logger = logging.getLogger("nurse-assistant")
+
+DB_PATH = os.getenv("HOSPITAL_DB_PATH", "hospital.db")
+DB_POOL_SIZE = int(os.getenv("HOSPITAL_DB_POOL_SIZE", "4"))
+DB_STATEMENT_CACHE_SIZE = 256
+
+
+class Database:
+    """Bounded pool of SQLite connections used by the agent tools.
+
+    Every connection runs in WAL mode so readers never wait on the writer, and
+    keeps its own prepared statement cache (``cached_statements``) so the fixed
+    set of tool queries is only compiled once per connection. Queries are run on
+    a dedicated thread pool sized to the connection pool, which keeps blocking
+    SQLite calls off the asyncio event loop.
+    """
+
+    def __init__(self, path: str = DB_PATH, pool_size: int = DB_POOL_SIZE) -> None:
+        self.path = path
+        self.pool_size = pool_size
+        self._pool: "queue.Queue[sqlite3.Connection]" = queue.Queue(maxsize=pool_size)
+        self._created = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="hospital-db")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            timeout=30,
+            check_same_thread=False,
+            cached_statements=DB_STATEMENT_CACHE_SIZE,
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.pool_size:
+                self._created += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self._created -= 1
+                    raise
+        return self._pool.get()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a pooled connection; commit on success, roll back on error."""
+        conn = self._acquire()
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            self._pool.put(conn)
+
+    def _call(self, fn, args):
+        with self.connection() as conn:
+            return fn(conn, *args)
+
+    async def run(self, fn, *args):
+        """Run ``fn(conn, *args)`` in one transaction on the database executor."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._call, fn, args)
+
+    async def fetchone(self, sql: str, params=()):
+        return await self.run(lambda conn: conn.execute(sql, params).fetchone())
+
+    async def fetchall(self, sql: str, params=()):
+        return await self.run(lambda conn: conn.execute(sql, params).fetchall())
+
+    async def execute(self, sql: str, params=()) -> sqlite3.Cursor:
+        """Execute a write statement; the returned cursor exposes lastrowid and rowcount."""
+        return await self.run(lambda conn: conn.execute(sql, params))
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+        self._created = 0
+
+
+_database: "Database | None" = None
+_database_lock = threading.Lock()
+
+
+def get_database() -> Database:
+    """Return the process-wide database shared by every session in the worker."""
+    global _database
+    if _database is None:
+        with _database_lock:
+            if _database is None:
+                _database = Database()
+    return _database
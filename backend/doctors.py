@@ -0,0 +1,89 @@
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from db import Database, get_database
+
+logger = logging.getLogger("nurse-assistant")
+
+DOCTOR_CACHE_TTL = float(os.getenv("DOCTOR_CACHE_TTL", "300"))
+
+Doctor = Tuple[int, str]
+
+
+class DoctorDirectory:
+    """Specialty to doctors map loaded once per worker process.
+
+    Lookups are served from memory. Once the TTL has passed the next lookup
+    reads the ``roster_version`` counter (maintained by triggers on ``doctors``)
+    and only reloads the roster if it moved. Writers in this process call
+    ``invalidate()`` so their own changes are visible immediately.
+    """
+
+    def __init__(self, db: Optional[Database] = None, ttl: float = DOCTOR_CACHE_TTL) -> None:
+        self._db = db
+        self.ttl = ttl
+        self._by_specialty: Dict[str, List[Doctor]] = {}
+        self._version: Optional[int] = None
+        self._checked_at = float("-inf")
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    @property
+    def db(self) -> Database:
+        return self._db or get_database()
+
+    @staticmethod
+    def _load(conn, known_version):
+        version = conn.execute("SELECT version FROM roster_version WHERE id = 1").fetchone()[0]
+        if version == known_version:
+            return version, None
+        by_specialty: Dict[str, List[Doctor]] = {}
+        for doctor_id, name, specialty in conn.execute("SELECT id, name, specialty FROM doctors ORDER BY id"):
+            by_specialty.setdefault(specialty, []).append((doctor_id, name))
+        return version, by_specialty
+
+    async def _refresh(self) -> None:
+        version, by_specialty = await self.db.run(self._load, self._version)
+        if by_specialty is not None:
+            self._by_specialty = by_specialty
+            self.reloads += 1
+            logger.info(f"Doctor directory loaded at roster version {version}")
+        self._version = version
+        self._checked_at = time.monotonic()
+
+    async def get(self, specialty: str) -> List[Doctor]:
+        """Return ``(id, name)`` pairs for a specialty, in roster order."""
+        if self._version is None or time.monotonic() - self._checked_at >= self.ttl:
+            self.misses += 1
+            await self._refresh()
+        else:
+            self.hits += 1
+        return self._by_specialty.get(specialty, [])
+
+    def invalidate(self) -> None:
+        """Force a roster version check on the next lookup."""
+        self._checked_at = float("-inf")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "roster_version": self._version,
+        }
+
+
+_directory: Optional[DoctorDirectory] = None
+
+
+def get_doctor_directory() -> DoctorDirectory:
+    """Return the directory shared by every session in the worker."""
+    global _directory
+    if _directory is None:
+        _directory = DoctorDirectory()
+    return _directory
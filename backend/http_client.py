@@ -0,0 +1,305 @@
+import logging
+import os
+import random
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+logger = logging.getLogger(__name__)
+
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.05"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "20"))
+# Idle keep-alive connections kept per host, and requests allowed in flight per host.
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+HTTP_MAX_PER_HOST = int(os.getenv("HTTP_MAX_PER_HOST", "16"))
+# How long a request waits for a free slot on a busy host before giving up.
+HTTP_QUEUE_TIMEOUT = float(os.getenv("HTTP_QUEUE_TIMEOUT", "5"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "2"))
+HTTP_BACKOFF_BASE = 0.25
+HTTP_BACKOFF_MAX = 4.0
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("HTTP_BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("HTTP_BREAKER_RESET", "30"))
+
+# Statuses worth another attempt. 429 and 503 mean the request was not acted
+# on, so they are retried for POST too; the rest only for idempotent methods.
+RETRY_ANY_METHOD = {429, 503}
+RETRY_IDEMPOTENT = {500, 502, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """The host failed repeatedly and is not being called until it cools down."""
+
+
+class HostBusyError(requests.exceptions.ConnectionError):
+    """Every request slot for the host stayed taken for ``HTTP_QUEUE_TIMEOUT``."""
+
+
+def _is_outage(exc: BaseException) -> bool:
+    """Whether an error says the provider is unhealthy rather than our request being wrong."""
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    if status is not None:
+        return status >= 500 or status == 429
+    return True
+
+
+def _never_sent(exc: requests.RequestException) -> bool:
+    if isinstance(exc, requests.ConnectTimeout):
+        return True
+    reason = getattr(exc.args[0], "reason", None) if exc.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed, then open for a cool-down, then one probe."""
+
+    def __init__(self, host: str, threshold: int = BREAKER_FAILURE_THRESHOLD, reset_after: float = BREAKER_RESET_SECONDS) -> None:
+        self.host = host
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.reset_after else "open"
+
+    def before_request(self) -> bool:
+        """Raise while open; return True if this call is the half-open probe."""
+        with self._lock:
+            if self.opened_at is None:
+                return False
+            if time.monotonic() - self.opened_at < self.reset_after or self._probing:
+                raise CircuitOpenError(f"Circuit open for {self.host} after {self.failures} failures")
+            # Let a single request through to find out whether the host is back.
+            self._probing = True
+            return True
+
+    def cancel_probe(self) -> None:
+        """The probe never reached the host; the next call probes instead."""
+        with self._lock:
+            self._probing = False
+
+    def fail_unresolved_probe(self) -> None:
+        """Count the probe as failed if it ended without a success or failure being recorded."""
+        with self._lock:
+            unresolved = self._probing
+        if unresolved:
+            self.record_failure()
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info(f"Circuit for {self.host} closed again")
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._probing or (self.opened_at is None and self.failures >= self.threshold):
+                logger.warning(f"Circuit for {self.host} opened after {self.failures} consecutive failures")
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+
+class _Host:
+    def __init__(self, host: str, max_in_flight: int) -> None:
+        self.breaker = CircuitBreaker(host)
+        self.slots = threading.BoundedSemaphore(max_in_flight)
+        self.in_flight = 0
+        self.requests = 0
+        self.retries = 0
+        self.rejected = 0
+
+
+class _Slot:
+    """One taken slot of a host's concurrency cap, given back when ``_slot`` exits
+    unless it was handed to a streamed response first."""
+
+    def __init__(self, state: _Host) -> None:
+        self.state = state
+        self.handed_off = False
+
+    def release(self) -> None:
+        self.state.in_flight -= 1
+        self.state.slots.release()
+
+    def hand_off(self, response: requests.Response) -> None:
+        """Keep the slot until ``response`` is closed (or collected, if nobody closes it)."""
+        self.handed_off = True
+        release = weakref.finalize(response, self.release)
+        close = response.close
+
+        def close_and_release():
+            try:
+                close()
+            finally:
+                release()
+
+        response.close = close_and_release
+
+
+class HttpClient:
+    """Outbound HTTP for the backend: one keep-alive pool per host, timeouts on
+    every call, jittered retries, a cap on concurrent requests per host and a
+    circuit breaker per host.
+
+    ``request`` covers calls made with requests. SDK clients with their own
+    transport (Groq) run inside ``guard(host)`` so the same concurrency cap and
+    breaker apply to them. A ``stream=True`` response holds its slot until it
+    is closed, so open it in a ``with`` block.
+    """
+
+    def __init__(self, pool_size: int = HTTP_POOL_SIZE, max_per_host: int = HTTP_MAX_PER_HOST,
+                 retries: int = HTTP_RETRIES) -> None:
+        self.max_per_host = max_per_host
+        self.retries = retries
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        self._hosts: Dict[str, _Host] = {}
+        self._lock = threading.Lock()
+
+    def _host(self, host: str) -> _Host:
+        state = self._hosts.get(host)
+        if state is None:
+            with self._lock:
+                state = self._hosts.setdefault(host, _Host(host, self.max_per_host))
+        return state
+
+    @contextmanager
+    def _slot(self, host: str):
+        state = self._host(host)
+        probe = state.breaker.before_request()
+        if not state.slots.acquire(timeout=HTTP_QUEUE_TIMEOUT):
+            if probe:
+                state.breaker.cancel_probe()
+            state.rejected += 1
+            raise HostBusyError(f"No free connection slot for {host} within {HTTP_QUEUE_TIMEOUT}s")
+        state.in_flight += 1
+        state.requests += 1
+        slot = _Slot(state)
+        try:
+            yield slot
+        except BaseException:
+            # Otherwise an error nobody recorded would leave the circuit half-open for good.
+            if probe:
+                state.breaker.fail_unresolved_probe()
+            raise
+        finally:
+            if not slot.handed_off:
+                slot.release()
+
+    @contextmanager
+    def guard(self, host: str):
+        """Apply the host's concurrency cap and circuit breaker to a call made by another client."""
+        with self._slot(host) as slot:
+            state = slot.state
+            try:
+                yield
+            except Exception as e:
+                if _is_outage(e):
+                    state.breaker.record_failure()
+                else:
+                    state.breaker.record_success()
+                raise
+            state.breaker.record_success()
+
+    @staticmethod
+    def _backoff(attempt: int, response: Optional[requests.Response] = None) -> float:
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), HTTP_BACKOFF_MAX)
+        return min(HTTP_BACKOFF_BASE * 2 ** attempt, HTTP_BACKOFF_MAX) * random.uniform(0.5, 1.5)
+
+    def request(self, method: str, url: str, retries: Optional[int] = None, **kwargs) -> requests.Response:
+        """Send a request, retrying transient failures; raises ``CircuitOpenError`` while the host is down."""
+        method = method.upper()
+        host = urlsplit(url).netloc
+        retries = self.retries if retries is None else retries
+        kwargs.setdefault("timeout", (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+        attempt = 0
+        while True:
+            with self._slot(host) as slot:
+                state = slot.state
+                try:
+                    response = self._session.request(method, url, **kwargs)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    state.breaker.record_failure()
+                    # Once a POST has gone out it may have been acted on, so only retry it if it never left.
+                    if (attempt >= retries or state.breaker.opened_at is not None
+                            or (method not in IDEMPOTENT_METHODS and not _never_sent(e))):
+                        raise
+                    logger.warning(f"{method} {host} failed ({e.__class__.__name__}), retrying")
+                    response = None
+                except requests.RequestException:
+                    # Broken or undecodable responses (ChunkedEncodingError and the like).
+                    state.breaker.record_failure()
+                    raise
+                else:
+                    status = response.status_code
+                    if status >= 500 or status == 429:
+                        state.breaker.record_failure()
+                    else:
+                        state.breaker.record_success()
+                    retryable = status in RETRY_ANY_METHOD or (status in RETRY_IDEMPOTENT and method in IDEMPOTENT_METHODS)
+                    # A breaker that tripped on this attempt ends the retries too.
+                    if not retryable or attempt >= retries or state.breaker.opened_at is not None:
+                        # The body of a streamed response is read after this returns.
+                        if kwargs.get("stream"):
+                            slot.hand_off(response)
+                        return response
+                    logger.warning(f"{method} {host} returned {status}, retrying")
+                    response.close()
+                state.retries += 1
+            time.sleep(self._backoff(attempt, response))
+            attempt += 1
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def stats(self) -> dict:
+        return {
+            host: {
+                "circuit": state.breaker.state,
+                "consecutive_failures": state.breaker.failures,
+                "in_flight": state.in_flight,
+                "requests": state.requests,
+                "retries": state.retries,
+                "rejected": state.rejected,
+            }
+            for host, state in list(self._hosts.items())
+        }
+
+
+_client: Optional[HttpClient] = None
+_client_lock = threading.Lock()
+
+
+def get_http_client() -> HttpClient:
+    """Return the HTTP client shared by every request handler in the process."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = HttpClient()
+    return _client
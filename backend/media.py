@@ -0,0 +1,334 @@
+import base64
+import bisect
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow missing: images are sent as downloaded.
+    Image = None
+
+try:
+    import av
+except ImportError:  # PyAV missing: voice notes are transcribed as downloaded.
+    av = None
+
+from http_client import get_http_client
+from voice_activity import CHUNK_SECONDS, VAD_SAMPLE_RATE, get_speech_splitter
+
+logger = logging.getLogger(__name__)
+
+# Largest attachment we download; WhatsApp caps images at 5 MB and audio at 16 MB.
+MEDIA_MAX_BYTES = int(os.getenv("MEDIA_MAX_BYTES", str(16 * 1024 * 1024)))
+MEDIA_CHUNK_SIZE = 64 * 1024
+# Longest side and JPEG quality of the image handed to the vision model.
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "1024"))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "80"))
+# Refuse to decode anything larger; a 5 MB PNG can otherwise expand to gigabytes.
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", str(50_000_000)))
+# Whisper resamples everything to 16 kHz mono, so voice notes are sent that
+# way, as Opus at a bitrate that keeps speech intelligible.
+AUDIO_SAMPLE_RATE = 16000
+AUDIO_BITRATE = int(os.getenv("AUDIO_BITRATE", "16000"))
+# Containers the transcription API accepts, by file extension.
+TRANSCRIBABLE_FORMATS = {"flac", "mp3", "mp4", "m4a", "ogg", "wav", "webm"}
+# Decoding a 12 MP photo takes ~36 MB of RGB, so only this many run at once
+# however many webhook workers are fetching images.
+MEDIA_DECODE_WORKERS = int(os.getenv("MEDIA_DECODE_WORKERS", "2"))
+MEDIA_DECODE_TIMEOUT = float(os.getenv("MEDIA_DECODE_TIMEOUT", "20"))
+
+
+class MediaTooLargeError(ValueError):
+    """The attachment is bigger than ``MEDIA_MAX_BYTES`` (or ``IMAGE_MAX_PIXELS`` once decoded)."""
+
+
+def download_media(url: str, auth=None, max_bytes: int = MEDIA_MAX_BYTES) -> Tuple[bytes, str]:
+    """Stream ``url`` into memory, stopping as soon as it passes ``max_bytes``.
+
+    Returns ``(data, content_type)``.
+    """
+    response = get_http_client().get(url, auth=auth, stream=True)
+    with response:
+        response.raise_for_status()
+        declared = response.headers.get("Content-Length")
+        if declared and declared.isdigit() and int(declared) > max_bytes:
+            raise MediaTooLargeError(f"Media is {int(declared)} bytes, limit is {max_bytes}")
+        buffer = io.BytesIO()
+        for chunk in response.iter_content(MEDIA_CHUNK_SIZE):
+            buffer.write(chunk)
+            if buffer.tell() > max_bytes:
+                raise MediaTooLargeError(f"Media passed the {max_bytes} byte limit while downloading")
+        content_type = response.headers.get("Content-Type", "application/octet-stream").split(";")[0].strip()
+        return buffer.getvalue(), content_type
+
+
+def prepare_image(data: bytes, max_side: int = IMAGE_MAX_SIDE, quality: int = IMAGE_JPEG_QUALITY) -> Tuple[bytes, str]:
+    """Downscale an image to fit ``max_side`` and re-encode it as JPEG without metadata.
+
+    The EXIF orientation is applied to the pixels, so the picture stays
+    upright once the EXIF block (camera, GPS, timestamps) is dropped.
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        width, height = image.size
+        if width * height > IMAGE_MAX_PIXELS:
+            raise MediaTooLargeError(f"Image is {width}x{height}, limit is {IMAGE_MAX_PIXELS} pixels")
+        # JPEG can decode straight to 1/2, 1/4 or 1/8 scale, which skips most of the work.
+        image.draft("RGB", (max_side, max_side))
+        # Shrink before rotating so the transpose copies the small bitmap.
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        out = io.BytesIO()
+        image.save(out, format="JPEG", quality=quality, optimize=True)
+        return out.getvalue(), "image/jpeg"
+
+
+def sniff_audio(data: bytes, content_type: str = "") -> str:
+    """File extension for an audio attachment, from its first bytes rather than the declared type."""
+    head = data[:12]
+    if head.startswith(b"OggS"):
+        return "ogg"
+    if head.startswith(b"RIFF") and head[8:12] == b"WAVE":
+        return "wav"
+    if head.startswith(b"fLaC"):
+        return "flac"
+    if head.startswith(b"#!AMR"):
+        return "amr"
+    if head.startswith(b"\x1aE\xdf\xa3"):
+        return "webm"
+    if head[4:8] == b"ftyp":
+        return "m4a"
+    if head.startswith(b"ID3") or (len(head) > 1 and head[0] == 0xFF and head[1] & 0xF6 == 0xF2):
+        return "mp3"
+    if len(head) > 1 and head[0] == 0xFF and head[1] & 0xF6 == 0xF0:
+        return "aac"
+    subtype = content_type.split("/")[-1].split(";")[0].strip()
+    return {"mpeg": "mp3", "x-wav": "wav", "wave": "wav", "mp4": "m4a", "x-m4a": "m4a"}.get(subtype, subtype or "bin")
+
+
+def audio_duration(data: bytes) -> Optional[float]:
+    """Length in seconds from the container, without decoding; None when it does not say."""
+    with av.open(io.BytesIO(data)) as container:
+        return container.duration / av.time_base if container.duration else None
+
+
+def decode_audio(data: bytes, sample_rate: int = AUDIO_SAMPLE_RATE) -> bytes:
+    """Decode an audio attachment in memory to mono 16-bit PCM at ``sample_rate``."""
+    pcm = bytearray()
+    resampler = av.AudioResampler(format="s16", layout="mono", rate=sample_rate)
+    with av.open(io.BytesIO(data)) as source:
+        for frame in source.decode(audio=0):
+            for resampled in resampler.resample(frame):
+                pcm += bytes(resampled.planes[0])[:resampled.samples * 2]
+        for resampled in resampler.resample(None):
+            pcm += bytes(resampled.planes[0])[:resampled.samples * 2]
+    return bytes(pcm)
+
+
+def encode_opus(pcm: bytes, sample_rate: int = AUDIO_SAMPLE_RATE, bitrate: int = AUDIO_BITRATE) -> bytes:
+    """Encode mono 16-bit PCM as Opus in Ogg."""
+    out = io.BytesIO()
+    with av.open(out, "w", format="ogg") as target:
+        stream = target.add_stream("libopus", rate=sample_rate, layout="mono")
+        stream.bit_rate = bitrate
+        # One second per frame; the encoder reframes it to what Opus needs.
+        step = sample_rate * 2
+        for offset in range(0, len(pcm), step):
+            block = pcm[offset:offset + step]
+            frame = av.AudioFrame(format="s16", layout="mono", samples=len(block) // 2)
+            frame.planes[0].update(block[:len(block) // 2 * 2])
+            frame.sample_rate = sample_rate
+            for packet in stream.encode(frame):
+                target.mux(packet)
+        for packet in stream.encode(None):
+            target.mux(packet)
+    return out.getvalue()
+
+
+def plan_audio(data: bytes) -> Tuple[bytes, List[List[Tuple[int, int]]]]:
+    """Decode a voice note and plan its chunks: ``(pcm, sample ranges of speech per chunk)``."""
+    pcm = decode_audio(data)
+    if not pcm:
+        raise ValueError("No audio could be decoded")
+    return pcm, get_speech_splitter().plan(pcm)
+
+
+def cut_opus(data: bytes, plan: List[List[Tuple[int, int]]]) -> Optional[List[bytes]]:
+    """Cut an Ogg/Opus note into the planned chunks by copying its packets, without re-encoding.
+
+    Returns None when the stream is not Opus.
+    """
+    chunks = []
+    with av.open(io.BytesIO(data)) as source:
+        stream = source.streams.audio[0]
+        if stream.codec_context.name != "opus":
+            return None
+        packets = [packet for packet in source.demux(stream) if packet.size and packet.pts is not None]
+        starts = [float(packet.pts * stream.time_base) for packet in packets]
+        for spans in plan:
+            out = io.BytesIO()
+            with av.open(out, "w", format="ogg") as target:
+                copy = target.add_stream_from_template(stream)
+                pts = 0
+                for begin, end in spans:
+                    first = bisect.bisect_left(starts, begin / VAD_SAMPLE_RATE)
+                    last = bisect.bisect_left(starts, end / VAD_SAMPLE_RATE)
+                    for packet in packets[first:last]:
+                        packet.pts = packet.dts = pts
+                        pts += packet.duration
+                        packet.stream = copy
+                        target.mux(packet)
+            chunks.append(out.getvalue())
+    return chunks
+
+
+def to_data_url(data: bytes, content_type: str) -> str:
+    return f"data:{content_type};base64,{base64.b64encode(data).decode('ascii')}"
+
+
+class MediaPipeline:
+    """Download attachments under a byte cap and shrink images and voice notes for the models."""
+
+    def __init__(self, workers: int = MEDIA_DECODE_WORKERS) -> None:
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="media-decode")
+        self._lock = threading.Lock()
+        self.downloads = 0
+        self.rejected = 0
+        self.images = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.audio = 0
+        self.audio_transcoded = 0
+        self.audio_bytes_in = 0
+        self.audio_bytes_out = 0
+
+    def fetch(self, url: str, auth=None) -> Tuple[bytes, str]:
+        try:
+            data, content_type = download_media(url, auth=auth)
+        except MediaTooLargeError:
+            with self._lock:
+                self.rejected += 1
+            raise
+        with self._lock:
+            self.downloads += 1
+        return data, content_type
+
+    def fetch_image(self, url: str, auth=None) -> str:
+        """Fetch an image and return it as a data URL sized for the vision model."""
+        data, content_type = self.fetch(url, auth=auth)
+        if Image is None:
+            return to_data_url(data, content_type)
+        try:
+            prepared, prepared_type = self._pool.submit(prepare_image, data).result(MEDIA_DECODE_TIMEOUT)
+        except MediaTooLargeError:
+            with self._lock:
+                self.rejected += 1
+            raise
+        with self._lock:
+            self.images += 1
+            self.bytes_in += len(data)
+            self.bytes_out += len(prepared)
+        logger.info(f"Image {len(data) // 1024} KB -> {len(prepared) // 1024} KB for the vision model")
+        return to_data_url(prepared, prepared_type)
+
+    def _worth_transcoding(self, data: bytes, extension: str) -> bool:
+        if extension not in TRANSCRIBABLE_FORMATS:
+            return True
+        try:
+            duration = audio_duration(data)
+        except Exception:
+            return True
+        return not duration or duration > CHUNK_SECONDS or len(data) * 8 / duration > 2 * AUDIO_BITRATE
+
+    def prepare_audio(self, data: bytes, content_type: str = "") -> Iterator[Tuple[bytes, str]]:
+        """Yield the ``(data, filename)`` chunks to transcribe, in order, all in memory.
+
+        The note is trimmed of silence and split at pauses (see
+        ``voice_activity``) on the decode pool. Ogg/Opus, what WhatsApp sends,
+        is cut packet by packet, which costs little and adds no second round
+        of lossy coding. Anything else is transcoded chunk by chunk to 16 kHz
+        mono Opus, and each chunk is yielded as soon as it is encoded, so the
+        caller can start transcribing it while the rest are still encoding.
+        A note that stays in one piece is sent as downloaded when that is smaller and in a
+        format Whisper takes (WhatsApp's own Opus notes often are), as is
+        anything PyAV is missing for or fails to decode. A note that fits in
+        one chunk and is already about as compact is not decoded at all.
+        """
+        extension = sniff_audio(data, content_type)
+        plan = cut = None
+        if av is not None and self._worth_transcoding(data, extension):
+            try:
+                pcm, plan = self._pool.submit(plan_audio, data).result(MEDIA_DECODE_TIMEOUT)
+                if extension == "ogg":
+                    cut = self._pool.submit(cut_opus, data, plan).result(MEDIA_DECODE_TIMEOUT)
+            except Exception as e:
+                plan = None
+                logger.warning(f"Could not transcode {extension} audio, sending it as is: {str(e)}")
+        chunks, size, transcoded = 0, 0, False
+        try:
+            if plan is None:
+                chunks, size = 1, len(data)
+                yield data, f"voice-note.{extension}"
+                return
+            if cut is not None:
+                encoding = iter(cut)
+            else:
+                futures = [self._pool.submit(encode_opus, b"".join(pcm[begin * 2:end * 2] for begin, end in spans))
+                           for spans in plan]
+                encoding = (future.result(MEDIA_DECODE_TIMEOUT) for future in futures)
+            for index, encoded in enumerate(encoding):
+                if len(plan) == 1 and len(encoded) >= len(data) and extension in TRANSCRIBABLE_FORMATS:
+                    encoded, filename = data, f"voice-note.{extension}"
+                else:
+                    filename = f"voice-note-{index}.ogg"
+                    transcoded = True
+                chunks += 1
+                size += len(encoded)
+                yield encoded, filename
+        finally:
+            with self._lock:
+                self.audio += 1
+                self.audio_transcoded += transcoded
+                self.audio_bytes_in += len(data)
+                self.audio_bytes_out += size
+            logger.info(f"Voice note {len(data) // 1024} KB -> {size // 1024} KB in {chunks} chunk(s) for transcription")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "downloads": self.downloads,
+                "rejected": self.rejected,
+                "images": self.images,
+                "image_bytes_in": self.bytes_in,
+                "image_bytes_out": self.bytes_out,
+                "resize_enabled": Image is not None,
+                "audio": self.audio,
+                "audio_transcoded": self.audio_transcoded,
+                "audio_bytes_in": self.audio_bytes_in,
+                "audio_bytes_out": self.audio_bytes_out,
+                "transcode_enabled": av is not None,
+                "speech": get_speech_splitter().stats(),
+            }
+
+
+_pipeline: Optional[MediaPipeline] = None
+_pipeline_lock = threading.Lock()
+
+
+def get_media_pipeline() -> MediaPipeline:
+    global _pipeline
+    if _pipeline is None:
+        with _pipeline_lock:
+            if _pipeline is None:
+                _pipeline = MediaPipeline()
+    return _pipeline
@@ -0,0 +1,144 @@
+import logging
+import re
+from typing import List, NamedTuple, Optional, Set
+
+from db import Database, get_database
+
+logger = logging.getLogger("nurse-assistant")
+
+# Candidates fetched from the index before re-ranking in Python.
+SEARCH_CANDIDATES = 40
+# Below this score a candidate is more likely noise than a misheard name.
+MIN_MATCH_SCORE = 0.35
+
+_WORD = re.compile(r"\w+")
+
+
+class MedicineMatch(NamedTuple):
+    name: str
+    description: str
+    side_effects: str
+    score: float
+
+
+def _words(text: str) -> List[str]:
+    return _WORD.findall(text.lower())
+
+
+def _trigrams(text: str) -> Set[str]:
+    grams = set()
+    for word in _words(text):
+        grams.update(word[i:i + 3] for i in range(len(word) - 2))
+    return grams
+
+
+def _windows(word: str) -> List[List[str]]:
+    """Overlapping pairs of a word's trigrams; a slip in the word spoils at most four."""
+    grams = [word[i:i + 3] for i in range(len(word) - 2)]
+    if len(grams) < 2:
+        return [grams] if grams else []
+    return [grams[i:i + 2] for i in range(len(grams) - 1)]
+
+
+def _quote(gram: str) -> str:
+    return '"' + gram.replace('"', '""') + '"'
+
+
+class MedicineIndex:
+    """Ranked medicine lookup over the ``medicines_fts`` trigram index.
+
+    An exact name (in any case) is answered from the NOCASE name index. Other
+    queries go to FTS5 first as a strict match, every trigram required, which
+    finds prefixes and substrings of names and descriptions. Only if that finds
+    nothing plausible does a misheard name ("paracetemol") get a fuzzy pass,
+    where any intact four-letter piece of a word fetches a candidate and bm25
+    favours names sharing the most pieces. Candidates are re-ranked by
+    trigram overlap with the name, with prefix matches first.
+    """
+
+    def __init__(self, db: Optional[Database] = None) -> None:
+        self._db = db
+
+    @property
+    def db(self) -> Database:
+        return self._db or get_database()
+
+    @staticmethod
+    def _score(query: str, query_grams: Set[str], name: str, description: str) -> float:
+        name_lower = name.lower()
+        if name_lower == query:
+            return 1.0
+        if name_lower.startswith(query):
+            # Shorter completions of the prefix rank higher.
+            return 0.9 + 0.09 * len(query) / len(name_lower)
+        name_grams = _trigrams(name)
+        # Dice coefficient on the name, containment in the description.
+        name_score = 2 * len(query_grams & name_grams) / (len(query_grams) + len(name_grams)) if name_grams else 0.0
+        description_score = len(query_grams & _trigrams(description or "")) / len(query_grams)
+        return max(name_score, 0.8 * description_score)
+
+    @staticmethod
+    def _candidates(conn, match: str, query: str, query_grams: Set[str]) -> List[MedicineMatch]:
+        rows = conn.execute(
+            "SELECT m.name, m.description, m.side_effects FROM medicines_fts "
+            "JOIN medicines m ON m.rowid = medicines_fts.rowid "
+            "WHERE medicines_fts MATCH ? ORDER BY bm25(medicines_fts, 10.0, 1.0) LIMIT ?",
+            (match, SEARCH_CANDIDATES)
+        ).fetchall()
+        return [
+            MedicineMatch(name, description, side_effects, MedicineIndex._score(query, query_grams, name, description))
+            for name, description, side_effects in rows
+        ]
+
+    @staticmethod
+    def _search(conn, query: str, limit: int) -> List[MedicineMatch]:
+        words = _words(query)
+        query = " ".join(words)
+        if not query:
+            return []
+        row = conn.execute(
+            "SELECT name, description, side_effects FROM medicines WHERE name = ? COLLATE NOCASE LIMIT 1", (query,)
+        ).fetchone()
+        if row:
+            return [MedicineMatch(*row, 1.0)]
+
+        query_grams = _trigrams(query)
+        if not query_grams:
+            # Trigrams cannot match one- or two-letter input; fall back to a name prefix.
+            rows = conn.execute(
+                "SELECT name, description, side_effects FROM medicines WHERE name LIKE ? ORDER BY length(name) LIMIT ?",
+                (f"{query}%", limit)
+            ).fetchall()
+            return [MedicineMatch(*row, MedicineIndex._score(query, query_grams, row[0], row[1])) for row in rows]
+
+        strict = " AND ".join(_quote(gram) for gram in sorted(query_grams))
+        matches = [
+            match for match in MedicineIndex._candidates(conn, strict, query, query_grams)
+            if match.score >= MIN_MATCH_SCORE
+        ]
+        if not matches:
+            fuzzy = " OR ".join(
+                "(" + " AND ".join(_quote(gram) for gram in window) + ")"
+                for word in words for window in _windows(word)
+            )
+            matches = [
+                match for match in MedicineIndex._candidates(conn, fuzzy, query, query_grams)
+                if match.score >= MIN_MATCH_SCORE
+            ]
+        matches.sort(key=lambda match: match.score, reverse=True)
+        return matches[:limit]
+
+    async def search(self, query: str, limit: int = 3) -> List[MedicineMatch]:
+        """Best matches for a spoken medicine name or description, best first."""
+        return await self.db.run(self._search, query, limit)
+
+
+_index: Optional[MedicineIndex] = None
+
+
+def get_medicine_index() -> MedicineIndex:
+    """Return the medicine index shared by every session in the worker."""
+    global _index
+    if _index is None:
+        _index = MedicineIndex()
+    return _index
@@ -0,0 +1,397 @@
+import logging
+import sqlite3
+from datetime import datetime
+
+from db import DB_PATH
+
+logger = logging.getLogger("nurse-assistant")
+
+
+def _create_schema(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS patients (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            phone TEXT UNIQUE NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            insurance_provider TEXT,
+            insurance_number TEXT
+        )
+    """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS doctors (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            specialty TEXT NOT NULL
+        )
+    """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS appointments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id INTEGER,
+            doctor_id INTEGER,
+            specialty TEXT NOT NULL,
+            preferred_date TEXT NOT NULL,
+            preferred_time TEXT NOT NULL,
+            FOREIGN KEY (patient_id) REFERENCES patients(id),
+            FOREIGN KEY (doctor_id) REFERENCES doctors(id)
+        )
+    """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS insurance_claims (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id INTEGER,
+            insurance_provider TEXT,
+            insurance_number TEXT,
+            claim_amount REAL,
+            status TEXT,
+            claim_date TEXT NOT NULL,
+            FOREIGN KEY (patient_id) REFERENCES patients(id)
+        )
+    """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS medicines (
+            name TEXT PRIMARY KEY,
+            description TEXT,
+            side_effects TEXT
+        )
+    """)
+
+
+def _create_indexes(cursor):
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_appointments_patient_id ON appointments (patient_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_appointments_doctor_id ON appointments (doctor_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_doctors_specialty ON doctors (specialty)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_insurance_claims_patient_id ON insurance_claims (patient_id)")
+
+
+def _is_empty(cursor, table):
+    return cursor.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone() is None
+
+
+def _seed_fixtures(cursor):
+    """Insert the sample roster and demo records.
+
+    Databases created before migrations existed already hold this data (often
+    several copies of it), so each table is only seeded while it is empty.
+    """
+    if _is_empty(cursor, "doctors"):
+        doctors_data = [
+            ("Dr. Anil Sharma", "General Medicine"), ("Dr. Priya Gupta", "General Medicine"),
+            ("Dr. Rajesh Kumar", "General Medicine"), ("Dr. Neha Patel", "General Medicine"),
+            ("Dr. Sanjay Desai", "General Medicine"), ("Dr. Anjali Mehta", "General Medicine"),
+            ("Dr. Vikram Singh", "General Medicine"), ("Dr. Pooja Shah", "General Medicine"),
+            ("Dr. Rakesh Verma", "General Medicine"), ("Dr. Sunita Joshi", "General Medicine"),
+            ("Dr. Amit Choudhary", "Orthopedics"), ("Dr. Shalini Kapoor", "Orthopedics"),
+            ("Dr. Manoj Patil", "Orthopedics"), ("Dr. Kavita Rana", "Orthopedics"),
+            ("Dr. Deepak Malhotra", "Orthopedics"), ("Dr. Meera Nair", "Orthopedics"),
+            ("Dr. Rohan Kulkarni", "Orthopedics"), ("Dr. Swati Thakur", "Orthopedics"),
+            ("Dr. Vinod Agarwal", "Orthopedics"), ("Dr. Lakshmi Iyer", "Orthopedics"),
+            ("Dr. Sameer Khan", "Psychiatry"), ("Dr. Ritu Saxena", "Psychiatry"),
+            ("Dr. Arjun Menon", "Psychiatry"), ("Dr. Nisha Varghese", "Psychiatry"),
+            ("Dr. Siddharth Bose", "Psychiatry"), ("Dr. Ananya Das", "Psychiatry"),
+            ("Dr. Karan Oberoi", "Psychiatry"), ("Dr. Preeti Malhotra", "Psychiatry"),
+            ("Dr. Vivek Sharma", "Psychiatry"), ("Dr. Smriti Jain", "Psychiatry"),
+            ("Dr. Rahul Mehra", "Cardiology"), ("Dr. Suman Gupta", "Cardiology"),
+            ("Dr. Ashok Reddy", "Cardiology"), ("Dr. Divya Sharma", "Cardiology"),
+            ("Dr. Kunal Desai", "Cardiology"), ("Dr. Rekha Pillai", "Cardiology"),
+            ("Dr. Manish Thakur", "Cardiology"), ("Dr. Seema Kapoor", "Cardiology"),
+            ("Dr. Ajay Bhatt", "Cardiology"), ("Dr. Lakshmi Nair", "Cardiology"),
+            ("Dr. Vikrant Singh", "Neurology"), ("Dr. Anjali Rao", "Neurology"),
+            ("Dr. Sanjay Gupta", "Neurology"), ("Dr. Priyanka Shah", "Neurology"),
+            ("Dr. Rohit Kumar", "Neurology"), ("Dr. Neeta Patel", "Neurology"),
+            ("Dr. Aravind Menon", "Neurology"), ("Dr. Shalini Desai", "Neurology"),
+            ("Dr. Rajiv Malhotra", "Neurology"), ("Dr. Meena Iyer", "Neurology")
+        ]
+        cursor.executemany("INSERT INTO doctors (name, specialty) VALUES (?, ?)", doctors_data)
+
+    # Insert sample patient data
+    patients_data = [
+        ("Arav Saxena", "+919876543210", "arav.saxena@example.com", "Star Health", "SH123456"),
+        ("Priya Sharma", "+918765432109", "priya.sharma@example.com", "HDFC Ergo", "HE789012"),
+        ("Rahul Mehta", "+917654321098", "rahul.mehta@example.com", None, None)
+    ]
+    cursor.executemany(
+        "INSERT OR IGNORE INTO patients (name, phone, email, insurance_provider, insurance_number) VALUES (?, ?, ?, ?, ?)",
+        patients_data
+    )
+
+    patient_ids = {
+        phone: cursor.execute("SELECT id FROM patients WHERE phone = ?", (phone,)).fetchone()[0]
+        for _, phone, _, _, _ in patients_data
+    }
+    arav_id = patient_ids["+919876543210"]
+    priya_id = patient_ids["+918765432109"]
+    rahul_id = patient_ids["+917654321098"]
+
+    if _is_empty(cursor, "appointments"):
+        doctor1_id = cursor.execute(
+            "SELECT id FROM doctors WHERE name = 'Dr. Anil Sharma' AND specialty = 'General Medicine'"
+        ).fetchone()[0]
+        doctor2_id = cursor.execute(
+            "SELECT id FROM doctors WHERE name = 'Dr. Amit Choudhary' AND specialty = 'Orthopedics'"
+        ).fetchone()[0]
+        appointments_data = [
+            (arav_id, doctor1_id, "General Medicine", "2025-06-15", "10:00"),
+            (arav_id, doctor2_id, "Orthopedics", "2025-06-20", "14:30"),
+            (priya_id, doctor1_id, "General Medicine", "2025-06-16", "11:00"),
+            (rahul_id, doctor2_id, "Orthopedics", "2025-06-18", "09:30")
+        ]
+        cursor.executemany(
+            "INSERT INTO appointments (patient_id, doctor_id, specialty, preferred_date, preferred_time) VALUES (?, ?, ?, ?, ?)",
+            appointments_data
+        )
+
+    if _is_empty(cursor, "insurance_claims"):
+        current_date = datetime.now().strftime("%Y-%m-%d")
+        insurance_claims_data = [
+            (arav_id, "Star Health", "SH123456", 5000.0, "Pending", current_date),
+            (priya_id, "HDFC Ergo", "HE789012", 7500.0, "Approved", current_date)
+        ]
+        cursor.executemany(
+            "INSERT INTO insurance_claims (patient_id, insurance_provider, insurance_number, claim_amount, status, claim_date) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            insurance_claims_data
+        )
+
+    medicines_data = [
+        ("Paracetamol", "Pain reliever and fever reducer", "Nausea, rash, liver damage (rare)"),
+        ("Ibuprofen", "Nonsteroidal anti-inflammatory drug", "Stomach pain, dizziness, headache"),
+        ("Aspirin", "Pain reliever and blood thinner", "Stomach upset, bleeding risk"),
+        ("Amoxicillin", "Antibiotic for bacterial infections", "Diarrhea, rash, allergic reactions")
+    ]
+    cursor.executemany(
+        "INSERT OR IGNORE INTO medicines (name, description, side_effects) VALUES (?, ?, ?)",
+        medicines_data
+    )
+
+
+def _track_roster_version(cursor):
+    """Keep a counter that changes whenever the doctor roster does.
+
+    In-process caches of the roster compare against it after their TTL instead
+    of reloading the whole table.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS roster_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+    """)
+    cursor.execute("INSERT OR IGNORE INTO roster_version (id, version) VALUES (1, 0)")
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS doctors_roster_{event.lower()} AFTER {event} ON doctors
+            BEGIN
+                UPDATE roster_version SET version = version + 1 WHERE id = 1;
+            END
+        """)
+
+
+def _index_doctor_slots(cursor):
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_appointments_doctor_slot "
+        "ON appointments (doctor_id, preferred_date, preferred_time)"
+    )
+
+
+def _create_email_outbox(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS email_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            recipient TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            body TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            last_error TEXT,
+            created_at TEXT NOT NULL
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_email_outbox_due ON email_outbox (status, next_attempt_at)")
+
+
+def _create_latency_histograms(cursor):
+    # Non-cumulative bucket counts keyed by upper bound; job processes add their
+    # deltas and the worker's /metrics endpoint sums them into Prometheus form.
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS latency_histograms (
+            worker TEXT NOT NULL,
+            metric TEXT NOT NULL,
+            language TEXT NOT NULL,
+            le REAL NOT NULL,
+            observations INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (worker, metric, language, le)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS latency_sums (
+            worker TEXT NOT NULL,
+            metric TEXT NOT NULL,
+            language TEXT NOT NULL,
+            total_seconds REAL NOT NULL DEFAULT 0,
+            observations INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (worker, metric, language)
+        ) WITHOUT ROWID
+    """)
+
+
+def _track_appointment_version(cursor):
+    """Keep a counter that changes whenever an appointment is booked, moved or cancelled.
+
+    Each worker's slot index compares against it, so bookings made by other
+    processes are picked up without rereading the table every time.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS appointments_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+    """)
+    cursor.execute("INSERT OR IGNORE INTO appointments_version (id, version) VALUES (1, 0)")
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS appointments_version_{event.lower()} AFTER {event} ON appointments
+            BEGIN
+                UPDATE appointments_version SET version = version + 1 WHERE id = 1;
+            END
+        """)
+
+
+def _index_medicines(cursor):
+    """Trigram full-text index over medicine names and descriptions.
+
+    The index reads its text from ``medicines`` (external content) and is kept
+    in step by triggers. It is keyed on the implicit rowid, so run
+    ``INSERT INTO medicines_fts(medicines_fts) VALUES ('rebuild')`` after a
+    VACUUM of hospital.db.
+    """
+    cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS medicines_fts USING fts5(
+            name, description, content='medicines', tokenize='trigram'
+        )
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS medicines_fts_insert AFTER INSERT ON medicines BEGIN
+            INSERT INTO medicines_fts (rowid, name, description) VALUES (new.rowid, new.name, new.description);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS medicines_fts_delete AFTER DELETE ON medicines BEGIN
+            INSERT INTO medicines_fts (medicines_fts, rowid, name, description)
+            VALUES ('delete', old.rowid, old.name, old.description);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS medicines_fts_update AFTER UPDATE ON medicines BEGIN
+            INSERT INTO medicines_fts (medicines_fts, rowid, name, description)
+            VALUES ('delete', old.rowid, old.name, old.description);
+            INSERT INTO medicines_fts (rowid, name, description) VALUES (new.rowid, new.name, new.description);
+        END
+    """)
+    cursor.execute("INSERT INTO medicines_fts (medicines_fts) VALUES ('rebuild')")
+    # Case-insensitive exact and LIKE-prefix lookups by name.
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_medicines_name_nocase ON medicines (name COLLATE NOCASE)")
+
+
+def _lease_email_outbox(cursor):
+    # A sender claims rows by moving them to 'sending' with a lease; rows whose
+    # lease ran out (the sender died mid-batch) go back to 'pending'.
+    cursor.execute("ALTER TABLE email_outbox ADD COLUMN lease_until REAL")
+
+
+def _log_appointment_changes(cursor):
+    """Append-only log of the slots each booking, move or cancellation takes or frees.
+
+    A worker's slot index replays the rows past the last one it applied instead
+    of rereading every upcoming appointment when another process writes. It
+    replaces the bare ``appointments_version`` counter.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS appointment_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            doctor_id INTEGER,
+            preferred_date TEXT NOT NULL,
+            preferred_time TEXT NOT NULL,
+            delta INTEGER NOT NULL
+        )
+    """)
+    freed = ("INSERT INTO appointment_changes (doctor_id, preferred_date, preferred_time, delta) "
+             "VALUES (old.doctor_id, old.preferred_date, old.preferred_time, -1);")
+    taken = ("INSERT INTO appointment_changes (doctor_id, preferred_date, preferred_time, delta) "
+             "VALUES (new.doctor_id, new.preferred_date, new.preferred_time, 1);")
+    for name, event, body in (
+        ("insert", "INSERT", taken),
+        ("delete", "DELETE", freed),
+        ("update", "UPDATE OF doctor_id, preferred_date, preferred_time", freed + taken),
+    ):
+        cursor.execute(f"DROP TRIGGER IF EXISTS appointments_version_{name}")
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS appointment_changes_{name} AFTER {event} ON appointments
+            BEGIN
+                {body}
+            END
+        """)
+    cursor.execute("DROP TABLE IF EXISTS appointments_version")
+
+
+# Ordered schema history. The index of a step plus one is the schema version it
+# produces; append new steps, never edit or reorder the ones already shipped.
+MIGRATIONS = [
+    _create_schema,
+    _create_indexes,
+    _seed_fixtures,
+    _track_roster_version,
+    _index_doctor_slots,
+    _create_email_outbox,
+    _create_latency_histograms,
+    _index_medicines,
+    _track_appointment_version,
+    _lease_email_outbox,
+    _log_appointment_changes,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def init_db(path: str = DB_PATH) -> int:
+    """Bring hospital.db up to ``SCHEMA_VERSION`` and return the resulting version.
+
+    The version lives in the database header (``PRAGMA user_version``), so an
+    up-to-date database costs one header read at boot regardless of its size.
+    Each pending step runs in its own ``BEGIN IMMEDIATE`` transaction together
+    with the version bump, which also serialises workers booting at once.
+    """
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    try:
+        if get_schema_version(conn) >= SCHEMA_VERSION:
+            return get_schema_version(conn)
+
+        conn.execute("PRAGMA journal_mode=WAL")
+        cursor = conn.cursor()
+        while True:
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                version = get_schema_version(conn)
+                if version >= SCHEMA_VERSION:
+                    cursor.execute("COMMIT")
+                    return version
+                migration = MIGRATIONS[version]
+                migration(cursor)
+                cursor.execute(f"PRAGMA user_version = {version + 1}")
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+            logger.info(f"Migrated hospital.db to schema version {version + 1} ({migration.__name__})")
+    finally:
+        conn.close()
@@ -0,0 +1,251 @@
+import asyncio
+import logging
+import os
+import random
+import smtplib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from email.message import EmailMessage
+from typing import List, Optional, Tuple
+
+from db import Database, get_database
+
+logger = logging.getLogger("nurse-assistant")
+
+# Point these at a local stand-in to test without Gmail, e.g.
+#   python -m aiosmtpd -n -l localhost:8025
+#   SMTP_HOST=localhost SMTP_PORT=8025 SMTP_USE_SSL=0
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "465"))
+SMTP_USE_SSL = os.getenv("SMTP_USE_SSL", "1").lower() not in ("0", "false", "no")
+SMTP_TIMEOUT = 30
+
+OUTBOX_BATCH_SIZE = 20
+OUTBOX_MAX_ATTEMPTS = 6
+OUTBOX_POLL_INTERVAL = 30.0
+OUTBOX_BACKOFF_BASE = 5.0
+OUTBOX_BACKOFF_MAX = 600.0
+# A claimed batch must be sent within this long, or another sender takes it
+# over. Longer than a batch of SMTP timeouts, so a slow sender is not overtaken.
+OUTBOX_LEASE_SECONDS = OUTBOX_BATCH_SIZE * SMTP_TIMEOUT * 1.5
+
+
+class EmailOutbox:
+    """Durable queue of outgoing emails with one background sender per process.
+
+    ``enqueue`` only inserts a row into ``email_outbox``, so tools return as
+    soon as the booking is stored. The sender task drains due messages in
+    batches over a single SMTP connection that stays logged in between
+    batches; failures are retried with jittered exponential backoff until
+    ``OUTBOX_MAX_ATTEMPTS`` is reached. Messages survive restarts because they
+    live in hospital.db until sent.
+
+    Every job process runs a sender, so a batch is claimed before it is sent:
+    one ``BEGIN IMMEDIATE`` transaction moves the due rows to ``'sending'``
+    with a lease, and only the claiming sender records their results. Rows
+    left ``'sending'`` past their lease, by a sender that died mid-batch, are
+    returned to ``'pending'`` and sent again.
+    """
+
+    def __init__(self, db: Optional[Database] = None, host: str = SMTP_HOST, port: int = SMTP_PORT,
+                 use_ssl: bool = SMTP_USE_SSL, sender: Optional[str] = None, password: Optional[str] = None) -> None:
+        self._db = db
+        self.host = host
+        self.port = port
+        self.use_ssl = use_ssl
+        self.sender = sender or os.getenv("EMAIL_SENDER")
+        self.password = password or os.getenv("EMAIL_PASSWORD")
+        self._smtp: Optional[smtplib.SMTP] = None
+        # smtplib is blocking and a connection is not thread-safe: one thread owns it.
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="email-outbox")
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def db(self) -> Database:
+        return self._db or get_database()
+
+    async def enqueue(self, recipient: str, subject: str, body: str) -> Optional[int]:
+        """Queue a message and return its outbox id, or None if email is not configured."""
+        if not self.sender:
+            logger.error("Email sender is missing in the environment variables.")
+            return None
+        cursor = await self.db.execute(
+            "INSERT INTO email_outbox (recipient, subject, body, next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?)",
+            (recipient, subject, body, time.time(), datetime.now().isoformat())
+        )
+        if self._wakeup:
+            self._wakeup.set()
+        return cursor.lastrowid
+
+    def start(self) -> None:
+        """Start the sender task on the running loop if it is not already running."""
+        if self._task and not self._task.done():
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="email-outbox")
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._disconnect)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                sent = await self.flush()
+            except Exception as e:
+                logger.error(f"Email outbox flush failed: {e}")
+                sent = 0
+            if sent == OUTBOX_BATCH_SIZE:
+                continue
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=OUTBOX_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def flush(self) -> int:
+        """Claim and send one batch of due messages; return how many were attempted."""
+        lease, due = await self.db.run(self._claim, time.time())
+        if not due:
+            return 0
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(self._executor, self._send_batch, due)
+        except Exception:
+            await self.db.run(self._release, due, lease)
+            raise
+        await self.db.run(self._record_results, due, results, lease)
+        return len(due)
+
+    @staticmethod
+    def _claim(conn, now: float) -> Tuple[float, List[Tuple]]:
+        """Move a batch of due rows to 'sending' under a lease; return the lease and the rows."""
+        lease = now + OUTBOX_LEASE_SECONDS
+        conn.execute("BEGIN IMMEDIATE")
+        expired = conn.execute(
+            "UPDATE email_outbox SET status = 'pending', last_error = 'lease expired' "
+            "WHERE status = 'sending' AND lease_until < ?",
+            (now,)
+        ).rowcount
+        if expired:
+            logger.warning(f"Re-queued {expired} emails left unsent by a stopped sender")
+        due = conn.execute(
+            "UPDATE email_outbox SET status = 'sending', lease_until = ? "
+            "WHERE id IN (SELECT id FROM email_outbox WHERE status = 'pending' AND next_attempt_at <= ? "
+            "ORDER BY next_attempt_at LIMIT ?) "
+            "RETURNING id, recipient, subject, body, attempts",
+            (lease, now, OUTBOX_BATCH_SIZE)
+        ).fetchall()
+        return lease, sorted(due)
+
+    # Writes below only touch rows still held under this batch's lease, so a
+    # sender that overran it cannot overwrite the one that took over.
+    @staticmethod
+    def _release(conn, due, lease: float) -> None:
+        conn.executemany(
+            "UPDATE email_outbox SET status = 'pending' WHERE id = ? AND status = 'sending' AND lease_until = ?",
+            [(message_id, lease) for message_id, *_ in due]
+        )
+
+    @staticmethod
+    def _record_results(conn, due, results: List[Optional[str]], lease: float) -> None:
+        now = time.time()
+        for (message_id, recipient, _, _, attempts), error in zip(due, results):
+            if error is None:
+                conn.execute(
+                    "UPDATE email_outbox SET status = 'sent', attempts = ? "
+                    "WHERE id = ? AND status = 'sending' AND lease_until = ?",
+                    (attempts + 1, message_id, lease)
+                )
+                logger.info(f"Email {message_id} sent to {recipient}")
+                continue
+            attempts += 1
+            if attempts >= OUTBOX_MAX_ATTEMPTS:
+                status, next_attempt_at = "failed", now
+                logger.error(f"Giving up on email {message_id} to {recipient} after {attempts} attempts: {error}")
+            else:
+                delay = min(OUTBOX_BACKOFF_BASE * 2 ** attempts, OUTBOX_BACKOFF_MAX) * random.uniform(0.5, 1.5)
+                status, next_attempt_at = "pending", now + delay
+                logger.warning(f"Email {message_id} to {recipient} failed, retrying in {delay:.0f}s: {error}")
+            conn.execute(
+                "UPDATE email_outbox SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ? "
+                "WHERE id = ? AND status = 'sending' AND lease_until = ?",
+                (status, attempts, next_attempt_at, error, message_id, lease)
+            )
+
+    def _connect(self) -> smtplib.SMTP:
+        if self.use_ssl:
+            smtp = smtplib.SMTP_SSL(self.host, self.port, timeout=SMTP_TIMEOUT)
+        else:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=SMTP_TIMEOUT)
+        if self.password:
+            smtp.login(self.sender, self.password)
+        logger.info(f"Opened SMTP connection to {self.host}:{self.port}")
+        return smtp
+
+    def _disconnect(self) -> None:
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except smtplib.SMTPException:
+            self._smtp.close()
+        except OSError:
+            pass
+        self._smtp = None
+
+    def _connection(self) -> smtplib.SMTP:
+        """Return the live connection, reconnecting if the server dropped it while idle."""
+        if self._smtp is not None:
+            try:
+                if self._smtp.noop()[0] == 250:
+                    return self._smtp
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._disconnect()
+        self._smtp = self._connect()
+        return self._smtp
+
+    def _send_batch(self, due: List[Tuple]) -> List[Optional[str]]:
+        """Send each message over the shared connection; return an error string or None per message."""
+        results: List[Optional[str]] = []
+        try:
+            smtp = self._connection()
+        except (smtplib.SMTPException, OSError) as e:
+            return [str(e)] * len(due)
+
+        for _, recipient, subject, body, _ in due:
+            msg = EmailMessage()
+            msg['Subject'] = subject
+            msg['From'] = self.sender
+            msg['To'] = recipient
+            msg.set_content(body)
+            try:
+                try:
+                    smtp.send_message(msg)
+                except smtplib.SMTPServerDisconnected:
+                    self._disconnect()
+                    smtp = self._connection()
+                    smtp.send_message(msg)
+                results.append(None)
+            except (smtplib.SMTPException, OSError) as e:
+                results.append(str(e))
+        return results
+
+
+_outbox: Optional[EmailOutbox] = None
+
+
+def get_email_outbox() -> EmailOutbox:
+    """Return the outbox shared by every session in the worker."""
+    global _outbox
+    if _outbox is None:
+        _outbox = EmailOutbox()
+    return _outbox
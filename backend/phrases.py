@@ -0,0 +1,198 @@
+"""Fixed phrases Riya speaks, and their pre-rendered audio.
+
+Render the audio once per deploy, with the same TTS credentials as the agent:
+
+    python phrases.py [--language en --language hi ...] [--force]
+"""
+import argparse
+import asyncio
+import hashlib
+import logging
+import os
+import wave
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from livekit import rtc
+
+from speech import TTS_VOICES, get_speech_pool
+
+logger = logging.getLogger("nurse-assistant")
+
+PHRASE_AUDIO_DIR = os.getenv("PHRASE_AUDIO_DIR", "phrase_audio")
+FRAME_MS = 20
+
+GREETINGS = {
+    "en": "Hello, I am Riya, a nurse assistant at Symbiosis Hospital. How can I assist you today?",
+    "hi": "नमस्ते, मैं सिम्बायोसिस अस्पताल की नर्स सहायक रिया हूँ। मैं आपकी आज कैसे मदद कर सकती हूँ?",
+    "mr": "नमस्कार, मी सिम्बायोसिस हॉस्पिटलची नर्स सहाय्यक रिया आहे. मी तुम्हाला आज कशी मदत करू शकते?",
+    "pa": "ਸਤ ਸ੍ਰੀ ਅਕਾਲ, ਮੈਂ ਸਿਮਬਾਇਓਸਿਸ ਹਸਪਤਾਲ ਦੀ ਨਰਸ ਸਹਾਇਕ ਰੀਆ ਹਾਂ। ਮੈਂ ਅੱਜ ਤੁਹਾਡੀ ਕਿਵੇਂ ਮਦਦ ਕਰ ਸਕਦੀ ਹਾਂ?",
+    "ta": "வணக்கம், நான் சிம்பயோசிஸ் மருத்துவமனையின் செவிலியர் உதவியாளர் ரியா. இன்று உங்களுக்கு எப்படி உதவ முடியும்?"
+}
+
+# Tool replies the model tends to read back word for word.
+FIXED_PHRASES = {
+    "en": [
+        "Appointment canceled successfully.",
+        "You have no upcoming appointments.",
+        "Appointment not found. Please check the booking ID.",
+        "Please identify yourself first using name, phone, and email.",
+        "Please provide date in YYYY-MM-DD format and time in HH:MM format.",
+    ],
+}
+
+# (sample_rate, num_channels, 16-bit PCM)
+Clip = Tuple[int, int, bytes]
+
+
+def phrases_for(language: str) -> List[str]:
+    return [GREETINGS.get(language, GREETINGS["en"])] + FIXED_PHRASES.get(language, [])
+
+
+def audio_key(text: str, provider: str, model: str, voice: str) -> str:
+    """Content address of a rendered phrase; any change to text or voice gets a new file."""
+    return hashlib.sha256("\0".join((provider, model, voice, text.strip())).encode("utf-8")).hexdigest()
+
+
+class PhraseAudio:
+    """Pre-rendered audio for fixed phrases, read from ``PHRASE_AUDIO_DIR``.
+
+    Files are named by ``audio_key`` so several voices and old deploys can
+    share the directory. ``load()`` reads every clip for the configured voices
+    into memory once per worker; sessions then stream the frames straight to
+    the room without a TTS round trip.
+    """
+
+    def __init__(self, directory: str = PHRASE_AUDIO_DIR, voices: Dict[str, Tuple[str, str, str]] = TTS_VOICES) -> None:
+        self.directory = directory
+        self.voices = voices
+        self._clips: Dict[Tuple[str, str], Clip] = {}
+        self._loaded = False
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, language: str, text: str) -> str:
+        provider, model, voice = self.voices.get(language, self.voices["en"])
+        return os.path.join(self.directory, f"{audio_key(text, provider, model, voice)}.wav")
+
+    def load(self) -> int:
+        """Read every available clip into memory; return how many were found."""
+        clips: Dict[Tuple[str, str], Clip] = {}
+        for language in self.voices:
+            for text in phrases_for(language):
+                path = self._path(language, text)
+                try:
+                    with wave.open(path, "rb") as wav:
+                        clips[(language, text.strip())] = (wav.getframerate(), wav.getnchannels(), wav.readframes(wav.getnframes()))
+                except FileNotFoundError:
+                    continue
+                except (wave.Error, EOFError) as e:
+                    logger.warning(f"Ignoring unreadable phrase audio {path}: {e}")
+        self._clips = clips
+        self._loaded = True
+        logger.info(f"Loaded {len(clips)} pre-rendered phrases from {self.directory}")
+        return len(clips)
+
+    def _ensure_loaded(self) -> None:
+        if not self._loaded:
+            self.load()
+
+    def might_match(self, language: str, partial: str) -> bool:
+        """Whether streamed text so far could still turn out to be a cached phrase."""
+        self._ensure_loaded()
+        partial = partial.lstrip()
+        return any(lang == language and text.startswith(partial) for lang, text in self._clips)
+
+    def get(self, language: str, text: str) -> Optional[Clip]:
+        self._ensure_loaded()
+        clip = self._clips.get((language, text.strip()))
+        if clip is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return clip
+
+    @staticmethod
+    async def frames(clip: Clip) -> AsyncIterator[rtc.AudioFrame]:
+        sample_rate, num_channels, pcm = clip
+        samples = sample_rate * FRAME_MS // 1000
+        step = samples * num_channels * 2
+        for offset in range(0, len(pcm), step):
+            chunk = pcm[offset:offset + step]
+            yield rtc.AudioFrame(
+                data=chunk,
+                sample_rate=sample_rate,
+                num_channels=num_channels,
+                samples_per_channel=len(chunk) // (num_channels * 2),
+            )
+
+    async def render(self, language: str, text: str, tts, force: bool = False) -> bool:
+        """Synthesize one phrase through ``tts`` and store it; return False if it was already cached."""
+        path = self._path(language, text)
+        if not force and os.path.exists(path):
+            return False
+        pcm = bytearray()
+        sample_rate = num_channels = None
+        async with tts.synthesize(text) as stream:
+            async for audio in stream:
+                frame = audio.frame
+                sample_rate, num_channels = frame.sample_rate, frame.num_channels
+                pcm.extend(bytes(frame.data))
+        if not pcm:
+            raise RuntimeError(f"TTS returned no audio for {language} phrase {text!r}")
+
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with wave.open(tmp_path, "wb") as wav:
+            wav.setnchannels(num_channels)
+            wav.setsampwidth(2)
+            wav.setframerate(sample_rate)
+            wav.writeframes(bytes(pcm))
+        os.replace(tmp_path, path)
+        self._loaded = False
+        return True
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "clips": len(self._clips),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+_phrase_audio: Optional[PhraseAudio] = None
+
+
+def get_phrase_audio() -> PhraseAudio:
+    """Return the phrase audio shared by every session in the worker."""
+    global _phrase_audio
+    if _phrase_audio is None:
+        _phrase_audio = PhraseAudio()
+    return _phrase_audio
+
+
+async def prerender(languages: List[str], force: bool = False) -> None:
+    phrase_audio = get_phrase_audio()
+    pool = get_speech_pool()
+    try:
+        for language in languages:
+            tts = pool.tts(language)
+            for text in phrases_for(language):
+                if await phrase_audio.render(language, text, tts, force=force):
+                    logger.info(f"Rendered {language}: {text}")
+    finally:
+        await pool.aclose()
+    phrase_audio.load()
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    logging.basicConfig(level=logging.INFO)
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--language", action="append", choices=sorted(TTS_VOICES), help="default: every language")
+    parser.add_argument("--force", action="store_true", help="re-render phrases that are already cached")
+    args = parser.parse_args()
+    asyncio.run(prerender(args.language or sorted(TTS_VOICES), force=args.force))
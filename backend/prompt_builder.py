@@ -0,0 +1,194 @@
+import logging
+import math
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# Prompt tokens allowed per request: system prompt, history and the new message.
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "3000"))
+# The newest turns are kept word for word while they fit; older ones are compacted first.
+PROMPT_VERBATIM_TURNS = int(os.getenv("PROMPT_VERBATIM_TURNS", "2"))
+# What a compacted turn keeps of each side.
+COMPACT_USER_CHARS = 160
+COMPACT_ASSISTANT_CHARS = 240
+# Llama 4 Scout tiles a 1024 px image into a handful of 336 px tiles.
+IMAGE_TOKEN_ESTIMATE = int(os.getenv("IMAGE_TOKEN_ESTIMATE", "1200"))
+# Per-message overhead of the chat template (role header and end-of-turn tokens).
+MESSAGE_OVERHEAD_TOKENS = 4
+
+Content = Union[str, List[dict]]
+
+_SENTENCE_END = re.compile(r"(?<=[.!?।])\s")
+
+
+def estimate_tokens(text: str) -> int:
+    """Token estimate without the model's tokenizer: about 4 UTF-8 bytes per token.
+
+    Counting bytes rather than characters keeps Hindi and Marathi in line,
+    since Devanagari takes 3 bytes a character and tokenizes into more pieces.
+    """
+    return math.ceil(len(text.encode("utf-8")) / 4) if text else 0
+
+
+def content_text(content: Content) -> str:
+    """Text of a message, with any image reduced to a marker."""
+    if isinstance(content, str):
+        return content
+    parts = []
+    for part in content:
+        if part.get("type") == "text":
+            parts.append(part.get("text", ""))
+        elif part.get("type") == "image_url":
+            parts.append("[image]")
+    return " ".join(parts)
+
+
+def content_tokens(content: Content) -> int:
+    if isinstance(content, str):
+        return estimate_tokens(content)
+    images = sum(1 for part in content if part.get("type") == "image_url")
+    text = " ".join(part.get("text", "") for part in content if part.get("type") == "text")
+    return estimate_tokens(text) + images * IMAGE_TOKEN_ESTIMATE
+
+
+def make_turn(user: Content, assistant: str) -> dict:
+    """A history entry with its token count computed once, when it is stored.
+
+    Only text is kept, so an image sent in this turn is never resent later.
+    """
+    user_text = content_text(user)
+    assistant_text = str(assistant)
+    return {
+        "user": user_text,
+        "assistant": assistant_text,
+        "tokens": estimate_tokens(user_text) + estimate_tokens(assistant_text) + 2 * MESSAGE_OVERHEAD_TOKENS,
+    }
+
+
+def _turn_tokens(turn: dict) -> int:
+    tokens = turn.get("tokens")
+    if tokens is None:
+        # Turns stored before token counts were cached.
+        tokens = make_turn(turn["user"], turn["assistant"])["tokens"]
+    return tokens
+
+
+def _clip(text: str, limit: int) -> str:
+    text = " ".join(text.split())
+    if len(text) <= limit:
+        return text
+    first = _SENTENCE_END.split(text, maxsplit=1)[0]
+    if len(first) <= limit:
+        return first
+    return text[:limit].rsplit(" ", 1)[0] + "…"
+
+
+def compact_turn(turn: dict) -> str:
+    return f"- Patient: {_clip(content_text(turn['user']), COMPACT_USER_CHARS)}\n" \
+           f"  Assistant: {_clip(str(turn['assistant']), COMPACT_ASSISTANT_CHARS)}"
+
+
+class PromptBuilder:
+    """Builds the chat messages for a WhatsApp turn within a token budget.
+
+    The system prompt and the new message always go in. History is added
+    newest first: the last ``PROMPT_VERBATIM_TURNS`` turns word for word while
+    they fit, then older turns as one-line summaries in a single system note,
+    and whatever still does not fit is left out. History holds text only, so
+    earlier images are never sent again. Token counts are cached per turn (in
+    the stored history) and per system prompt, so a build does no counting
+    beyond the new message.
+    """
+
+    def __init__(self, budget: int = PROMPT_TOKEN_BUDGET, verbatim_turns: int = PROMPT_VERBATIM_TURNS) -> None:
+        self.budget = budget
+        self.verbatim_turns = verbatim_turns
+        self._system_tokens: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.prompt_tokens = 0
+        self.full_tokens = 0
+        self.compacted_turns = 0
+        self.dropped_turns = 0
+        self.over_budget = 0
+
+    def _system_prompt_tokens(self, prompt: str) -> int:
+        tokens = self._system_tokens.get(prompt)
+        if tokens is None:
+            tokens = self._system_tokens[prompt] = estimate_tokens(prompt) + MESSAGE_OVERHEAD_TOKENS
+        return tokens
+
+    def build(self, system_prompt: str, history: List[dict], user_content: Content) -> Tuple[List[dict], int]:
+        """Return ``(messages, estimated prompt tokens)`` for one request."""
+        fixed = self._system_prompt_tokens(system_prompt) + content_tokens(user_content) + MESSAGE_OVERHEAD_TOKENS
+        remaining = self.budget - fixed
+        verbatim: List[dict] = []
+        compacted: List[str] = []
+        dropped = 0
+        summary_tokens = MESSAGE_OVERHEAD_TOKENS
+        for age, turn in enumerate(reversed(history)):
+            tokens = _turn_tokens(turn)
+            if age < self.verbatim_turns and not compacted and tokens <= remaining:
+                verbatim.append(turn)
+                remaining -= tokens
+                continue
+            line = compact_turn(turn)
+            line_tokens = estimate_tokens(line) + (summary_tokens if not compacted else 0)
+            if line_tokens <= remaining:
+                compacted.append(line)
+                remaining -= line_tokens
+            else:
+                dropped += 1
+
+        messages = [{"role": "system", "content": system_prompt}]
+        if compacted:
+            messages.append({
+                "role": "system",
+                "content": "Summary of earlier messages in this conversation:\n" + "\n".join(reversed(compacted)),
+            })
+        for turn in reversed(verbatim):
+            messages.append({"role": "user", "content": content_text(turn["user"])})
+            messages.append({"role": "assistant", "content": str(turn["assistant"])})
+        messages.append({"role": "user", "content": user_content})
+
+        used = self.budget - remaining
+        full = fixed + sum(_turn_tokens(turn) for turn in history)
+        with self._lock:
+            self.builds += 1
+            self.prompt_tokens += used
+            self.full_tokens += full
+            self.compacted_turns += len(compacted)
+            self.dropped_turns += dropped
+            self.over_budget += remaining < 0
+        if remaining < 0:
+            logger.warning(f"Prompt is {used} tokens before any history, over the {self.budget} token budget")
+        return messages, used
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "builds": self.builds,
+                "budget": self.budget,
+                "prompt_tokens": self.prompt_tokens,
+                "prompt_tokens_saved": self.full_tokens - self.prompt_tokens,
+                "avg_prompt_tokens": round(self.prompt_tokens / self.builds, 1) if self.builds else 0,
+                "compacted_turns": self.compacted_turns,
+                "dropped_turns": self.dropped_turns,
+                "over_budget": self.over_budget,
+            }
+
+
+_builder: Optional[PromptBuilder] = None
+_builder_lock = threading.Lock()
+
+
+def get_prompt_builder() -> PromptBuilder:
+    global _builder
+    if _builder is None:
+        with _builder_lock:
+            if _builder is None:
+                _builder = PromptBuilder()
+    return _builder
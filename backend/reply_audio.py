@@ -0,0 +1,302 @@
+import array
+import hashlib
+import io
+import logging
+import math
+import os
+import shutil
+import subprocess
+import threading
+import time
+import wave
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Optional
+
+from http_client import get_http_client
+from media import av, decode_audio, encode_opus
+
+logger = logging.getLogger(__name__)
+
+# Synthesized replies, named by content hash; /audio/<filename> serves them.
+AUDIO_CACHE_DIR = os.getenv("AUDIO_CACHE_DIR", "audio_files")
+AUDIO_CACHE_MAX_BYTES = int(os.getenv("AUDIO_CACHE_MAX_BYTES", str(500 * 1024 * 1024)))
+# Eviction goes down to this share of the cap, so it does not run again on the next write.
+AUDIO_CACHE_LOW_WATER = 0.9
+AUDIO_CACHE_EVICT_INTERVAL = float(os.getenv("AUDIO_CACHE_EVICT_INTERVAL", "300"))
+# Twilio fetches the media after the reply is sent, so new files are kept at least this long.
+AUDIO_CACHE_MIN_AGE = float(os.getenv("AUDIO_CACHE_MIN_AGE", "900"))
+# "google" (Cloud Text-to-Speech) or "local" (a stand-in that needs no account).
+TTS_BACKEND = os.getenv("TTS_BACKEND", "google")
+GOOGLE_TTS_HOST = "texttospeech.googleapis.com"
+# The local stand-in speaks at 16 kHz, which Opus encodes natively.
+LOCAL_TTS_SAMPLE_RATE = 16000
+
+
+def audio_key(text: str, backend: str, language_code: str, voice_name: str) -> str:
+    """Content address of a reply; any change to the text, voice or engine gets a new file."""
+    return hashlib.sha256("\0".join((backend, language_code, voice_name, text.strip())).encode("utf-8")).hexdigest()
+
+
+class TTSBackend(ABC):
+    """Turns reply text into audio WhatsApp can play, as a file with ``extension``."""
+
+    name = ""
+    extension = ""
+
+    @abstractmethod
+    def synthesize(self, text: str, language_code: str, voice_name: str) -> bytes:
+        ...
+
+
+class GoogleTTSBackend(TTSBackend):
+    """Google Cloud Text-to-Speech, as Ogg/Opus: WhatsApp plays it as a voice note."""
+
+    name = "google"
+    extension = "ogg"
+
+    def __init__(self) -> None:
+        from google.cloud import texttospeech
+
+        self._tts = texttospeech
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _get_client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._tts.TextToSpeechClient()
+        return self._client
+
+    def synthesize(self, text: str, language_code: str, voice_name: str) -> bytes:
+        with get_http_client().guard(GOOGLE_TTS_HOST):
+            response = self._get_client().synthesize_speech(
+                input=self._tts.SynthesisInput(text=text),
+                voice=self._tts.VoiceSelectionParams(language_code=language_code, name=voice_name),
+                audio_config=self._tts.AudioConfig(audio_encoding=self._tts.AudioEncoding.OGG_OPUS),
+            )
+        return response.audio_content
+
+
+class LocalTTSBackend(TTSBackend):
+    """Stand-in engine for development: espeak-ng when installed, else a short tone per word.
+
+    Output is Ogg/Opus when PyAV is available and WAV otherwise (which
+    WhatsApp will not play, but /audio still serves it).
+    """
+
+    name = "local"
+
+    def __init__(self) -> None:
+        self.extension = "ogg" if av is not None else "wav"
+        self._espeak = shutil.which("espeak-ng") or shutil.which("espeak")
+
+    def _speak(self, text: str, language_code: str) -> bytes:
+        """16-bit mono PCM at ``LOCAL_TTS_SAMPLE_RATE``."""
+        if self._espeak and av is not None:
+            voice = language_code.split("-")[0].lower()
+            spoken = subprocess.run([self._espeak, "-v", voice, "--stdout", text], capture_output=True,
+                                    timeout=60, check=True).stdout
+            return decode_audio(spoken, LOCAL_TTS_SAMPLE_RATE)
+        samples = array.array("h")
+        for word in text.split():
+            pitch = 180 + int(hashlib.blake2b(word.encode("utf-8"), digest_size=1).digest()[0])
+            length = int(LOCAL_TTS_SAMPLE_RATE * min(0.4, 0.06 + 0.03 * len(word)))
+            samples.extend(int(6000 * math.sin(math.pi * i / length) * math.sin(2 * math.pi * pitch * i / LOCAL_TTS_SAMPLE_RATE))
+                           for i in range(length))
+            samples.extend([0] * int(LOCAL_TTS_SAMPLE_RATE * 0.08))
+        return samples.tobytes()
+
+    def synthesize(self, text: str, language_code: str, voice_name: str) -> bytes:
+        pcm = self._speak(text, language_code)
+        if av is not None:
+            return encode_opus(pcm, LOCAL_TTS_SAMPLE_RATE)
+        out = io.BytesIO()
+        with wave.open(out, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(LOCAL_TTS_SAMPLE_RATE)
+            wav.writeframes(pcm)
+        return out.getvalue()
+
+
+TTS_BACKENDS: Dict[str, Callable[[], TTSBackend]] = {
+    "google": GoogleTTSBackend,
+    "local": LocalTTSBackend,
+}
+
+
+class AudioCache:
+    """Synthesized reply audio on disk, named by a hash of the text, language, voice and engine.
+
+    ``get_or_synthesize`` returns the file name for a reply, calling the TTS
+    backend only on a miss; concurrent requests for the same reply in a
+    process wait for one synthesis. Files are written under a temporary name
+    and renamed, so every worker sharing the directory sees whole files, and
+    a file never changes once written. Each use sets the file's access time;
+    a background thread deletes the least recently used files once the
+    directory passes ``max_bytes``, sparing any younger than ``min_age`` that
+    Twilio may still be about to fetch.
+    """
+
+    def __init__(self, backend: TTSBackend, directory: str = AUDIO_CACHE_DIR, max_bytes: int = AUDIO_CACHE_MAX_BYTES,
+                 min_age: float = AUDIO_CACHE_MIN_AGE, evict_interval: float = AUDIO_CACHE_EVICT_INTERVAL) -> None:
+        self.backend = backend
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.min_age = min_age
+        self.evict_interval = evict_interval
+        os.makedirs(directory, exist_ok=True)
+        self._key_locks = [threading.Lock() for _ in range(32)]
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+        self.synthesis_seconds = 0.0
+        self.evicted = 0
+        self.evicted_bytes = 0
+        self.total_bytes = 0
+        self.files = 0
+        self.evict()
+        threading.Thread(target=self._evict_loop, name="audio-cache-evict", daemon=True).start()
+
+    def filename(self, text: str, language_code: str, voice_name: str) -> str:
+        return f"{audio_key(text, self.backend.name, language_code, voice_name)}.{self.backend.extension}"
+
+    def touch(self, filename: str) -> bool:
+        """Mark a cached file as used now; False if it is not there."""
+        path = os.path.join(self.directory, filename)
+        try:
+            # Only the access time moves; the modification time is when the file was made.
+            os.utime(path, (time.time(), os.stat(path).st_mtime))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def get_or_synthesize(self, text: str, language_code: str, voice_name: str) -> str:
+        filename = self.filename(text, language_code, voice_name)
+        if self.touch(filename):
+            with self._lock:
+                self.hits += 1
+            return filename
+        with self._key_locks[int(filename[:8], 16) % len(self._key_locks)]:
+            # Another request may have synthesized it while this one waited.
+            if self.touch(filename):
+                with self._lock:
+                    self.hits += 1
+                return filename
+            started = time.perf_counter()
+            try:
+                audio = self.backend.synthesize(text, language_code, voice_name)
+            except Exception:
+                with self._lock:
+                    self.failures += 1
+                raise
+            path = os.path.join(self.directory, filename)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(audio)
+            os.replace(tmp_path, path)
+        with self._lock:
+            self.misses += 1
+            self.synthesis_seconds += time.perf_counter() - started
+            self.total_bytes += len(audio)
+            self.files += 1
+            over = self.total_bytes > self.max_bytes
+        if over:
+            self._wake.set()
+        logger.info(f"Synthesized {len(text)} characters to {filename} ({len(audio) // 1024} KB)")
+        return filename
+
+    def evict(self) -> int:
+        """Delete least recently used files until the directory is under the low-water mark; return how many."""
+        now = time.time()
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if not entry.is_file():
+                    continue
+                if entry.name.endswith(".tmp"):
+                    # Left behind by a worker that died mid-write.
+                    if now - stat.st_mtime > 3600:
+                        self._remove(entry.path)
+                    continue
+                total += stat.st_size
+                entries.append((stat.st_atime, stat.st_mtime, stat.st_size, entry.path))
+        removed = removed_bytes = 0
+        if total > self.max_bytes:
+            target = self.max_bytes * AUDIO_CACHE_LOW_WATER
+            for _, created, size, path in sorted(entries):
+                if total <= target:
+                    break
+                if now - created < self.min_age:
+                    continue
+                if self._remove(path):
+                    total -= size
+                    removed += 1
+                    removed_bytes += size
+            if total > self.max_bytes:
+                logger.warning(f"Audio cache is {total // 1024 // 1024} MB, over its cap, with files still being fetched")
+        with self._lock:
+            self.total_bytes = total
+            self.files = len(entries) - removed
+            self.evicted += removed
+            self.evicted_bytes += removed_bytes
+        if removed:
+            logger.info(f"Evicted {removed} cached audio files ({removed_bytes // 1024} KB)")
+        return removed
+
+    @staticmethod
+    def _remove(path: str) -> bool:
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _evict_loop(self) -> None:
+        while True:
+            self._wake.wait(self.evict_interval)
+            self._wake.clear()
+            try:
+                self.evict()
+            except Exception as e:
+                logger.error(f"Audio cache eviction failed: {str(e)}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": self.backend.name,
+                "files": self.files,
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "failures": self.failures,
+                "avg_synthesis_seconds": round(self.synthesis_seconds / self.misses, 3) if self.misses else 0.0,
+                "evicted": self.evicted,
+                "evicted_bytes": self.evicted_bytes,
+            }
+
+
+_cache: Optional[AudioCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_audio_cache() -> AudioCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                if TTS_BACKEND not in TTS_BACKENDS:
+                    raise ValueError(f"Unknown TTS_BACKEND {TTS_BACKEND!r}; use one of {sorted(TTS_BACKENDS)}")
+                _cache = AudioCache(TTS_BACKENDS[TTS_BACKEND]())
+    return _cache
@@ -0,0 +1,486 @@
+"""Append-only injury report log: JSONL segments with a sender/time index.
+
+Each process appends to its own segment (segment-<start ms>-<pid>.jsonl), so
+several gunicorn workers never share a file, and holds an flock on it while it
+is open; a plain segment nobody holds is left over from a dead process and is
+compressed on the next start. A segment is closed at
+REPORT_SEGMENT_BYTES and compressed in the background into independent gzip
+members of about REPORT_BLOCK_BYTES, so one report can be read back by
+decompressing a single block. Writes reach the OS at once; fsync runs in
+batches, at most REPORT_FSYNC_INTERVAL seconds or REPORT_FSYNC_EVERY reports
+apart, and a report only enters the index (index.db, SQLite) after the fsync
+that made it durable.
+
+    python report_log.py import [--dir injury_reports] [--delete]
+    python report_log.py query [--sender whatsapp:+91...] [--since 2025-06-01] [--until ...] [--limit 20]
+    python report_log.py reindex
+"""
+import argparse
+import glob
+import gzip
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: orphaned segments are found by PID instead.
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+REPORT_LOG_DIR = os.getenv("REPORT_LOG_DIR", "injury_reports")
+REPORT_SEGMENT_BYTES = int(os.getenv("REPORT_SEGMENT_BYTES", str(8 * 1024 * 1024)))
+REPORT_BLOCK_BYTES = 64 * 1024
+REPORT_FSYNC_INTERVAL = float(os.getenv("REPORT_FSYNC_INTERVAL", "1.0"))
+REPORT_FSYNC_EVERY = int(os.getenv("REPORT_FSYNC_EVERY", "32"))
+INDEX_NAME = "index.db"
+# Index rows for reports still in a plain .jsonl segment hold the byte offset
+# of the line in ``block`` and this in ``line``.
+RAW_LINE = -1
+
+IndexRow = Tuple[str, float, int, int, int]
+
+
+def report_time(report: dict) -> float:
+    try:
+        return datetime.fromisoformat(report["timestamp"]).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return time.time()
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _try_lock(f) -> bool:
+    """Take an exclusive lock on ``f`` without waiting; False while another handle holds it."""
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+def _read_member(f, offset: int) -> Tuple[List[bytes], int]:
+    """Decompress the gzip member at ``offset``; return its lines and where the next member starts."""
+    f.seek(offset)
+    decompressor = zlib.decompressobj(wbits=31)
+    parts = []
+    while not decompressor.eof:
+        chunk = f.read(16 * 1024)
+        if not chunk:
+            raise EOFError(f"Truncated block at {offset} in {f.name}")
+        parts.append(decompressor.decompress(chunk))
+    return b"".join(parts).splitlines(), f.tell() - len(decompressor.unused_data)
+
+
+def _read_block(path: str, offset: int) -> List[bytes]:
+    with open(path, "rb") as f:
+        return _read_member(f, offset)[0]
+
+
+class ReportLog:
+    """Injury reports appended to rotated, compressed JSONL segments."""
+
+    def __init__(self, directory: str = REPORT_LOG_DIR, segment_bytes: int = REPORT_SEGMENT_BYTES,
+                 fsync_interval: float = REPORT_FSYNC_INTERVAL, fsync_every: int = REPORT_FSYNC_EVERY) -> None:
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync_interval = fsync_interval
+        self.fsync_every = fsync_every
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._file = None
+        self._segment_id: Optional[int] = None
+        self._size = 0
+        # Index rows whose reports are written but not yet fsynced.
+        self._unsynced: List[IndexRow] = []
+        self._wakeup = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        self._compressor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="report-compress")
+        self.appended = 0
+        self.fsyncs = 0
+        self.rotations = 0
+        conn = self._index()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS segments (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT UNIQUE NOT NULL,
+                compressed INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS reports (
+                sender TEXT NOT NULL,
+                ts REAL NOT NULL,
+                segment INTEGER NOT NULL,
+                block INTEGER NOT NULL,
+                line INTEGER NOT NULL,
+                PRIMARY KEY (sender, ts, segment, block, line)
+            ) WITHOUT ROWID
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_reports_ts ON reports(ts)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_reports_segment ON reports(segment)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS imported_files (
+                name TEXT NOT NULL,
+                mtime REAL NOT NULL,
+                PRIMARY KEY (name, mtime)
+            )
+        """)
+        self._recover()
+
+    def _index(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(os.path.join(self.directory, INDEX_NAME), timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _recover(self) -> None:
+        """Compress segments left behind by processes that are gone."""
+        for path in glob.glob(os.path.join(self.directory, "segment-*.jsonl")):
+            if self._orphaned(path):
+                self._compressor.submit(self._compress, os.path.basename(path))
+
+    @staticmethod
+    def _orphaned(path: str) -> bool:
+        if fcntl is None:
+            pid = int(os.path.basename(path).rsplit("-", 1)[1].split(".")[0])
+            return pid != os.getpid() and not _pid_alive(pid)
+        # PIDs repeat across container restarts; the lock dies with its process.
+        try:
+            with open(path, "rb") as f:
+                return _try_lock(f)
+        except FileNotFoundError:
+            return False
+
+    # Writing
+
+    def _open_segment(self) -> None:
+        name = f"segment-{int(time.time() * 1000)}-{os.getpid()}.jsonl"
+        self._file = open(os.path.join(self.directory, name), "ab")
+        _try_lock(self._file)
+        self._size = 0
+        conn = self._index()
+        with conn:
+            self._segment_id = conn.execute("INSERT INTO segments (name) VALUES (?)", (name,)).lastrowid
+
+    def append(self, report: dict) -> None:
+        line = json.dumps(report, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+        with self._lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name="report-fsync", daemon=True)
+                self._flusher.start()
+            if self._file is None:
+                self._open_segment()
+            offset = self._size
+            self._file.write(line)
+            self._file.flush()
+            self._size += len(line)
+            self._unsynced.append((report.get("sender", ""), report_time(report), self._segment_id, offset, RAW_LINE))
+            self.appended += 1
+            rotate = self._size >= self.segment_bytes
+            if len(self._unsynced) >= self.fsync_every:
+                self._wakeup.set()
+        if rotate:
+            self.rotate()
+
+    def _sync_locked(self) -> List[IndexRow]:
+        if self._file is not None and self._unsynced:
+            os.fsync(self._file.fileno())
+            self.fsyncs += 1
+        rows, self._unsynced = self._unsynced, []
+        return rows
+
+    def _write_index(self, rows: List[IndexRow]) -> None:
+        if rows:
+            conn = self._index()
+            with conn:
+                conn.executemany("INSERT OR IGNORE INTO reports VALUES (?, ?, ?, ?, ?)", rows)
+
+    def flush(self) -> None:
+        """fsync what has been appended and index it."""
+        # The index is written under the lock too: rows for a plain segment
+        # must all be in before rotate() hands that segment to _compress.
+        with self._lock:
+            self._write_index(self._sync_locked())
+
+    def _flush_loop(self) -> None:
+        while True:
+            self._wakeup.wait(self.fsync_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Report log fsync failed: {e}", exc_info=True)
+
+    def rotate(self) -> None:
+        """Close the current segment and compress it in the background."""
+        with self._lock:
+            if self._file is None:
+                return
+            rows = self._sync_locked()
+            name = os.path.basename(self._file.name)
+            self._file.close()
+            self._file = None
+            self.rotations += 1
+        self._write_index(rows)
+        self._compressor.submit(self._compress, name)
+
+    def _compress(self, name: str) -> None:
+        try:
+            src = open(os.path.join(self.directory, name), "rb")
+        except FileNotFoundError:
+            # Another process recovering the same orphan got there first.
+            return
+        with src:
+            # The lock keeps out the writer and any other process compressing
+            # it; one that finished already has unlinked the file.
+            if not _try_lock(src) or os.fstat(src.fileno()).st_nlink == 0:
+                return
+            self._compress_locked(name, src, self._index())
+
+    def _compress_locked(self, name: str, src, conn: sqlite3.Connection) -> None:
+        path = os.path.join(self.directory, name)
+        target = path + ".gz"
+        partial = f"{target}.{os.getpid()}.tmp"
+        rows = []
+        row = conn.execute("SELECT id FROM segments WHERE name = ?", (name,)).fetchone()
+        segment_id = row[0] if row else conn.execute("INSERT INTO segments (name) VALUES (?)", (name,)).lastrowid
+        try:
+            with open(partial, "wb") as dst:
+                block: List[bytes] = []
+                block_bytes = 0
+
+                def write_block():
+                    offset = dst.tell()
+                    for number, raw in enumerate(block):
+                        report = json.loads(raw)
+                        rows.append((report.get("sender", ""), report_time(report), segment_id, offset, number))
+                    dst.write(gzip.compress(b"".join(block)))
+
+                for raw in src:
+                    if not raw.endswith(b"\n"):
+                        logger.warning(f"Dropping a torn record at the end of {name}")
+                        break
+                    try:
+                        json.loads(raw)
+                    except ValueError:
+                        logger.warning(f"Skipping an unreadable record in {name}")
+                        continue
+                    block.append(raw)
+                    block_bytes += len(raw)
+                    if block_bytes >= REPORT_BLOCK_BYTES:
+                        write_block()
+                        block, block_bytes = [], 0
+                if block:
+                    write_block()
+                dst.flush()
+                os.fsync(dst.fileno())
+            os.replace(partial, target)
+            # Re-index from the file itself, which also picks up reports a
+            # crashed process wrote but never indexed.
+            with conn:
+                conn.execute("DELETE FROM reports WHERE segment = ?", (segment_id,))
+                conn.executemany("INSERT OR IGNORE INTO reports VALUES (?, ?, ?, ?, ?)", rows)
+                conn.execute("UPDATE segments SET name = ?, compressed = 1 WHERE id = ?",
+                             (os.path.basename(target), segment_id))
+            os.remove(path)
+            logger.info(f"Compressed {name}: {len(rows)} reports, {os.path.getsize(target) // 1024} KB")
+        except FileNotFoundError:
+            # Another process recovering the same orphan got there first.
+            if os.path.exists(partial):
+                os.remove(partial)
+        except Exception as e:
+            logger.error(f"Compressing {name} failed: {e}", exc_info=True)
+
+    def close(self) -> None:
+        self.rotate()
+        self._compressor.shutdown(wait=True)
+
+    # Reading
+
+    def query(self, sender: Optional[str] = None, since: Optional[float] = None, until: Optional[float] = None,
+              limit: Optional[int] = 100) -> List[dict]:
+        """Reports by sender and/or time range (epoch seconds), oldest first."""
+        self.flush()
+        for attempt in range(2):
+            try:
+                return list(self._query(sender, since, until, limit))
+            except FileNotFoundError:
+                # A segment was compressed between the index lookup and the read.
+                if attempt:
+                    raise
+        return []
+
+    def _query(self, sender, since, until, limit) -> Iterator[dict]:
+        clauses, params = [], []
+        if sender is not None:
+            clauses.append("r.sender = ?")
+            params.append(sender)
+        if since is not None:
+            clauses.append("r.ts >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("r.ts < ?")
+            params.append(until)
+        sql = "SELECT s.name, r.block, r.line FROM reports r JOIN segments s ON s.id = r.segment"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY r.ts"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        rows = self._index().execute(sql, params).fetchall()
+        blocks = defaultdict(list)
+        for name, block, line in rows:
+            if line != RAW_LINE:
+                blocks[(name, block)].append(line)
+        decoded = {key: _read_block(os.path.join(self.directory, key[0]), key[1]) for key in blocks}
+        handles = {}
+        try:
+            for name, block, line in rows:
+                if line != RAW_LINE:
+                    yield json.loads(decoded[(name, block)][line])
+                    continue
+                if name not in handles:
+                    handles[name] = open(os.path.join(self.directory, name), "rb")
+                handles[name].seek(block)
+                yield json.loads(handles[name].readline())
+        finally:
+            for handle in handles.values():
+                handle.close()
+
+    def stats(self) -> dict:
+        segments, compressed = self._index().execute(
+            "SELECT COUNT(*), COALESCE(SUM(compressed), 0) FROM segments"
+        ).fetchone()
+        with self._lock:
+            return {"appended": self.appended, "unsynced": len(self._unsynced), "fsyncs": self.fsyncs,
+                    "rotations": self.rotations, "segments": segments, "compressed_segments": compressed}
+
+    # Maintenance
+
+    def import_files(self, directory: str, delete: bool = False) -> int:
+        """Append the old one-file-per-report JSON files in ``directory``, oldest first.
+
+        Each file is recorded in the index by name and mtime and skipped on
+        later runs, so the import can be repeated or resumed safely.
+        """
+        conn = self._index()
+        done = set(conn.execute("SELECT name, mtime FROM imported_files"))
+        reports, skipped = [], []
+        for path in glob.glob(os.path.join(directory, "report_*.json")):
+            try:
+                key = (os.path.basename(path), os.path.getmtime(path))
+                if key in done:
+                    skipped.append(path)
+                    continue
+                with open(path, "r") as f:
+                    reports.append((path, key, json.load(f)))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping {path}: {e}")
+        reports.sort(key=lambda item: report_time(item[2]))
+        for _, _, report in reports:
+            self.append(report)
+        self.flush()
+        with conn:
+            conn.executemany("INSERT OR IGNORE INTO imported_files VALUES (?, ?)", [key for _, key, _ in reports])
+        if skipped:
+            logger.info(f"Skipped {len(skipped)} files imported earlier")
+        if delete:
+            for path in skipped + [path for path, _, _ in reports]:
+                os.remove(path)
+        return len(reports)
+
+    def reindex(self) -> int:
+        """Rebuild the index of every compressed segment from the files, then compress any plain ones."""
+        self.rotate()
+        names = [os.path.basename(path) for path in glob.glob(os.path.join(self.directory, "segment-*.jsonl.gz"))]
+        conn = self._index()
+        for name in names:
+            path = os.path.join(self.directory, name)
+            rows = []
+            with conn:
+                row = conn.execute("SELECT id FROM segments WHERE name = ?", (name,)).fetchone()
+                segment_id = row[0] if row else conn.execute(
+                    "INSERT INTO segments (name, compressed) VALUES (?, 1)", (name,)
+                ).lastrowid
+                with open(path, "rb") as f:
+                    offset, size = 0, os.path.getsize(path)
+                    while offset < size:
+                        lines, next_offset = _read_member(f, offset)
+                        for number, raw in enumerate(lines):
+                            report = json.loads(raw)
+                            rows.append((report.get("sender", ""), report_time(report), segment_id, offset, number))
+                        offset = next_offset
+                conn.execute("DELETE FROM reports WHERE segment = ?", (segment_id,))
+                conn.executemany("INSERT OR IGNORE INTO reports VALUES (?, ?, ?, ?, ?)", rows)
+        for path in glob.glob(os.path.join(self.directory, "segment-*.jsonl")):
+            self._compressor.submit(self._compress, os.path.basename(path))
+        return len(names)
+
+
+_log: Optional[ReportLog] = None
+_log_lock = threading.Lock()
+
+
+def get_report_log() -> ReportLog:
+    global _log
+    if _log is None:
+        with _log_lock:
+            if _log is None:
+                _log = ReportLog()
+    return _log
+
+
+def _parse_time(value: Optional[str]) -> Optional[float]:
+    return datetime.fromisoformat(value).timestamp() if value else None
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--log-dir", default=REPORT_LOG_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+    importer = commands.add_parser("import", help="append the old report_*.json files")
+    importer.add_argument("--dir", default="injury_reports")
+    importer.add_argument("--delete", action="store_true", help="remove each file once imported")
+    query = commands.add_parser("query", help="print reports as JSON lines")
+    query.add_argument("--sender")
+    query.add_argument("--since", help="ISO date or time")
+    query.add_argument("--until", help="ISO date or time")
+    query.add_argument("--limit", type=int, default=20)
+    commands.add_parser("reindex", help="rebuild the index from the segments")
+    args = parser.parse_args()
+
+    log = ReportLog(args.log_dir)
+    if args.command == "import":
+        print(f"Imported {log.import_files(args.dir, delete=args.delete)} reports")
+    elif args.command == "query":
+        for report in log.query(args.sender, _parse_time(args.since), _parse_time(args.until), args.limit):
+            print(json.dumps(report, ensure_ascii=False))
+    else:
+        print(f"Re-indexed {log.reindex()} compressed segments")
+    log.close()
@@ -0,0 +1,249 @@
+import hashlib
+import logging
+import os
+import random
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "2000"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", str(6 * 3600)))
+# Jaccard similarity of character shingles needed to reuse an answer for a
+# differently worded question. On its own this cannot tell a typo ("visting
+# hours", 0.80) from a different question ("ICU visiting hours", 0.79), so the
+# content words of both questions must also pair up (see ``_same_words``).
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.7"))
+SHINGLE_SIZE = 3
+# MinHash signature of BANDS x ROWS values; two questions become candidates
+# when any band matches, which happens ~99% of the time at 0.7 similarity.
+MINHASH_BANDS = 16
+MINHASH_ROWS = 4
+# Questions longer than this are rarely repeated word for word and are not cached.
+MAX_CACHED_QUESTION_CHARS = 300
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(1729)
+_HASH_PARAMS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(MINHASH_BANDS * MINHASH_ROWS)]
+
+# Words that point back at earlier messages; such a question means something
+# different mid-conversation, so it is only answered from cache at the start.
+FOLLOW_UP_WORDS = {
+    "it", "its", "that", "this", "those", "these", "they", "them", "there", "also", "again", "same", "else",
+    "more", "above", "earlier", "before", "previous", "instead", "then", "and", "but", "what about", "how about",
+    "यह", "वह", "ये", "वो", "इसका", "उसका", "इसे", "उसे", "और", "फिर", "भी",
+}
+# Matched on whitespace-separated words: ``\b`` does not see a word boundary
+# after a Devanagari vowel sign, so a regex misses "वो" and "उसे".
+_FOLLOW_UP_PHRASES = tuple(f" {phrase} " for phrase in FOLLOW_UP_WORDS if " " in phrase)
+_DIGITS = re.compile(r"\d+")
+# Words that can differ between two phrasings of the same question.
+STOP_WORDS = {
+    "a", "an", "the", "is", "are", "am", "was", "do", "does", "did", "can", "could", "will", "would", "i", "you",
+    "your", "my", "me", "we", "our", "of", "for", "to", "in", "on", "at", "please", "tell", "know", "want",
+    "what", "whats", "how", "where", "when", "which", "kindly", "hi", "hello",
+    "क्या", "है", "हैं", "के", "की", "का", "में", "से", "को", "मुझे", "आप", "कृपया",
+}
+
+
+def normalize(text: str) -> str:
+    """Case-fold, drop punctuation and symbols, and collapse whitespace."""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = "".join(" " if unicodedata.category(char)[0] in "PSZ" else char for char in text)
+    return " ".join(text.split())
+
+
+def looks_standalone(normalized: str) -> bool:
+    if not FOLLOW_UP_WORDS.isdisjoint(normalized.split()):
+        return False
+    padded = f" {normalized} "
+    return not any(phrase in padded for phrase in _FOLLOW_UP_PHRASES)
+
+
+def _content_words(normalized: str) -> FrozenSet[str]:
+    return frozenset(word for word in normalized.split() if word not in STOP_WORDS)
+
+
+def _one_edit(a: str, b: str) -> bool:
+    """Whether ``a`` and ``b`` differ by at most one insertion, deletion or substitution."""
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    return a[i + (len(a) == len(b)):] == b[i + 1:]
+
+
+def _same_words(a: FrozenSet[str], b: FrozenSet[str]) -> bool:
+    """Every content word of each question matches one in the other, allowing a typo in longer words."""
+    def covered(words, others):
+        return all(word in others or (len(word) >= 5 and not _DIGITS.search(word)
+                                      and any(_one_edit(word, other) for other in others))
+                   for word in words)
+    return covered(a - b, b) and covered(b - a, a)
+
+
+def _shingles(normalized: str) -> FrozenSet[int]:
+    padded = f" {normalized} "
+    grams = {padded[i:i + SHINGLE_SIZE] for i in range(max(1, len(padded) - SHINGLE_SIZE + 1))}
+    return frozenset(int.from_bytes(hashlib.blake2b(gram.encode("utf-8"), digest_size=8).digest(), "big") for gram in grams)
+
+
+def _bands(shingles: FrozenSet[int]) -> List[Tuple[int, Tuple[int, ...]]]:
+    signature = [min((a * shingle + b) % _PRIME for shingle in shingles) for a, b in _HASH_PARAMS]
+    return [(band, tuple(signature[band * MINHASH_ROWS:(band + 1) * MINHASH_ROWS])) for band in range(MINHASH_BANDS)]
+
+
+class _Entry:
+    __slots__ = ("key", "response", "shingles", "bands", "words", "created_at", "latency")
+
+    def __init__(self, key, response, shingles, bands, words, latency):
+        self.key = key
+        self.response = response
+        self.shingles = shingles
+        self.bands = bands
+        self.words = words
+        self.created_at = time.monotonic()
+        self.latency = latency
+
+
+class ResponseCache:
+    """Answers to repeated stand-alone questions, reused instead of calling the LLM.
+
+    Entries are keyed on the normalized question, the chat language and the
+    prompt version, so editing the prompt retires every old answer. A lookup
+    tries the exact key first, then near-duplicates found through MinHash
+    LSH over character shingles and confirmed by their exact Jaccard
+    similarity; their content words must also pair up, allowing for typos
+    but not in numbers. Entries expire after ``ttl`` and the least recently
+    used are evicted beyond ``max_entries``.
+
+    Callers decide what is cacheable: injury turns and anything with media
+    are never stored or served, and only answers given without history are
+    stored.
+    """
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_SIZE, ttl: float = RESPONSE_CACHE_TTL,
+                 threshold: float = NEAR_DUPLICATE_THRESHOLD) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self._entries: "OrderedDict[Tuple[str, str, str], _Entry]" = OrderedDict()
+        self._buckets: Dict[Tuple[str, str, int, Tuple[int, ...]], Set[Tuple[str, str, str]]] = {}
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self.stores = 0
+        self.evictions = 0
+        self.saved_seconds = 0.0
+
+    def _remove(self, key) -> None:
+        entry = self._entries.pop(key)
+        language, version = key[1], key[2]
+        for band, values in entry.bands:
+            bucket = self._buckets.get((language, version, band, values))
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[(language, version, band, values)]
+
+    def _live(self, key) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry.created_at > self.ttl:
+            self._remove(key)
+            return None
+        return entry
+
+    def get(self, question: str, language: str, version: str, has_history: bool = False) -> Optional[str]:
+        normalized = normalize(question)
+        if not normalized or len(normalized) > MAX_CACHED_QUESTION_CHARS or (has_history and not looks_standalone(normalized)):
+            with self._lock:
+                self.skipped += 1
+            return None
+        key = (normalized, language, version)
+        with self._lock:
+            entry = self._live(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                self.saved_seconds += entry.latency
+                return entry.response
+        # Signatures are computed outside the lock; they are the costly part.
+        shingles = _shingles(normalized)
+        bands = _bands(shingles)
+        words = _content_words(normalized)
+        with self._lock:
+            best, best_score = None, self.threshold
+            candidates = set()
+            for band, values in bands:
+                candidates |= self._buckets.get((language, version, band, values), set())
+            for candidate in candidates:
+                entry = self._live(candidate)
+                if entry is None:
+                    continue
+                score = len(shingles & entry.shingles) / len(shingles | entry.shingles)
+                if score >= best_score and _same_words(words, entry.words):
+                    best, best_score = entry, score
+            if best is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best.key)
+            self.near_hits += 1
+            self.saved_seconds += best.latency
+            logger.info(f"Answered {question!r} from cache ({best_score:.2f} like {best.key[0]!r})")
+            return best.response
+
+    def put(self, question: str, language: str, version: str, response: str, latency: float) -> None:
+        normalized = normalize(question)
+        if not normalized or len(normalized) > MAX_CACHED_QUESTION_CHARS:
+            return
+        key = (normalized, language, version)
+        shingles = _shingles(normalized)
+        entry = _Entry(key, response, shingles, _bands(shingles), _content_words(normalized), latency)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            for band, values in entry.bands:
+                self._buckets.setdefault((language, version, band, values), set()).add(key)
+            self.stores += 1
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.exact_hits + self.near_hits
+            lookups = hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "near_duplicate_hits": self.near_hits,
+                "misses": self.misses,
+                "skipped": self.skipped,
+                "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+                "llm_seconds_saved": round(self.saved_seconds, 2),
+                "stores": self.stores,
+                "evictions": self.evictions,
+            }
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache()
+    return _cache
@@ -0,0 +1,385 @@
+import bisect
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+
+from db import Database, get_database
+from doctors import Doctor, DoctorDirectory, get_doctor_directory
+
+logger = logging.getLogger("nurse-assistant")
+
+SLOT_MINUTES = int(os.getenv("APPOINTMENT_SLOT_MINUTES", "30"))
+WORKING_HOURS = ("09:00", "17:00")
+SUGGESTION_SEARCH_DAYS = 7
+# Suggestions may read an index this old before checking the change log;
+# bookings always catch up inside their write transaction.
+SLOT_INDEX_TTL = float(os.getenv("SLOT_INDEX_TTL", "5"))
+# Rows of appointment_changes kept behind the newest; a worker further behind
+# than this rereads the upcoming appointments instead.
+SLOT_CHANGES_KEPT = int(os.getenv("SLOT_CHANGES_KEPT", "10000"))
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def _minute_of_day(preferred_time: str) -> int:
+    moment = datetime.strptime(preferred_time, "%H:%M")
+    return moment.hour * 60 + moment.minute
+
+
+def _slot_key(preferred_date: str, preferred_time: str) -> int:
+    """Minutes since the proleptic epoch, so slots on every date share one sorted axis."""
+    day = datetime.strptime(preferred_date, "%Y-%m-%d").toordinal()
+    return day * MINUTES_PER_DAY + _minute_of_day(preferred_time)
+
+
+def _slot_label(key: int) -> Tuple[str, str]:
+    day, minute = divmod(key, MINUTES_PER_DAY)
+    return date.fromordinal(day).isoformat(), f"{minute // 60:02d}:{minute % 60:02d}"
+
+
+def _time_label(minute: int) -> str:
+    if minute < 0:
+        return ""
+    if minute >= MINUTES_PER_DAY:
+        return "99:99"
+    return f"{minute // 60:02d}:{minute % 60:02d}"
+
+
+@dataclass
+class Reservation:
+    booking_id: int
+    doctor_id: int
+    doctor_name: str
+    specialty: str
+    preferred_date: str
+    preferred_time: str
+
+
+class AppointmentScheduler:
+    """Books appointments against an in-memory index of taken slots.
+
+    The index maps each doctor to a sorted list of booked slot starts, so a
+    conflict check or a doctor's load for a day is a pair of bisections. A
+    booking picks the least-loaded free doctor of the specialty from the index,
+    then re-checks and inserts inside one ``BEGIN IMMEDIATE`` transaction; the
+    database stays authoritative when another worker process got there first.
+
+    Triggers on ``appointments`` append every slot taken or freed to
+    ``appointment_changes``; the index replays the rows past the last one it
+    applied, so bookings, moves and cancellations made by other processes are
+    seen at the cost of the rows themselves. Upcoming appointments are only
+    reread on first use, or by a worker that fell more than
+    ``SLOT_CHANGES_KEPT`` rows behind, and outside the write lock. Writes
+    catch up again under the write lock; suggestions do once the index is
+    ``SLOT_INDEX_TTL`` seconds old.
+    """
+
+    def __init__(self, db: Optional[Database] = None, directory: Optional[DoctorDirectory] = None) -> None:
+        self._db = db
+        self._directory = directory
+        self._slots: Dict[int, List[int]] = {}
+        # Last appointment_changes row applied; None until the index is built.
+        self._seq: Optional[int] = None
+        self._checked_at = float("-inf")
+        self._lock = threading.Lock()
+
+    @property
+    def db(self) -> Database:
+        return self._db or get_database()
+
+    @property
+    def directory(self) -> DoctorDirectory:
+        return self._directory or get_doctor_directory()
+
+    def _ensure_loaded(self, conn, max_age: float = SLOT_INDEX_TTL) -> None:
+        """Apply the appointment changes made since the index last caught up.
+
+        With ``max_age=0`` the log is always read, which inside a write
+        transaction makes the index exact until the transaction ends.
+        """
+        with self._lock:
+            if self._seq is not None and time.monotonic() - self._checked_at < max_age:
+                return
+            if self._seq is not None:
+                first = conn.execute("SELECT MIN(seq) FROM appointment_changes").fetchone()[0]
+                # Otherwise rows this worker never applied have been pruned.
+                if first is None or first <= self._seq + 1:
+                    self._replay(conn)
+                    return
+            self._rebuild(conn)
+
+    def _replay(self, conn) -> None:
+        rows = conn.execute(
+            "SELECT seq, doctor_id, preferred_date, preferred_time, delta FROM appointment_changes "
+            "WHERE seq > ? ORDER BY seq",
+            (self._seq,)
+        ).fetchall()
+        for _, doctor_id, preferred_date, preferred_time, delta in rows:
+            try:
+                key = _slot_key(preferred_date, preferred_time)
+            except ValueError:
+                continue
+            if delta > 0:
+                self._add(doctor_id, key)
+            else:
+                self._remove(doctor_id, key)
+        if rows:
+            self._seq = rows[-1][0]
+        self._checked_at = time.monotonic()
+
+    def _rebuild(self, conn) -> None:
+        # One read snapshot for both, so no change is missed or applied twice.
+        own_snapshot = not conn.in_transaction
+        if own_snapshot:
+            conn.execute("BEGIN")
+        try:
+            seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM appointment_changes").fetchone()[0]
+            rows = conn.execute(
+                "SELECT doctor_id, preferred_date, preferred_time FROM appointments WHERE preferred_date >= ?",
+                (date.today().isoformat(),)
+            ).fetchall()
+        finally:
+            if own_snapshot:
+                conn.commit()
+        slots: Dict[int, List[int]] = {}
+        for doctor_id, preferred_date, preferred_time in rows:
+            try:
+                slots.setdefault(doctor_id, []).append(_slot_key(preferred_date, preferred_time))
+            except ValueError:
+                continue
+        for booked in slots.values():
+            booked.sort()
+        self._slots = slots
+        self._seq = seq
+        self._checked_at = time.monotonic()
+        logger.info(f"Appointment slot index loaded with {len(rows)} upcoming bookings at change {seq}")
+
+    def _wrote(self, conn) -> None:
+        """Move past the change rows of this transaction's own write, already applied to the index."""
+        seq = conn.execute("SELECT MAX(seq) FROM appointment_changes").fetchone()[0]
+        conn.execute("DELETE FROM appointment_changes WHERE seq <= ?", (seq - SLOT_CHANGES_KEPT,))
+        with self._lock:
+            self._seq = seq
+
+    def _is_free(self, doctor_id: int, key: int, ignore: Optional[int] = None) -> bool:
+        booked = self._slots.get(doctor_id, [])
+        i = bisect.bisect_right(booked, key - SLOT_MINUTES)
+        while i < len(booked) and booked[i] < key + SLOT_MINUTES:
+            if booked[i] != ignore:
+                return False
+            ignore = None
+            i += 1
+        return True
+
+    def _day_load(self, doctor_id: int, key: int) -> int:
+        booked = self._slots.get(doctor_id, [])
+        day_start = key - key % MINUTES_PER_DAY
+        return bisect.bisect_left(booked, day_start + MINUTES_PER_DAY) - bisect.bisect_left(booked, day_start)
+
+    def _add(self, doctor_id: int, key: int) -> None:
+        bisect.insort(self._slots.setdefault(doctor_id, []), key)
+
+    def _remove(self, doctor_id: int, key: int) -> None:
+        booked = self._slots.get(doctor_id, [])
+        i = bisect.bisect_left(booked, key)
+        if i < len(booked) and booked[i] == key:
+            del booked[i]
+
+    def _candidates(self, doctors: List[Doctor], key: int, preferred: Optional[int] = None, ignore: Optional[int] = None):
+        """Free doctors for a slot, ``preferred`` first, then by that day's load."""
+        with self._lock:
+            free = [
+                (doctor_id != preferred, self._day_load(doctor_id, key), doctor_id, name)
+                for doctor_id, name in doctors
+                if self._is_free(doctor_id, key, ignore if doctor_id == preferred else None)
+            ]
+        return [(doctor_id, name) for _, _, doctor_id, name in sorted(free)]
+
+    @staticmethod
+    def _taken_in_db(conn, doctor_id: int, key: int, exclude_booking: Optional[int] = None) -> bool:
+        preferred_date, _ = _slot_label(key)
+        minute = key % MINUTES_PER_DAY
+        row = conn.execute(
+            "SELECT 1 FROM appointments WHERE doctor_id = ? AND preferred_date = ? "
+            "AND preferred_time > ? AND preferred_time < ? AND id != ? LIMIT 1",
+            (
+                doctor_id, preferred_date,
+                _time_label(minute - SLOT_MINUTES), _time_label(minute + SLOT_MINUTES),
+                exclude_booking or -1,
+            )
+        ).fetchone()
+        return row is not None
+
+    async def _run_indexed(self, fn, undo):
+        """Run a booking transaction, reverting its index changes if the commit fails."""
+        try:
+            return await self.db.run(fn)
+        except BaseException:
+            with self._lock:
+                for revert in undo:
+                    revert()
+                # The position may already count the rolled-back write; reload on next use.
+                self._seq = None
+            raise
+
+    async def book(self, patient_id: int, specialty: str, preferred_date: str, preferred_time: str,
+                   insurance: Optional[Tuple[str, str]] = None) -> Optional[Reservation]:
+        """Reserve the slot with the least-loaded free doctor, or return None if all are taken.
+
+        ``insurance`` is a ``(provider, number)`` pair saved on the patient in
+        the same transaction, only when the booking succeeds.
+        """
+        doctors = await self.directory.get(specialty)
+        key = _slot_key(preferred_date, preferred_time)
+        pending = []
+
+        def _reserve(conn):
+            # Catch up before taking the write lock, so a reload never holds it.
+            self._ensure_loaded(conn, max_age=0)
+            conn.execute("BEGIN IMMEDIATE")
+            self._ensure_loaded(conn, max_age=0)
+            for doctor_id, doctor_name in self._candidates(doctors, key):
+                if self._taken_in_db(conn, doctor_id, key):
+                    # Booked by another worker since our index last saw it.
+                    with self._lock:
+                        self._add(doctor_id, key)
+                    continue
+                cursor = conn.execute(
+                    "INSERT INTO appointments (patient_id, doctor_id, specialty, preferred_date, preferred_time) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (patient_id, doctor_id, specialty, preferred_date, preferred_time)
+                )
+                if insurance:
+                    conn.execute(
+                        "UPDATE patients SET insurance_provider = ?, insurance_number = ? WHERE id = ?",
+                        (*insurance, patient_id)
+                    )
+                # Index while still holding the write lock so the next booking sees it.
+                with self._lock:
+                    self._add(doctor_id, key)
+                    pending.append(lambda: self._remove(doctor_id, key))
+                self._wrote(conn)
+                return Reservation(cursor.lastrowid, doctor_id, doctor_name, specialty, preferred_date, preferred_time)
+            return None
+
+        return await self._run_indexed(_reserve, pending)
+
+    async def reschedule(self, booking_id: int, new_date: Optional[str] = None, new_time: Optional[str] = None,
+                         new_specialty: Optional[str] = None) -> Optional[Reservation]:
+        """Move a booking, keeping its doctor when still free.
+
+        Returns None when no doctor is free at the new slot and raises
+        ``LookupError`` if the booking does not exist.
+        """
+        current = await self.db.fetchone("SELECT specialty FROM appointments WHERE id = ?", (booking_id,))
+        if not current:
+            raise LookupError(f"Appointment {booking_id} not found")
+        specialty = new_specialty or current[0]
+        doctors = await self.directory.get(specialty)
+        pending = []
+
+        def _move(conn):
+            # Catch up before taking the write lock, so a reload never holds it.
+            self._ensure_loaded(conn, max_age=0)
+            conn.execute("BEGIN IMMEDIATE")
+            self._ensure_loaded(conn, max_age=0)
+            row = conn.execute(
+                "SELECT doctor_id, preferred_date, preferred_time FROM appointments WHERE id = ?", (booking_id,)
+            ).fetchone()
+            if not row:
+                raise LookupError(f"Appointment {booking_id} not found")
+            old_doctor_id, old_date, old_time = row
+            old_key = _slot_key(old_date, old_time)
+            preferred_date = new_date or old_date
+            preferred_time = new_time or old_time
+            key = _slot_key(preferred_date, preferred_time)
+
+            for doctor_id, doctor_name in self._candidates(doctors, key, preferred=old_doctor_id, ignore=old_key):
+                if self._taken_in_db(conn, doctor_id, key, exclude_booking=booking_id):
+                    with self._lock:
+                        self._add(doctor_id, key)
+                    continue
+                conn.execute(
+                    "UPDATE appointments SET doctor_id = ?, specialty = ?, preferred_date = ?, preferred_time = ? WHERE id = ?",
+                    (doctor_id, specialty, preferred_date, preferred_time, booking_id)
+                )
+                with self._lock:
+                    self._remove(old_doctor_id, old_key)
+                    self._add(doctor_id, key)
+                    pending.append(lambda: (self._remove(doctor_id, key), self._add(old_doctor_id, old_key)))
+                self._wrote(conn)
+                return Reservation(booking_id, doctor_id, doctor_name, specialty, preferred_date, preferred_time)
+            return None
+
+        return await self._run_indexed(_move, pending)
+
+    async def cancel(self, booking_id: int) -> bool:
+        pending = []
+
+        def _delete(conn):
+            # Catch up before taking the write lock, so a reload never holds it.
+            self._ensure_loaded(conn, max_age=0)
+            conn.execute("BEGIN IMMEDIATE")
+            self._ensure_loaded(conn, max_age=0)
+            rows = conn.execute(
+                "DELETE FROM appointments WHERE id = ? RETURNING doctor_id, preferred_date, preferred_time",
+                (booking_id,)
+            ).fetchall()
+            if not rows:
+                return False
+            doctor_id, preferred_date, preferred_time = rows[0]
+            try:
+                key = _slot_key(preferred_date, preferred_time)
+            except ValueError:
+                key = None
+            with self._lock:
+                if key is not None:
+                    self._remove(doctor_id, key)
+                    pending.append(lambda: self._add(doctor_id, key))
+            self._wrote(conn)
+            return True
+
+        return await self._run_indexed(_delete, pending)
+
+    async def suggest_alternatives(self, specialty: str, preferred_date: str, preferred_time: str,
+                                   limit: int = 3) -> List[Tuple[str, str, str]]:
+        """Nearest free ``(date, time, doctor_name)`` slots within working hours."""
+        doctors = await self.directory.get(specialty)
+        if not doctors:
+            return []
+        if self._seq is None or time.monotonic() - self._checked_at >= SLOT_INDEX_TTL:
+            await self.db.run(self._ensure_loaded)
+
+        requested = _slot_key(preferred_date, preferred_time)
+        requested_minute = requested % MINUTES_PER_DAY
+        first_day = requested - requested_minute
+        opening, closing = (_minute_of_day(label) for label in WORKING_HOURS)
+        day_slots = sorted(range(opening, closing, SLOT_MINUTES), key=lambda minute: abs(minute - requested_minute))
+
+        suggestions = []
+        for day in range(SUGGESTION_SEARCH_DAYS):
+            for minute in day_slots:
+                key = first_day + day * MINUTES_PER_DAY + minute
+                if key == requested:
+                    continue
+                free = self._candidates(doctors, key)
+                if free:
+                    suggestions.append((*_slot_label(key), free[0][1]))
+                    if len(suggestions) >= limit:
+                        return suggestions
+        return suggestions
+
+
+_scheduler: Optional[AppointmentScheduler] = None
+
+
+def get_scheduler() -> AppointmentScheduler:
+    """Return the scheduler shared by every session in the worker."""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = AppointmentScheduler()
+    return _scheduler
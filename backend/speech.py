@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import os
+from typing import Callable, Dict, Optional, Tuple
+
+import aiohttp
+from livekit.plugins import deepgram, elevenlabs, groq
+
+logger = logging.getLogger("nurse-assistant")
+
+SPEECH_HTTP_POOL_SIZE = int(os.getenv("SPEECH_HTTP_POOL_SIZE", "100"))
+SPEECH_KEEPALIVE_SECONDS = float(os.getenv("SPEECH_KEEPALIVE_SECONDS", "60"))
+
+# Each factory takes the pool's shared aiohttp session. The Groq STT client
+# keeps its own httpx connection pool, which is reused with the instance.
+TTS_FACTORIES: Dict[str, Callable[[aiohttp.ClientSession], object]] = {
+    "en": lambda http: deepgram.TTS(model="aura-asteria-en", api_key="", http_session=http),
+    "hi": lambda http: elevenlabs.TTS(
+        voice_id="mActWQg9kibLro6Z2ouY",
+        model="eleven_multilingual_v2",
+        api_key="",
+        http_session=http,
+    ),
+    "mr": lambda http: elevenlabs.TTS(
+        voice_id="mActWQg9kibLro6Z2ouY",
+        model="eleven_multilingual_v2",
+        api_key="",
+        http_session=http,
+    ),
+    "pa": lambda http: deepgram.TTS(model="aura-asteria-en", http_session=http),
+    "ta": lambda http: elevenlabs.TTS(
+        voice_id="mActWQg9kibLro6Z2ouY",
+        model="eleven_multilingual_v2",
+        api_key="",
+        http_session=http,
+    ),
+}
+
+# (provider, model, voice) spoken by each TTS factory above; the pre-rendered
+# phrase audio is keyed on it, so keep the two tables in step.
+TTS_VOICES: Dict[str, Tuple[str, str, str]] = {
+    "en": ("deepgram", "aura-asteria-en", ""),
+    "hi": ("elevenlabs", "eleven_multilingual_v2", "mActWQg9kibLro6Z2ouY"),
+    "mr": ("elevenlabs", "eleven_multilingual_v2", "mActWQg9kibLro6Z2ouY"),
+    "pa": ("deepgram", "aura-asteria-en", ""),
+    "ta": ("elevenlabs", "eleven_multilingual_v2", "mActWQg9kibLro6Z2ouY"),
+}
+
+STT_FACTORIES: Dict[str, Callable[[aiohttp.ClientSession], object]] = {
+    "en": lambda http: groq.STT(model="whisper-large-v3-turbo", language="en", api_key=""),
+    "hi": lambda http: groq.STT(model="whisper-large-v3-turbo", language="hi", api_key=""),
+    "mr": lambda http: groq.STT(model="whisper-large-v3-turbo", language="mr", api_key=""),
+    "pa": lambda http: groq.STT(model="whisper-large-v3-turbo", language="pa", api_key=""),
+    "ta": lambda http: groq.STT(model="whisper-large-v3-turbo", language="ta", api_key=""),
+}
+
+
+class SpeechClientPool:
+    """STT and TTS clients shared by every session in the worker, one per language.
+
+    Clients are created on first use for a language and handed to every later
+    session, so concurrent calls reuse warm keep-alive connections instead of
+    each opening their own. The HTTP session is owned by the pool rather than
+    the job, so it outlives individual calls. A client is rebuilt on the next
+    lookup once it reports an unrecoverable error, its HTTP session has been
+    closed, or the pool is used from a different event loop; the clients it
+    replaces are closed on the loop that created them.
+    """
+
+    def __init__(self, tts_factories=TTS_FACTORIES, stt_factories=STT_FACTORIES) -> None:
+        self._factories = {"tts": tts_factories, "stt": stt_factories}
+        self._clients: Dict[tuple, object] = {}
+        self._unhealthy: set = set()
+        self._http: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._closing: set = set()
+        self.created = 0
+        self.reused = 0
+        self.evicted = 0
+
+    def tts(self, language: str):
+        return self._get("tts", language)
+
+    def stt(self, language: str):
+        return self._get("stt", language)
+
+    def _http_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # aiohttp sessions and plugin streams are bound to the loop that made them.
+            if self._clients:
+                logger.info("Speech client pool moved to a new event loop, closing existing clients")
+            self._retire(self._loop, list(self._clients.values()), self._http)
+            self._clients.clear()
+            self._unhealthy.clear()
+            self._http = None
+            self._loop = loop
+        if self._http is None or self._http.closed:
+            self._retire(loop, list(self._clients.values()))
+            connector = aiohttp.TCPConnector(
+                limit=SPEECH_HTTP_POOL_SIZE,
+                keepalive_timeout=SPEECH_KEEPALIVE_SECONDS,
+                ttl_dns_cache=300,
+            )
+            self._http = aiohttp.ClientSession(connector=connector)
+            self._clients.clear()
+            self._unhealthy.clear()
+        return self._http
+
+    def _get(self, kind: str, language: str):
+        factories = self._factories[kind]
+        if language not in factories:
+            language = "en"
+        key = (kind, language)
+        http = self._http_session()
+
+        client = self._clients.get(key)
+        if client is not None and key not in self._unhealthy:
+            self.reused += 1
+            return client
+        if client is not None:
+            self.evicted += 1
+            logger.warning(f"Replacing unhealthy {kind.upper()} client for {language}")
+            self._retire(self._loop, [client])
+
+        client = factories[language](http)
+        client.on("error", lambda ev: self._on_error(key, client, ev))
+        self._clients[key] = client
+        self._unhealthy.discard(key)
+        self.created += 1
+        logger.info(f"Created shared {kind.upper()} client for {language}")
+        return client
+
+    def _on_error(self, key: tuple, client, ev) -> None:
+        if getattr(ev, "recoverable", True):
+            return
+        if self._clients.get(key) is client:
+            self._unhealthy.add(key)
+            logger.error(f"Shared {key[0].upper()} client for {key[1]} failed: {getattr(ev, 'error', ev)}")
+
+    def _retire(self, loop: Optional[asyncio.AbstractEventLoop], clients: list,
+                http: Optional[aiohttp.ClientSession] = None) -> None:
+        """Close clients (and their HTTP session) the pool no longer hands out, on the loop they belong to."""
+        if not clients and (http is None or http.closed):
+            return
+
+        async def close() -> None:
+            for client in clients:
+                try:
+                    await client.aclose()
+                except Exception as e:
+                    logger.error(f"Failed to close speech client: {e}")
+            if http is not None and not http.closed:
+                await http.close()
+
+        if loop is not None and loop.is_running():
+            try:
+                current = asyncio.get_running_loop()
+            except RuntimeError:
+                current = None
+            if loop is current:
+                task = loop.create_task(close())
+                # Keep a reference until it finishes, or the task may be collected mid-close.
+                self._closing.add(task)
+                task.add_done_callback(self._closing.discard)
+            else:
+                asyncio.run_coroutine_threadsafe(close(), loop)
+            return
+        # A stopped loop cannot run the close; its connections went down with it.
+        logger.warning(f"Dropping {len(clients)} speech clients whose event loop has stopped")
+
+    def stats(self) -> dict:
+        return {
+            "clients": len(self._clients),
+            "created": self.created,
+            "reused": self.reused,
+            "evicted": self.evicted,
+            "unhealthy": sorted(f"{kind}:{language}" for kind, language in self._unhealthy),
+        }
+
+    async def aclose(self) -> None:
+        for client in self._clients.values():
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.error(f"Failed to close speech client: {e}")
+        self._clients.clear()
+        self._unhealthy.clear()
+        if self._http is not None:
+            await self._http.close()
+            self._http = None
+        if self._closing:
+            await asyncio.gather(*self._closing, return_exceptions=True)
+
+
+_pool: Optional[SpeechClientPool] = None
+
+
+def get_speech_pool() -> SpeechClientPool:
+    """Return the speech client pool shared by every session in the worker."""
+    global _pool
+    if _pool is None:
+        _pool = SpeechClientPool()
+    return _pool
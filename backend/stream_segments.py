@@ -0,0 +1,83 @@
+import re
+from typing import List
+
+# The first message goes out as soon as there is a sentence or two, later
+# ones are longer so a full analysis arrives as a handful of messages.
+FIRST_SEGMENT_MIN_CHARS = 120
+SEGMENT_MIN_CHARS = 400
+# WhatsApp rejects message bodies over 1600 characters.
+SEGMENT_MAX_CHARS = 1500
+
+# A sentence ends at ., ! or ? (or the Devanagari danda) followed by
+# whitespace, or at a line break; "Dr. ", "e.g. " and list numbers like "2. "
+# are not sentence ends.
+_SENTENCE_END = re.compile(r"(?<![0-9])(?<!\bDr)(?<!\be\.g)(?<!\bi\.e)(?<!\bvs)(?<!\betc)[.!?।](?=\s)|\n")
+_PARAGRAPH_END = re.compile(r"\n\s*\n")
+
+
+class SegmentSplitter:
+    """Cuts streamed model output into messages at paragraph or sentence ends.
+
+    ``feed`` takes each streamed chunk and returns the segments that are
+    complete: the text up to the last paragraph break past half the minimum
+    length, else the last sentence end past the minimum, else (beyond
+    ``max_chars``) the last space. Chunks are collected in lists rather than
+    appended to a growing string, and only the unsent text, at most about
+    ``max_chars``, is ever joined while streaming; ``text`` is the whole output.
+    """
+
+    def __init__(self, first_min_chars: int = FIRST_SEGMENT_MIN_CHARS, min_chars: int = SEGMENT_MIN_CHARS,
+                 max_chars: int = SEGMENT_MAX_CHARS) -> None:
+        self.min_chars = first_min_chars
+        self.next_min_chars = min_chars
+        self.max_chars = max_chars
+        self._parts: List[str] = []
+        self._pending: List[str] = []
+        self._pending_chars = 0
+        self.segments = 0
+
+    @property
+    def text(self) -> str:
+        return "".join(self._parts)
+
+    def _cut(self, pending: str) -> int:
+        window = pending[:self.max_chars]
+        # A paragraph break is the better place to stop, so it may come a little early.
+        for pattern, shortest in ((_PARAGRAPH_END, self.min_chars // 2), (_SENTENCE_END, self.min_chars)):
+            ends = [match.end() for match in pattern.finditer(window) if match.end() >= shortest]
+            if ends:
+                return ends[-1]
+        if len(pending) > self.max_chars:
+            space = window.rfind(" ", self.min_chars)
+            return space if space > 0 else self.max_chars
+        return 0
+
+    def feed(self, chunk: str) -> List[str]:
+        if not chunk:
+            return []
+        self._parts.append(chunk)
+        self._pending.append(chunk)
+        self._pending_chars += len(chunk)
+        if self._pending_chars < self.min_chars:
+            return []
+        pending = "".join(self._pending)
+        ready = []
+        while True:
+            cut = self._cut(pending)
+            if not cut:
+                break
+            segment, pending = pending[:cut].strip(), pending[cut:]
+            if segment:
+                ready.append(segment)
+                self.segments += 1
+                self.min_chars = self.next_min_chars
+        self._pending = [pending]
+        self._pending_chars = len(pending)
+        return ready
+
+    def finish(self) -> str:
+        """Return whatever has not been handed out as a segment."""
+        rest = "".join(self._pending).strip()
+        self._pending = []
+        self._pending_chars = 0
+        return rest
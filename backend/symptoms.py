@@ -0,0 +1,242 @@
+import re
+import unicodedata
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# Letters, digits and the Indic script blocks (Devanagari through Malayalam).
+# Vowel signs in those blocks are combining marks, which ``\w`` does not cover,
+# so they are listed explicitly to keep word boundaries inside Indic words.
+_WORD_CHAR = r"[\w\u0900-\u0D7F]"
+# Word separators other than a plain space.
+_NON_SPACE_SEPARATOR = r"[^ \w\u0900-\u0D7F]"
+# bytes.translate table for ASCII text: letters are lower-cased, whitespace
+# becomes a space and every other character that cannot be part of a word a
+# NUL, so each separator is a single literal to search for. A bytes table is
+# one C lookup per byte; str.translate goes through a dict per character.
+_ASCII_FOLD = bytes(
+    c if chr(c).isalnum() or chr(c) == "_" or c > 127 else 32 if chr(c).isspace() else 0
+    for c in range(256)
+).translate(bytes.maketrans(b"ABCDEFGHIJKLMNOPQRSTUVWXYZ", b"abcdefghijklmnopqrstuvwxyz"))
+_END = ""
+
+# category -> language -> {keyword: weight}. A trailing "*" lets the keyword
+# match as a word prefix (fractur* -> fractured); everything else must match a
+# whole word or phrase. Hindi, Marathi, Punjabi and Tamil attach postpositions
+# and inflections to the stem, so their entries are mostly prefixes.
+SPECIALTY_KEYWORDS = {
+    "Orthopedics": {
+        "en": {
+            "pain in arm": 2, "arm pain": 2, "leg pain": 2, "back pain": 2, "knee pain": 2, "joint pain": 2,
+            "sports injury": 2, "fractur*": 3, "broken bone*": 3, "sprain*": 2, "dislocat*": 3,
+            "fall": 1, "fell": 1, "fallen": 1, "accident*": 1,
+        },
+        "hi": {
+            "हड्डी*": 2, "फ्रैक्चर*": 3, "कमर दर्द*": 2, "पीठ दर्द*": 2, "घुटने*": 2, "मोच*": 2,
+            "पैर में दर्द*": 2, "हाथ में दर्द*": 2, "गिर गया*": 1, "गिर गई*": 1, "दुर्घटना*": 1, "एक्सीडेंट*": 1,
+        },
+        "mr": {
+            "हाड*": 2, "फ्रॅक्चर*": 3, "पाठदुखी*": 2, "कंबरदुखी*": 2, "गुडघ*": 2, "मुरगळ*": 2,
+            "पाय दुख*": 2, "पडलो*": 1, "पडले*": 1, "पडला*": 1, "अपघात*": 1,
+        },
+        "pa": {
+            "ਹੱਡੀ*": 2, "ਫ੍ਰੈਕਚਰ*": 3, "ਕਮਰ ਦਰਦ*": 2, "ਪਿੱਠ ਦਰਦ*": 2, "ਗੋਡੇ*": 2, "ਮੋਚ*": 2,
+            "ਲੱਤ ਵਿੱਚ ਦਰਦ*": 2, "ਲੱਤ ਦਰਦ*": 2, "ਡਿੱਗ*": 1, "ਹਾਦਸ*": 1, "ਐਕਸੀਡੈਂਟ*": 1,
+        },
+        "ta": {
+            "எலும்பு*": 2, "முறிவு*": 3, "முதுகு வலி*": 2, "முழங்கால்*": 2, "சுளுக்கு*": 2,
+            "கால் வலி*": 2, "விழுந்*": 1, "விபத்து*": 1,
+        },
+    },
+    "Cardiology": {
+        "en": {
+            "chest pain": 3, "heart": 2, "heart attack": 3, "heartbeat*": 2, "palpitation*": 3, "blood pressure": 2, "shortness of breath": 2,
+        },
+        "hi": {"सीने में दर्द*": 3, "छाती में दर्द*": 3, "दिल*": 2, "हृदय*": 2, "धड़कन*": 3},
+        "mr": {"छातीत दुख*": 3, "छातीत वेदना*": 3, "हृदय*": 2, "धडधड*": 3},
+        "pa": {"ਛਾਤੀ ਵਿੱਚ ਦਰਦ*": 3, "ਛਾਤੀ ਦਰਦ*": 3, "ਦਿਲ*": 2, "ਧੜਕਣ*": 3},
+        "ta": {"நெஞ்சு வலி*": 3, "மார்பு வலி*": 3, "இதய*": 2, "படபடப்பு*": 3},
+    },
+    "Neurology": {
+        "en": {
+            "headache*": 2, "migraine*": 3, "seizure*": 3, "numbness": 2, "dizz*": 1, "faint*": 1, "stroke": 3,
+        },
+        "hi": {"सिरदर्द*": 2, "सिर दर्द*": 2, "माइग्रेन*": 3, "दौरा*": 3, "दौरे*": 3, "चक्कर*": 1, "सुन्न*": 2, "लकवा*": 3},
+        "mr": {"डोकेदुखी*": 2, "डोके दुख*": 2, "मायग्रेन*": 3, "झटके*": 3, "चक्कर*": 1, "बधिर*": 2, "अर्धांगवायू*": 3},
+        "pa": {"ਸਿਰਦਰਦ*": 2, "ਸਿਰ ਦਰਦ*": 2, "ਮਾਈਗ੍ਰੇਨ*": 3, "ਦੌਰਾ*": 3, "ਦੌਰੇ*": 3, "ਚੱਕਰ*": 1, "ਸੁੰਨ*": 2},
+        "ta": {"தலைவலி*": 2, "தலை வலி*": 2, "ஒற்றைத் தலைவலி*": 3, "வலிப்பு*": 3, "தலைசுற்ற*": 1, "மரத்து*": 2},
+    },
+    "General Medicine": {
+        "en": {"fever*": 1, "cough*": 1, "cold": 1, "flu": 1, "vomit*": 1, "diarrh*": 1, "stomach ache": 1},
+        "hi": {"बुखार*": 1, "खांसी*": 1, "खाँसी*": 1, "जुकाम*": 1, "सर्दी*": 1, "उल्टी*": 1, "दस्त*": 1, "पेट दर्द*": 1},
+        "mr": {"ताप*": 1, "खोकला*": 1, "सर्दी*": 1, "उलटी*": 1, "जुलाब*": 1, "पोटदुखी*": 1},
+        "pa": {"ਬੁਖਾਰ*": 1, "ਖੰਘ*": 1, "ਜ਼ੁਕਾਮ*": 1, "ਉਲਟੀ*": 1, "ਦਸਤ*": 1, "ਪੇਟ ਦਰਦ*": 1},
+        "ta": {"காய்ச்சல்*": 1, "இருமல்*": 1, "சளி*": 1, "வாந்தி*": 1, "வயிற்றுப்போக்கு*": 1, "வயிற்று வலி*": 1},
+    },
+}
+
+MENTAL_HEALTH_KEYWORDS = {
+    "Psychiatry": {
+        "en": {
+            "anxiety": 2, "anxious": 2, "depress*": 2, "stress*": 1, "mood*": 1, "sleep*": 1, "insomnia": 2,
+            "panic*": 2, "sad": 1, "lonely": 1, "suicid*": 3,
+        },
+        "hi": {"चिंता*": 2, "घबराहट*": 2, "अवसाद*": 2, "डिप्रेशन*": 2, "तनाव*": 1, "मूड*": 1, "नींद*": 1, "उदास*": 1, "अकेला*": 1},
+        "mr": {"चिंता*": 2, "काळजी*": 1, "नैराश्य*": 2, "डिप्रेशन*": 2, "ताण*": 1, "मूड*": 1, "झोप*": 1, "उदास*": 1, "एकटे*": 1},
+        "pa": {"ਚਿੰਤਾ*": 2, "ਘਬਰਾਹਟ*": 2, "ਡਿਪਰੈਸ਼ਨ*": 2, "ਉਦਾਸ*": 1, "ਤਣਾਅ*": 1, "ਮੂਡ*": 1, "ਨੀਂਦ*": 1},
+        "ta": {"பதட்ட*": 2, "கவலை*": 1, "மனச்சோர்வு*": 2, "மன அழுத்த*": 1, "மனநிலை*": 1, "தூக்க*": 1, "தனிமை*": 1},
+    },
+}
+
+INJURY_KEYWORDS = {
+    "injury": {
+        "en": {
+            "wound*": 1, "cut": 1, "cuts": 1, "bruis*": 1, "burn*": 1, "scrape*": 1, "scratch*": 1, "injur*": 1,
+            "hurt*": 1, "pain*": 1, "bleed*": 1, "swollen": 1, "swelling": 1, "sprain*": 1, "fractur*": 1,
+            "broken": 1, "dislocat*": 1, "torn": 1, "rash*": 1, "bite*": 1, "bitten": 1, "sting*": 1, "stung": 1,
+            "lacerat*": 1, "abrasion*": 1, "contusion*": 1, "trauma*": 1, "accident*": 1, "fall": 1, "falls": 1,
+            "fell": 1, "fallen": 1, "hit": 1, "injured": 1, "medical": 1, "first aid": 1, "emergency": 1,
+        },
+        "hi": {"चोट*": 1, "घाव*": 1, "जख्म*": 1, "जल गया*": 1, "जला*": 1, "कट गया*": 1, "खून*": 1, "सूजन*": 1, "मोच*": 1, "फ्रैक्चर*": 1, "दुर्घटना*": 1},
+        "mr": {"जखम*": 1, "दुखापत*": 1, "भाजल*": 1, "कापल*": 1, "रक्त*": 1, "सूज*": 1, "मुरगळ*": 1, "फ्रॅक्चर*": 1, "अपघात*": 1},
+        "pa": {"ਸੱਟ*": 1, "ਜ਼ਖ਼ਮ*": 1, "ਜ਼ਖਮ*": 1, "ਸੜ ਗਿਆ*": 1, "ਕੱਟ*": 1, "ਖੂਨ*": 1, "ਸੋਜ*": 1, "ਮੋਚ*": 1, "ਫ੍ਰੈਕਚਰ*": 1, "ਹਾਦਸ*": 1},
+        "ta": {"காயம்*": 1, "காயங்*": 1, "தீக்காய*": 1, "வெட்டு*": 1, "இரத்த*": 1, "வீக்க*": 1, "சுளுக்கு*": 1, "முறிவு*": 1, "விபத்து*": 1},
+    },
+}
+
+
+def _keyword_forms(keyword: str) -> List[str]:
+    """Spellings to register for a table keyword.
+
+    Input text is only lower-cased, not Unicode-normalised (that would cost more
+    than the scan itself), so keywords are registered both as written and in
+    NFC form; the two differ for characters such as Gurmukhi nukta letters.
+    """
+    keyword = " ".join(keyword.lower().split())
+    return list(dict.fromkeys([keyword, unicodedata.normalize("NFC", keyword)]))
+
+
+class Match(NamedTuple):
+    keyword: str
+    category: str
+    weight: float
+    start: int
+    end: int
+
+
+class SymptomMatcher:
+    """Multi-pattern keyword matcher compiled once from a keyword table.
+
+    All keywords go into one trie which is emitted as a single regular
+    expression, so a scan is one pass of the C regex engine over the text
+    instead of one substring search per keyword. The input is lower-cased
+    once per call. Longer keywords win over
+    their own prefixes ("chest pain" over "chest") and whole-word keywords
+    only match between word boundaries.
+
+    ``contains_any`` only needs the first hit, so it uses its own patterns,
+    searched with a space in front of the text. They begin with the separator
+    itself rather than a lookbehind, so the engine jumps from space to space
+    instead of trying every position. ASCII text has its other separators
+    turned into NULs and is lower-cased in the same ``bytes.translate`` pass,
+    then searched as bytes for the ASCII keywords alone. Either way the keywords are
+    looked for after a space, then after any other separator.
+    """
+
+    def __init__(self, table: Dict[str, Dict[str, Dict[str, float]]]) -> None:
+        self._targets: Dict[str, List[Tuple[str, float]]] = {}
+        self.categories: List[str] = list(table)
+        trie: dict = {}
+        ascii_trie: dict = {}
+        for category, languages in table.items():
+            for keywords in languages.values():
+                for keyword, weight in keywords.items():
+                    prefix = keyword.endswith("*")
+                    for form in _keyword_forms(keyword.rstrip("*")):
+                        self._targets.setdefault(form, []).append((category, weight))
+                        self._insert(trie, form, prefix)
+                        if form.isascii():
+                            self._insert(ascii_trie, form, prefix)
+        self._pattern = re.compile(f"(?<!{_WORD_CHAR})(?:{self._trie_to_regex(trie)})")
+        self._any_after_space = re.compile(f" (?:{self._trie_to_regex(trie)})")
+        self._any_after_separator = re.compile(f"{_NON_SPACE_SEPARATOR}(?:{self._trie_to_regex(trie)})")
+        self._any_ascii_after_space = self._any_ascii_after_separator = None
+        if ascii_trie:
+            # Folded ASCII text holds nothing but word characters, spaces and NULs.
+            ascii_regex = self._trie_to_regex(ascii_trie, word_char=r"\w")
+            self._any_ascii_after_space = re.compile(f" (?:{ascii_regex})".encode("ascii"))
+            self._any_ascii_after_separator = re.compile(f"\\x00(?:{ascii_regex})".encode("ascii"))
+
+    @staticmethod
+    def _insert(trie: dict, form: str, prefix: bool) -> None:
+        node = trie
+        for ch in form:
+            node = node.setdefault(ch, {})
+        node[_END] = node.get(_END, False) or prefix
+
+    @classmethod
+    def _trie_to_regex(cls, node: dict, word_char: str = _WORD_CHAR) -> str:
+        branches = [
+            (r"\s+" if ch == " " else re.escape(ch)) + cls._trie_to_regex(child, word_char)
+            for ch, child in node.items() if ch != _END
+        ]
+        if _END not in node:
+            return branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        ending = "" if node[_END] else f"(?!{word_char})"
+        if not branches:
+            return ending
+        # Try the longer keywords first; fall back to ending here.
+        return f"(?:{'|'.join(branches)}|{ending})"
+
+    def matches(self, text: str) -> List[Match]:
+        found = []
+        for m in self._pattern.finditer(text.lower()):
+            keyword = " ".join(m.group().split())
+            for category, weight in self._targets[keyword]:
+                found.append(Match(keyword, category, weight, m.start(), m.end()))
+        return found
+
+    def contains_any(self, text: str) -> bool:
+        if text.isascii():
+            if self._any_ascii_after_space is None:
+                return False
+            text = b" " + text.encode("ascii").translate(_ASCII_FOLD)
+            return (self._any_ascii_after_space.search(text) is not None
+                    or self._any_ascii_after_separator.search(text) is not None)
+        text = " " + text.lower()
+        return self._any_after_space.search(text) is not None or self._any_after_separator.search(text) is not None
+
+    def scores(self, text: str) -> Dict[str, float]:
+        totals: Dict[str, float] = {}
+        for match in self.matches(text):
+            totals[match.category] = totals.get(match.category, 0) + match.weight
+        return totals
+
+    def classify(self, text: str, default: Optional[str] = None) -> Optional[str]:
+        """Highest scoring category; ties go to the category mentioned first."""
+        best, best_score = default, 0.0
+        first_seen: Dict[str, int] = {}
+        totals: Dict[str, float] = {}
+        for match in self.matches(text):
+            first_seen.setdefault(match.category, match.start)
+            totals[match.category] = totals.get(match.category, 0) + match.weight
+        for category in sorted(totals, key=first_seen.get):
+            if totals[category] > best_score:
+                best, best_score = category, totals[category]
+        return best
+
+
+specialty_matcher = SymptomMatcher(SPECIALTY_KEYWORDS)
+mental_health_matcher = SymptomMatcher(MENTAL_HEALTH_KEYWORDS)
+injury_matcher = SymptomMatcher(INJURY_KEYWORDS)
+
+
+def suggest_specialty(symptoms: str) -> str:
+    """Specialty for physical symptoms, General Medicine when nothing matches."""
+    return specialty_matcher.classify(symptoms, default="General Medicine")
+
+
+def suggest_mental_health_specialty(symptoms: str) -> str:
+    return mental_health_matcher.classify(symptoms, default="General Medicine")
+
+
+def is_injury_text(text: str) -> bool:
+    return injury_matcher.contains_any(text)
@@ -0,0 +1,134 @@
+"""Email outbox against a local SMTP stand-in (aiosmtpd).
+
+Two senders with their own connection pools stand in for two job processes
+draining one hospital.db; every message must reach the server exactly once.
+
+    pip install aiosmtpd
+    python -m unittest test_outbox
+"""
+import asyncio
+import os
+import socket
+import sqlite3
+import tempfile
+import time
+import unittest
+from collections import Counter
+
+try:
+    from aiosmtpd.controller import Controller
+except ImportError:  # aiosmtpd missing: the tests are skipped.
+    Controller = None
+
+from db import Database
+from migrations import init_db
+from outbox import EmailOutbox
+
+SENDER = "clinic@example.com"
+
+
+class _Recorder:
+    """aiosmtpd handler that keeps the subject of every message it accepts."""
+
+    def __init__(self) -> None:
+        self.subjects = []
+
+    async def handle_DATA(self, server, session, envelope):
+        # Slow enough that both senders are mid-batch at the same time.
+        await asyncio.sleep(0.002)
+        for line in envelope.content.decode("utf-8", "replace").splitlines():
+            if line.startswith("Subject: "):
+                self.subjects.append(line[len("Subject: "):])
+        return "250 OK"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@unittest.skipIf(Controller is None, "aiosmtpd is not installed")
+class EmailOutboxTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "hospital.db")
+        init_db(self.path)
+        self.recorder = _Recorder()
+        self.controller = Controller(self.recorder, hostname="127.0.0.1", port=_free_port())
+        self.controller.start()
+        self.databases = []
+
+    def tearDown(self) -> None:
+        self.controller.stop()
+        for db in self.databases:
+            db.close()
+        self.directory.cleanup()
+
+    def _outbox(self) -> EmailOutbox:
+        db = Database(self.path)
+        self.databases.append(db)
+        return EmailOutbox(db=db, host=self.controller.hostname, port=self.controller.port,
+                           use_ssl=False, sender=SENDER)
+
+    def _statuses(self) -> Counter:
+        with sqlite3.connect(self.path) as conn:
+            return Counter(status for status, in conn.execute("SELECT status FROM email_outbox"))
+
+    def test_two_senders_deliver_each_message_once(self) -> None:
+        async def drain(outbox):
+            idle = 0
+            while idle < 3:
+                idle = 0 if await outbox.flush() else idle + 1
+                await asyncio.sleep(0)
+            await outbox.stop()
+
+        async def scenario():
+            first, second = self._outbox(), self._outbox()
+            for i in range(100):
+                await first.enqueue("patient@example.com", f"Booking {i}", "Your appointment is confirmed.")
+            await asyncio.gather(drain(first), drain(second))
+
+        asyncio.run(scenario())
+        delivered = Counter(self.recorder.subjects)
+        self.assertEqual(set(delivered), {f"Booking {i}" for i in range(100)})
+        self.assertEqual([subject for subject, count in delivered.items() if count > 1], [])
+        self.assertEqual(self._statuses(), {"sent": 100})
+
+    def test_expired_lease_is_sent_again(self) -> None:
+        with sqlite3.connect(self.path) as conn:
+            conn.execute(
+                "INSERT INTO email_outbox (recipient, subject, body, status, next_attempt_at, lease_until, created_at) "
+                "VALUES ('patient@example.com', 'Stranded', 'body', 'sending', ?, ?, 'now')",
+                (time.time() - 60, time.time() - 1)
+            )
+
+        async def scenario():
+            outbox = self._outbox()
+            self.assertEqual(await outbox.flush(), 1)
+            await outbox.stop()
+
+        asyncio.run(scenario())
+        self.assertEqual(self.recorder.subjects, ["Stranded"])
+        self.assertEqual(self._statuses(), {"sent": 1})
+
+    def test_live_lease_is_left_alone(self) -> None:
+        with sqlite3.connect(self.path) as conn:
+            conn.execute(
+                "INSERT INTO email_outbox (recipient, subject, body, status, next_attempt_at, lease_until, created_at) "
+                "VALUES ('patient@example.com', 'In flight', 'body', 'sending', ?, ?, 'now')",
+                (time.time() - 60, time.time() + 600)
+            )
+
+        async def scenario():
+            outbox = self._outbox()
+            self.assertEqual(await outbox.flush(), 0)
+            await outbox.stop()
+
+        asyncio.run(scenario())
+        self.assertEqual(self.recorder.subjects, [])
+        self.assertEqual(self._statuses(), {"sending": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
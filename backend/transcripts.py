@@ -0,0 +1,84 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+TRANSCRIPT_CACHE_SIZE = int(os.getenv("TRANSCRIPT_CACHE_SIZE", "5000"))
+# Forwarded voice notes keep circulating for days.
+TRANSCRIPT_CACHE_TTL = float(os.getenv("TRANSCRIPT_CACHE_TTL", str(7 * 24 * 3600)))
+
+
+class TranscriptCache:
+    """Transcripts of voice notes, keyed on a hash of the audio as downloaded.
+
+    A re-sent or forwarded voice note arrives under a new media URL but with
+    the same bytes, so its transcript is served without calling Whisper
+    again. The model is part of the key, so switching models starts afresh.
+    Entries expire after ``ttl`` and the least recently used are evicted
+    beyond ``max_entries``.
+    """
+
+    def __init__(self, max_entries: int = TRANSCRIPT_CACHE_SIZE, ttl: float = TRANSCRIPT_CACHE_TTL) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[str, float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.saved_seconds = 0.0
+
+    @staticmethod
+    def key(data: bytes, model: str) -> str:
+        return f"{model}:{hashlib.sha256(data).hexdigest()}"
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[1] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.saved_seconds += entry[2]
+            return entry[0]
+
+    def put(self, key: str, text: str, latency: float) -> None:
+        if not text or not text.strip():
+            return
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (text, time.monotonic(), latency)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "whisper_seconds_saved": round(self.saved_seconds, 2),
+                "evictions": self.evictions,
+            }
+
+
+_cache: Optional[TranscriptCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_transcript_cache() -> TranscriptCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = TranscriptCache()
+    return _cache
@@ -0,0 +1,90 @@
+"""Local stand-in for the parts of the Twilio API the WhatsApp bot talks to.
+
+Accepts outgoing messages on the REST endpoint, records them, and serves
+files from a directory so MediaUrl0 can point at local images or audio.
+
+    python twilio_standin.py --port 8099 --media-dir ./samples
+
+    WHATSAPP_ASYNC=1 WHATSAPP_VALIDATE_SIGNATURE=0 \\
+    TWILIO_API_BASE=http://localhost:8099 python call.py
+
+    curl -X POST localhost:5000/whatsapp -d From=whatsapp:+919876543210 \\
+        -d To=whatsapp:+14155238886 -d Body="I cut my finger"
+    curl localhost:8099/messages
+"""
+import argparse
+import json
+import os
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+_messages = []
+_lock = threading.Lock()
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    media_dir = "."
+
+    def _json(self, status, payload):
+        body = json.dumps(payload, indent=2).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        parts = self.path.strip("/").split("/")
+        if len(parts) != 4 or parts[0] != "2010-04-01" or parts[1] != "Accounts" or parts[3] != "Messages.json":
+            self._json(404, {"message": "Not found"})
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        form = {key: values[-1] for key, values in parse_qs(self.rfile.read(length).decode("utf-8")).items()}
+        if not form.get("To") or not (form.get("Body") or form.get("MediaUrl")):
+            self._json(400, {"code": 21602, "message": "Message body is required."})
+            return
+        message = {"sid": f"SM{uuid.uuid4().hex}", "account_sid": parts[2], "status": "queued",
+                   "to": form["To"], "from": form.get("From"), "body": form.get("Body", ""),
+                   "media_url": form.get("MediaUrl")}
+        with _lock:
+            _messages.append(message)
+        print(f"-> {message['to']}: {message['body'][:120]!r}", flush=True)
+        self._json(201, message)
+
+    def do_GET(self):
+        if self.path == "/messages":
+            with _lock:
+                self._json(200, list(_messages))
+            return
+        if self.path.startswith("/media/"):
+            path = os.path.join(self.media_dir, os.path.basename(self.path))
+            if not os.path.isfile(path):
+                self._json(404, {"message": "Not found"})
+                return
+            with open(path, "rb") as f:
+                body = f.read()
+            extension = os.path.splitext(path)[1].lower()
+            content_type = {".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png",
+                            ".ogg": "audio/ogg", ".wav": "audio/wav", ".mp3": "audio/mpeg"}.get(extension, "application/octet-stream")
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        self._json(404, {"message": "Not found"})
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--media-dir", default=".")
+    args = parser.parse_args()
+    handler = type("Handler", (StandinHandler,), {"media_dir": args.media_dir})
+    print(f"Twilio stand-in listening on :{args.port}")
+    ThreadingHTTPServer(("0.0.0.0", args.port), handler).serve_forever()
@@ -0,0 +1,218 @@
+import logging
+import math
+import os
+import threading
+from typing import List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # numpy missing: voice notes are transcribed whole.
+    np = None
+
+try:
+    from livekit.plugins.silero import onnx_model as silero_onnx
+except ImportError:  # Silero missing: speech is told from silence by frame energy.
+    silero_onnx = None
+
+logger = logging.getLogger(__name__)
+
+# Input is 16-bit mono PCM at this rate, scored in Silero's 32 ms windows.
+VAD_SAMPLE_RATE = 16000
+VAD_WINDOW = 512
+# "silero" (falls back to "energy" when Silero is not installed) or "energy".
+VAD_DETECTOR = os.getenv("VAD_DETECTOR", "silero")
+SPEECH_THRESHOLD = float(os.getenv("VAD_THRESHOLD", "0.5"))
+# A pause at least this long ends a stretch of speech; shorter ones are kept.
+SILENCE_MIN_SECONDS = float(os.getenv("VAD_SILENCE_SECONDS", "0.6"))
+# Blips shorter than this are not speech (a cough, a tap on the phone).
+SPEECH_MIN_SECONDS = 0.25
+# Silence kept around each stretch of speech so words are not clipped.
+SPEECH_PAD_SECONDS = 0.2
+# Shortest chunk of speech per transcription request. Whisper works on 30 s
+# windows, so chunks of that length cost no accuracy; notes with less speech
+# go in one piece.
+CHUNK_SECONDS = float(os.getenv("VOICE_CHUNK_SECONDS", "30"))
+# Chunks transcribed at once. A long note is cut into about this many chunks
+# (whole multiples of CHUNK_SECONDS), so it takes one round of requests.
+TRANSCRIBE_WORKERS = int(os.getenv("TRANSCRIBE_WORKERS", "4"))
+# Energy detector: a window is speech when this far above the noise floor.
+ENERGY_MARGIN_DB = 12.0
+ENERGY_MIN_DBFS = -50.0
+
+
+class _SileroScorer:
+    """Speech probability per window from the Silero model the voice agent loads."""
+
+    name = "silero"
+
+    def __init__(self) -> None:
+        self._session = silero_onnx.new_inference_session(force_cpu=True)
+
+    def __call__(self, samples) -> List[float]:
+        # Each note gets its own recurrent state; the session is shared.
+        model = silero_onnx.OnnxModel(onnx_session=self._session, sample_rate=VAD_SAMPLE_RATE)
+        windows = samples[:len(samples) // VAD_WINDOW * VAD_WINDOW].reshape(-1, VAD_WINDOW)
+        return [model(window) for window in windows]
+
+
+class _EnergyScorer:
+    """1.0 for windows well above the note's noise floor, else 0.0."""
+
+    name = "energy"
+
+    def __call__(self, samples) -> List[float]:
+        windows = samples[:len(samples) // VAD_WINDOW * VAD_WINDOW].reshape(-1, VAD_WINDOW)
+        if not len(windows):
+            return []
+        level = 10 * np.log10(np.mean(windows.astype(np.float64) ** 2, axis=1) + 1e-10)
+        floor = np.percentile(level, 10)
+        return (level > max(floor + ENERGY_MARGIN_DB, ENERGY_MIN_DBFS)).astype(float).tolist()
+
+
+SCORERS = {"silero": _SileroScorer, "energy": _EnergyScorer}
+
+
+def speech_segments(probabilities: List[float], threshold: float = SPEECH_THRESHOLD) -> List[Tuple[int, int]]:
+    """Sample ranges of speech, from per-window probabilities, padded and merged."""
+    min_silence = max(1, round(SILENCE_MIN_SECONDS * VAD_SAMPLE_RATE / VAD_WINDOW))
+    min_speech = SPEECH_MIN_SECONDS * VAD_SAMPLE_RATE
+    pad = int(SPEECH_PAD_SECONDS * VAD_SAMPLE_RATE)
+    end_of_audio = len(probabilities) * VAD_WINDOW
+    raw = []
+    start, quiet = None, 0
+    for index, probability in enumerate(probabilities):
+        if probability >= threshold:
+            if start is None:
+                start = index
+            quiet = 0
+        elif start is not None:
+            # Below the threshold by a margin counts as silence (Silero's hysteresis).
+            quiet += probability < threshold - 0.15
+            if quiet >= min_silence:
+                raw.append((start, index + 1 - quiet))
+                start, quiet = None, 0
+    if start is not None:
+        raw.append((start, len(probabilities) - quiet))
+
+    segments: List[Tuple[int, int]] = []
+    for first, last in raw:
+        begin, end = first * VAD_WINDOW, last * VAD_WINDOW
+        if end - begin < min_speech:
+            continue
+        begin, end = max(0, begin - pad), min(end_of_audio, end + pad)
+        if segments and begin <= segments[-1][1]:
+            segments[-1] = (segments[-1][0], end)
+        else:
+            segments.append((begin, end))
+    return segments
+
+
+def plan_chunks(segments: List[Tuple[int, int]], chunk_seconds: float = CHUNK_SECONDS) -> List[List[Tuple[int, int]]]:
+    """Group speech segments into chunks of at most ``chunk_seconds``, cutting only at pauses.
+
+    A single stretch of speech longer than a chunk is cut at the chunk length.
+    """
+    limit = int(chunk_seconds * VAD_SAMPLE_RATE)
+    chunks: List[List[Tuple[int, int]]] = []
+    current: List[Tuple[int, int]] = []
+    length = 0
+    for begin, end in segments:
+        while end - begin > limit:
+            if current:
+                chunks.append(current)
+                current, length = [], 0
+            chunks.append([(begin, begin + limit)])
+            begin += limit
+        if current and length + end - begin > limit:
+            chunks.append(current)
+            current, length = [], 0
+        current.append((begin, end))
+        length += end - begin
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class SpeechSplitter:
+    """Trims the silences out of a voice note and cuts it into chunks at pauses.
+
+    ``plan`` takes 16 kHz mono 16-bit PCM and returns the sample ranges of
+    each chunk, in order: the stretches of speech found by the VAD, each with
+    a little silence around it, grouped into chunks so they can be
+    transcribed in parallel, about one per worker and each a whole number of
+    ``chunk_seconds`` long. Silero (already loaded by the voice agent) scores
+    the windows when it is installed, frame energy otherwise or with
+    ``detector="energy"``; without numpy the note is kept whole. If no speech
+    is found the whole note is kept too, rather than risk dropping a quiet
+    speaker.
+    """
+
+    def __init__(self, chunk_seconds: float = CHUNK_SECONDS, workers: int = TRANSCRIBE_WORKERS,
+                 detector: str = VAD_DETECTOR) -> None:
+        self.chunk_seconds = chunk_seconds
+        self.workers = workers
+        self.detector = detector
+        self._scorer = None
+        self._lock = threading.Lock()
+        self.notes = 0
+        self.chunks = 0
+        self.audio_seconds = 0.0
+        self.speech_seconds = 0.0
+
+    def _get_scorer(self):
+        if self._scorer is None:
+            with self._lock:
+                if self._scorer is None:
+                    scorer = None
+                    if self.detector == "silero" and silero_onnx is not None:
+                        try:
+                            scorer = _SileroScorer()
+                        except Exception as e:
+                            logger.warning(f"Could not load Silero VAD, using frame energy: {str(e)}")
+                    elif self.detector not in SCORERS:
+                        raise ValueError(f"Unknown VAD detector {self.detector!r}; expected one of {sorted(SCORERS)}")
+                    self._scorer = scorer or _EnergyScorer()
+        return self._scorer
+
+    def plan(self, pcm: bytes) -> List[List[Tuple[int, int]]]:
+        seconds = len(pcm) / 2 / VAD_SAMPLE_RATE
+        chunks = [[(0, len(pcm) // 2)]]
+        speech = seconds
+        if np is not None and pcm:
+            samples = np.frombuffer(pcm[:len(pcm) // 2 * 2], dtype=np.int16)
+            segments = speech_segments(self._get_scorer()(samples.astype(np.float32) / 32768.0))
+            if segments:
+                speech = sum(end - begin for begin, end in segments) / VAD_SAMPLE_RATE
+                windows = math.ceil(speech / self.chunk_seconds / max(1, self.workers))
+                chunks = plan_chunks(segments, max(1, windows) * self.chunk_seconds)
+        with self._lock:
+            self.notes += 1
+            self.chunks += len(chunks)
+            self.audio_seconds += seconds
+            self.speech_seconds += speech
+        logger.info(f"Voice note of {seconds:.1f}s has {speech:.1f}s of speech, sent as {len(chunks)} chunk(s)")
+        return chunks
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "detector": self._scorer.name if self._scorer else None,
+                "notes": self.notes,
+                "chunks": self.chunks,
+                "audio_seconds": round(self.audio_seconds, 1),
+                "speech_seconds": round(self.speech_seconds, 1),
+                "silence_trimmed": round(1 - self.speech_seconds / self.audio_seconds, 3) if self.audio_seconds else 0.0,
+            }
+
+
+_splitter: Optional[SpeechSplitter] = None
+_splitter_lock = threading.Lock()
+
+
+def get_speech_splitter() -> SpeechSplitter:
+    global _splitter
+    if _splitter is None:
+        with _splitter_lock:
+            if _splitter is None:
+                _splitter = SpeechSplitter()
+    return _splitter
@@ -0,0 +1,273 @@
+import asyncio
+import bisect
+import logging
+import os
+import socket
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+
+from db import Database, get_database
+
+logger = logging.getLogger("nurse-assistant")
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))
+METRICS_FLUSH_INTERVAL = 15.0
+WORKER_NAME = os.getenv("WORKER_NAME", socket.gethostname())
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0, float("inf"))
+
+METRIC_HELP = {
+    "stt_latency": "Time the STT provider took to return a final transcript.",
+    "llm_ttft": "LLM time to first token.",
+    "tts_ttfb": "TTS time to first audio byte.",
+    "eou_delay": "Time from the end of user speech to the end-of-turn decision.",
+    "turn_latency": "End of user speech to first agent audio (eou_delay + llm_ttft + tts_ttfb).",
+}
+
+# A turn is complete once all three parts have been reported for its speech id.
+TURN_PARTS = ("eou_delay", "llm_ttft", "tts_ttfb")
+PENDING_TURNS_LIMIT = 256
+SEEN_REQUESTS_LIMIT = 1024
+
+# Requests already counted by some session in this process; see VoiceMetrics.
+_seen_requests: "OrderedDict[Tuple[str, str], None]" = OrderedDict()
+_seen_lock = threading.Lock()
+
+
+def _first_report(kind: Optional[str], request_id: str) -> bool:
+    """True the first time any session in the process reports this request."""
+    key = (kind, request_id)
+    with _seen_lock:
+        if key in _seen_requests:
+            return False
+        _seen_requests[key] = None
+        if len(_seen_requests) > SEEN_REQUESTS_LIMIT:
+            _seen_requests.popitem(last=False)
+        return True
+
+
+class LatencyHistogram:
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+
+class VoiceMetrics:
+    """Latency histograms for one job, fed from the session's metrics events.
+
+    Observations accumulate in memory and are added to the worker's totals in
+    hospital.db every ``METRICS_FLUSH_INTERVAL`` seconds and when the job ends,
+    so they survive the job process and can be served by the worker.
+
+    STT and TTS clients are shared across sessions (see speech.py), so every
+    session sees their events; ``request_id`` is used to observe each once per
+    process, by whichever session reports it first (the clients are shared
+    per language, so it carries the right label). A TTS report still goes to
+    every session's turn assembly, where only the session whose LLM and
+    end-of-utterance reports share its ``speech_id`` completes the turn.
+    """
+
+    def __init__(self, language: str, db: Optional[Database] = None, worker: str = WORKER_NAME) -> None:
+        self.language = language
+        self.worker = worker
+        self._db = db
+        self._histograms: Dict[str, LatencyHistogram] = {}
+        self._turns: "OrderedDict[str, Dict[str, float]]" = OrderedDict()
+        self._totals: Dict[str, Tuple[int, float]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def db(self) -> Database:
+        return self._db or get_database()
+
+    def observe(self, metric: str, seconds: Optional[float]) -> None:
+        if seconds is None or seconds < 0:
+            return
+        histogram = self._histograms.get(metric)
+        if histogram is None:
+            histogram = self._histograms[metric] = LatencyHistogram()
+        histogram.observe(seconds)
+        count, total = self._totals.get(metric, (0, 0.0))
+        self._totals[metric] = (count + 1, total + seconds)
+
+    def record(self, metrics) -> None:
+        """Handle one ``metrics_collected`` payload."""
+        kind = getattr(metrics, "type", None)
+        request_id = getattr(metrics, "request_id", None)
+        first = not request_id or _first_report(kind, request_id)
+
+        if kind == "stt_metrics":
+            # Streaming STT reports no request latency; its cost shows up in eou_delay.
+            if first and not metrics.streamed:
+                self.observe("stt_latency", metrics.duration)
+        elif kind == "llm_metrics":
+            self._turn_part(metrics.speech_id, "llm_ttft", metrics.ttft, first)
+        elif kind == "tts_metrics":
+            self._turn_part(metrics.speech_id, "tts_ttfb", metrics.ttfb, first)
+        elif kind == "eou_metrics":
+            self._turn_part(metrics.speech_id, "eou_delay", metrics.end_of_utterance_delay, first)
+
+    def _turn_part(self, speech_id: Optional[str], part: str, seconds: float, observe: bool = True) -> None:
+        if seconds is None or seconds < 0:
+            return
+        if observe:
+            self.observe(part, seconds)
+        if not speech_id:
+            return
+        parts = self._turns.setdefault(speech_id, {})
+        # A reply spoken in several segments reports more than one TTFB; the first is the one heard.
+        parts.setdefault(part, seconds)
+        if len(parts) == len(TURN_PARTS):
+            self.observe("turn_latency", sum(parts.values()))
+            del self._turns[speech_id]
+        elif len(self._turns) > PENDING_TURNS_LIMIT:
+            # Turns without an end of utterance (the greeting, interruptions) never complete.
+            self._turns.popitem(last=False)
+
+    def start(self) -> None:
+        if self._task and not self._task.done():
+            return
+        self._task = asyncio.create_task(self._run(), name="voice-metrics")
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(METRICS_FLUSH_INTERVAL)
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Add the observations since the last flush to the worker totals."""
+        if not self._histograms:
+            return
+        pending, self._histograms = self._histograms, {}
+        try:
+            await self.db.run(self._write, pending)
+        except Exception as e:
+            logger.error(f"Failed to store latency metrics: {e}")
+            for metric, histogram in pending.items():
+                merged = self._histograms.setdefault(metric, LatencyHistogram())
+                merged.counts = [a + b for a, b in zip(merged.counts, histogram.counts)]
+                merged.total += histogram.total
+                merged.count += histogram.count
+
+    def _write(self, conn, pending: Dict[str, LatencyHistogram]) -> None:
+        for metric, histogram in pending.items():
+            conn.executemany(
+                "INSERT INTO latency_histograms (worker, metric, language, le, observations) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (worker, metric, language, le) DO UPDATE SET observations = observations + excluded.observations",
+                [
+                    (self.worker, metric, self.language, le, observations)
+                    for le, observations in zip(histogram.buckets, histogram.counts)
+                    if observations
+                ]
+            )
+            conn.execute(
+                "INSERT INTO latency_sums (worker, metric, language, total_seconds, observations) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (worker, metric, language) DO UPDATE SET "
+                "total_seconds = total_seconds + excluded.total_seconds, observations = observations + excluded.observations",
+                (self.worker, metric, self.language, histogram.total, histogram.count)
+            )
+
+    def summary(self) -> dict:
+        """Mean latency in milliseconds and sample count per metric for this job."""
+        return {
+            metric: {"mean_ms": round(total / count * 1000), "count": count}
+            for metric, (count, total) in sorted(self._totals.items())
+        }
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_prometheus(conn) -> str:
+    """Render the stored histograms in the Prometheus text exposition format."""
+    buckets: Dict[Tuple[str, str, str], Dict[float, int]] = {}
+    for worker, metric, language, le, observations in conn.execute(
+        "SELECT worker, metric, language, le, observations FROM latency_histograms ORDER BY metric, worker, language"
+    ):
+        buckets.setdefault((metric, worker, language), {})[le] = observations
+    sums = {
+        (metric, worker, language): (total, count)
+        for worker, metric, language, total, count in conn.execute(
+            "SELECT worker, metric, language, total_seconds, observations FROM latency_sums"
+        )
+    }
+
+    lines = []
+    current = None
+    for (metric, worker, language), series in buckets.items():
+        name = f"nurse_{metric}_seconds"
+        if metric != current:
+            current = metric
+            lines.append(f"# HELP {name} {METRIC_HELP.get(metric, metric)}")
+            lines.append(f"# TYPE {name} histogram")
+        labels = f'worker="{_label(worker)}",language="{_label(language)}"'
+        cumulative = 0
+        # Every series lists the same bounds, including ones it has no observations in.
+        for le in sorted(set(LATENCY_BUCKETS) | set(series)):
+            cumulative += series.get(le, 0)
+            if le != float("inf"):
+                lines.append(f'{name}_bucket{{{labels},le="{le:g}"}} {cumulative}')
+        total, count = sums.get((metric, worker, language), (0.0, cumulative))
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {cumulative}')
+        lines.append(f"{name}_sum{{{labels}}} {total}")
+        lines.append(f"{name}_count{{{labels}}} {count}")
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    db: Database = None
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        try:
+            with self.db.connection() as conn:
+                body = render_prometheus(conn).encode("utf-8")
+        except Exception as e:
+            logger.error(f"Failed to render metrics: {e}")
+            self.send_error(500)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: int = METRICS_PORT, db: Optional[Database] = None) -> Optional[ThreadingHTTPServer]:
+    """Serve ``/metrics`` from a daemon thread; returns None if the port is taken."""
+    handler = type("MetricsHandler", (_MetricsHandler,), {"db": db or get_database()})
+    try:
+        server = ThreadingHTTPServer(("0.0.0.0", port), handler)
+    except OSError as e:
+        logger.error(f"Metrics endpoint not started on port {port}: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info(f"Serving latency metrics on :{port}/metrics")
+    return server
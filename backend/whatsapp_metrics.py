@@ -0,0 +1,360 @@
+import atexit
+import bisect
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from voice_metrics import LATENCY_BUCKETS
+
+logger = logging.getLogger(__name__)
+
+WHATSAPP_METRICS_DB_PATH = os.getenv("WHATSAPP_METRICS_DB_PATH", "whatsapp_metrics.db")
+WHATSAPP_METRICS_FLUSH_INTERVAL = float(os.getenv("WHATSAPP_METRICS_FLUSH_INTERVAL", "15"))
+# Rolling windows served by /injury-stats.
+MINUTE_WINDOW = 60
+HOUR_WINDOW = 48
+# Shards drop their own minute buckets this old; far older than a flush interval.
+SHARD_RETENTION_MINUTES = 180
+
+
+class _Shard:
+    """One thread's running totals. Only the owning thread writes to it, so no lock is taken."""
+
+    __slots__ = ("thread", "counters", "minutes", "histograms", "sums", "oldest_minute")
+
+    def __init__(self) -> None:
+        self.thread = threading.current_thread()
+        self.counters: Dict[str, int] = {}
+        # (event, minute since the epoch) -> count
+        self.minutes: Dict[Tuple[str, int], int] = {}
+        self.histograms: Dict[str, List[int]] = {}
+        # metric -> [observations, total seconds]
+        self.sums: Dict[str, List[float]] = {}
+        self.oldest_minute = 0
+
+
+def _member_key(member: str) -> int:
+    """What ``distinct`` stores instead of the member itself (a phone number, say)."""
+    return int.from_bytes(hashlib.blake2b(member.encode("utf-8"), digest_size=8).digest(), "big", signed=True)
+
+
+def _delta(current: dict, flushed: dict) -> dict:
+    return {key: value - flushed.get(key, 0) for key, value in current.items() if value != flushed.get(key, 0)}
+
+
+class WhatsAppMetrics:
+    """Running totals, rolling windows and latency histograms for the WhatsApp bot.
+
+    Every thread counts into its own shard, so recording an event is a few
+    dict updates with no lock. Shards keep cumulative values; a flusher thread
+    adds what changed since its last pass to SQLite every
+    ``WHATSAPP_METRICS_FLUSH_INTERVAL`` seconds, where the totals of all
+    worker processes meet and survive restarts. ``snapshot`` reads a fixed
+    number of rows (counters, the last ``MINUTE_WINDOW`` minutes and
+    ``HOUR_WINDOW`` hours, one histogram per metric) plus the unflushed
+    deltas, so its cost does not depend on how many senders there have been.
+    ``distinct`` counts each member of a set once across all workers and
+    restarts; members are kept hashed and the count is a counter like any
+    other, bumped at flush time for members not seen before.
+    """
+
+    def __init__(self, path: str = WHATSAPP_METRICS_DB_PATH, flush_interval: float = WHATSAPP_METRICS_FLUSH_INTERVAL) -> None:
+        self.path = path
+        self.flush_interval = flush_interval
+        self._local = threading.local()
+        self._shards: List[_Shard] = []
+        # Per shard, the cumulative values already written to SQLite.
+        self._flushed: Dict[int, Tuple[dict, dict, dict, dict]] = {}
+        self._register_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flusher: Optional[threading.Thread] = None
+        # (counter name, member key) not yet written; rare enough to share one lock.
+        self._members: Set[Tuple[str, int]] = set()
+        self._members_lock = threading.Lock()
+        conn = self._connect()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS windows (
+                event TEXT NOT NULL,
+                resolution TEXT NOT NULL,
+                start INTEGER NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (event, resolution, start)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS histograms (
+                metric TEXT NOT NULL,
+                le REAL NOT NULL,
+                observations INTEGER NOT NULL,
+                PRIMARY KEY (metric, le)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS latency_sums (
+                metric TEXT PRIMARY KEY,
+                observations INTEGER NOT NULL,
+                total_seconds REAL NOT NULL
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS distinct_members (
+                name TEXT NOT NULL,
+                member INTEGER NOT NULL,
+                PRIMARY KEY (name, member)
+            ) WITHOUT ROWID;
+        """)
+        conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _shard(self) -> _Shard:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._register_lock:
+                self._shards.append(shard)
+                if self._flusher is None:
+                    self._flusher = threading.Thread(target=self._flush_loop, name="whatsapp-metrics", daemon=True)
+                    self._flusher.start()
+                    atexit.register(self.flush)
+        return shard
+
+    # Recording
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        counters = self._shard().counters
+        counters[name] = counters.get(name, 0) + amount
+
+    def event(self, name: str) -> None:
+        """Count ``name`` in the running total and in the current minute's window."""
+        shard = self._shard()
+        shard.counters[name] = shard.counters.get(name, 0) + 1
+        minute = int(time.time() // 60)
+        key = (name, minute)
+        shard.minutes[key] = shard.minutes.get(key, 0) + 1
+        if minute - shard.oldest_minute > SHARD_RETENTION_MINUTES:
+            cutoff = minute - SHARD_RETENTION_MINUTES // 2
+            for old in [key for key in shard.minutes if key[1] < cutoff]:
+                del shard.minutes[old]
+            shard.oldest_minute = cutoff
+
+    def distinct(self, name: str, member: str) -> None:
+        """Count ``member`` in the counter ``name`` unless it has been counted before."""
+        self._shard()  # starts the flusher
+        with self._members_lock:
+            self._members.add((name, _member_key(member)))
+
+    def observe(self, metric: str, seconds: Optional[float]) -> None:
+        if seconds is None or seconds < 0:
+            return
+        shard = self._shard()
+        counts = shard.histograms.get(metric)
+        if counts is None:
+            counts = shard.histograms[metric] = [0] * len(LATENCY_BUCKETS)
+        counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        sums = shard.sums.get(metric)
+        if sums is None:
+            sums = shard.sums[metric] = [0, 0.0]
+        sums[0] += 1
+        sums[1] += seconds
+
+    # Persistence
+
+    def _pending(self):
+        """What the shards counted since the last flush, their new cumulative
+        values, and the shards of threads that have exited."""
+        counters: Dict[str, int] = {}
+        minutes: Dict[Tuple[str, int], int] = {}
+        buckets: Dict[Tuple[str, float], int] = {}
+        sums: Dict[str, List[float]] = {}
+        marks = []
+        finished = []
+        for shard in list(self._shards):
+            # A shard whose thread has exited holds final values; once flushed it can go.
+            if not shard.thread.is_alive():
+                finished.append(shard)
+            flushed_counters, flushed_minutes, flushed_buckets, flushed_sums = self._flushed.get(
+                id(shard), ({}, {}, {}, {})
+            )
+            # dict() and list() copies are atomic under the GIL, so the owner keeps counting meanwhile.
+            now_counters = dict(shard.counters)
+            now_minutes = dict(shard.minutes)
+            now_buckets = {(metric, le): count for metric, counts in list(shard.histograms.items())
+                           for le, count in zip(LATENCY_BUCKETS, list(counts))}
+            now_sums = {metric: tuple(values) for metric, values in list(shard.sums.items())}
+            for name, value in _delta(now_counters, flushed_counters).items():
+                counters[name] = counters.get(name, 0) + value
+            for key, value in now_minutes.items():
+                change = value - flushed_minutes.get(key, 0)
+                if change:
+                    minutes[key] = minutes.get(key, 0) + change
+            for key, value in _delta(now_buckets, flushed_buckets).items():
+                buckets[key] = buckets.get(key, 0) + value
+            for metric, (count, total) in now_sums.items():
+                old_count, old_total = flushed_sums.get(metric, (0, 0.0))
+                if count != old_count:
+                    merged = sums.setdefault(metric, [0, 0.0])
+                    merged[0] += count - old_count
+                    merged[1] += total - old_total
+            marks.append((id(shard), (now_counters, now_minutes, now_buckets, now_sums)))
+        return counters, minutes, buckets, sums, (marks, finished)
+
+    def flush(self) -> None:
+        with self._flush_lock:
+            counters, minutes, buckets, sums, (marks, finished) = self._pending()
+            with self._members_lock:
+                members, self._members = self._members, set()
+            if not (counters or minutes or buckets or sums or members):
+                self._forget(finished)
+                return
+            hours: Dict[Tuple[str, int], int] = {}
+            for (event, minute), count in minutes.items():
+                hours[(event, minute // 60)] = hours.get((event, minute // 60), 0) + count
+            conn = self._connect()
+            try:
+                with conn:
+                    for name, member in members:
+                        if conn.execute("INSERT OR IGNORE INTO distinct_members (name, member) VALUES (?, ?)",
+                                        (name, member)).rowcount:
+                            counters[name] = counters.get(name, 0) + 1
+                    conn.executemany(
+                        "INSERT INTO counters (name, value) VALUES (?, ?) "
+                        "ON CONFLICT (name) DO UPDATE SET value = value + excluded.value",
+                        list(counters.items())
+                    )
+                    conn.executemany(
+                        "INSERT INTO windows (event, resolution, start, count) VALUES (?, ?, ?, ?) "
+                        "ON CONFLICT (event, resolution, start) DO UPDATE SET count = count + excluded.count",
+                        [(event, "minute", minute, count) for (event, minute), count in minutes.items()]
+                        + [(event, "hour", hour, count) for (event, hour), count in hours.items()]
+                    )
+                    conn.executemany(
+                        "INSERT INTO histograms (metric, le, observations) VALUES (?, ?, ?) "
+                        "ON CONFLICT (metric, le) DO UPDATE SET observations = observations + excluded.observations",
+                        [(metric, le, count) for (metric, le), count in buckets.items()]
+                    )
+                    conn.executemany(
+                        "INSERT INTO latency_sums (metric, observations, total_seconds) VALUES (?, ?, ?) "
+                        "ON CONFLICT (metric) DO UPDATE SET observations = observations + excluded.observations, "
+                        "total_seconds = total_seconds + excluded.total_seconds",
+                        [(metric, count, total) for metric, (count, total) in sums.items()]
+                    )
+                    # Windows older than anything served are not needed.
+                    now_minute = int(time.time() // 60)
+                    conn.execute("DELETE FROM windows WHERE resolution = 'minute' AND start < ?", (now_minute - MINUTE_WINDOW,))
+                    conn.execute("DELETE FROM windows WHERE resolution = 'hour' AND start < ?", (now_minute // 60 - HOUR_WINDOW,))
+            except Exception as e:
+                logger.error(f"Failed to store WhatsApp metrics: {e}")
+                with self._members_lock:
+                    self._members |= members
+                return
+            finally:
+                conn.close()
+            self._flushed.update(marks)
+            self._forget(finished)
+
+    def _forget(self, shards: List[_Shard]) -> None:
+        if not shards:
+            return
+        with self._register_lock:
+            for shard in shards:
+                self._shards.remove(shard)
+                self._flushed.pop(id(shard), None)
+
+    def _flush_loop(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    # Reading
+
+    def snapshot(self) -> dict:
+        """Totals, per-minute and per-hour windows and latency summaries across all workers."""
+        with self._flush_lock:
+            counters, minutes, buckets, sums, _ = self._pending()
+            with self._members_lock:
+                members = set(self._members)
+        now_minute = int(time.time() // 60)
+        now_hour = now_minute // 60
+        conn = self._connect()
+        try:
+            for name, value in conn.execute("SELECT name, value FROM counters"):
+                counters[name] = counters.get(name, 0) + value
+            for name, member in members:
+                if conn.execute("SELECT 1 FROM distinct_members WHERE name = ? AND member = ?",
+                                (name, member)).fetchone() is None:
+                    counters[name] = counters.get(name, 0) + 1
+            per_minute: Dict[str, Dict[int, int]] = {}
+            per_hour: Dict[str, Dict[int, int]] = {}
+            for (event, minute), count in minutes.items():
+                per_minute.setdefault(event, {})[minute] = per_minute.get(event, {}).get(minute, 0) + count
+                per_hour.setdefault(event, {})[minute // 60] = per_hour.get(event, {}).get(minute // 60, 0) + count
+            for event, resolution, start, count in conn.execute(
+                "SELECT event, resolution, start, count FROM windows WHERE "
+                "(resolution = 'minute' AND start > ?) OR (resolution = 'hour' AND start > ?)",
+                (now_minute - MINUTE_WINDOW, now_hour - HOUR_WINDOW)
+            ):
+                series = per_minute if resolution == "minute" else per_hour
+                series.setdefault(event, {})[start] = series.get(event, {}).get(start, 0) + count
+            for metric, le, count in conn.execute("SELECT metric, le, observations FROM histograms"):
+                buckets[(metric, le)] = buckets.get((metric, le), 0) + count
+            for metric, count, total in conn.execute("SELECT metric, observations, total_seconds FROM latency_sums"):
+                merged = sums.setdefault(metric, [0, 0.0])
+                merged[0] += count
+                merged[1] += total
+        finally:
+            conn.close()
+
+        windows = {}
+        for event in sorted(set(per_minute) | set(per_hour)):
+            minute_counts = per_minute.get(event, {})
+            hour_counts = per_hour.get(event, {})
+            windows[event] = {
+                "last_minute": minute_counts.get(now_minute, 0),
+                "last_hour": sum(count for minute, count in minute_counts.items() if minute > now_minute - 60),
+                "last_24_hours": sum(count for hour, count in hour_counts.items() if hour > now_hour - 24),
+                "per_minute": [minute_counts.get(minute, 0) for minute in range(now_minute - MINUTE_WINDOW + 1, now_minute + 1)],
+                "per_hour": [hour_counts.get(hour, 0) for hour in range(now_hour - HOUR_WINDOW + 1, now_hour + 1)],
+            }
+        latency = {}
+        for metric, (count, total) in sorted(sums.items()):
+            if not count:
+                continue
+            counts = [buckets.get((metric, le), 0) for le in LATENCY_BUCKETS]
+            latency[metric] = {
+                "count": int(count),
+                "mean_ms": round(total / count * 1000),
+                "p50_ms": _quantile_ms(counts, 0.5),
+                "p95_ms": _quantile_ms(counts, 0.95),
+            }
+        return {"counters": counters, "windows": windows, "latency": latency}
+
+
+def _quantile_ms(counts: List[int], fraction: float) -> Optional[float]:
+    """Upper bound of the histogram bucket holding the quantile."""
+    target = sum(counts) * fraction
+    seen = 0
+    for le, count in zip(LATENCY_BUCKETS, counts):
+        seen += count
+        if count and seen >= target:
+            return None if le == float("inf") else round(le * 1000)
+    return None
+
+
+_metrics: Optional[WhatsAppMetrics] = None
+_metrics_lock = threading.Lock()
+
+
+def get_whatsapp_metrics() -> WhatsAppMetrics:
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = WhatsAppMetrics()
+    return _metrics
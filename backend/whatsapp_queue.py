@@ -0,0 +1,102 @@
+import logging
+import queue
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SenderQueue:
+    """Bounded work queue that keeps each sender's messages in order.
+
+    Any number of senders are served in parallel by a fixed pool of worker
+    threads, but at most one message per sender is in flight, and a sender's
+    messages are handled in arrival order. A sender with a backlog goes to the
+    back of the line after each message, so one busy chat cannot starve the
+    rest. ``submit`` refuses new work once ``max_depth`` messages are waiting.
+    """
+
+    def __init__(self, handler: Callable[[str, Any], None], workers: int = 4, max_depth: int = 200,
+                 name: str = "whatsapp") -> None:
+        self.handler = handler
+        self.workers = workers
+        self.max_depth = max_depth
+        self.name = name
+        self._lock = threading.Lock()
+        # Sender -> messages not yet handled. A sender is present while it has
+        # work queued or in flight, and is then in ``_ready`` or being served.
+        self._pending: Dict[str, Deque[Any]] = {}
+        self._ready: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._depth = 0
+        self._threads: List[threading.Thread] = []
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def start(self) -> None:
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"{self.name}-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Let the workers finish what is queued, then stop them."""
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._ready.put(None)
+        for thread in threads:
+            thread.join(timeout)
+
+    def submit(self, sender: str, item: Any) -> bool:
+        """Queue ``item`` behind the sender's earlier messages; False if the queue is full."""
+        with self._lock:
+            if self._depth >= self.max_depth:
+                self.rejected += 1
+                return False
+            self._depth += 1
+            backlog = self._pending.get(sender)
+            if backlog is not None:
+                backlog.append(item)
+                return True
+            self._pending[sender] = deque([item])
+        self._ready.put(sender)
+        return True
+
+    def _work(self) -> None:
+        while True:
+            sender = self._ready.get()
+            if sender is None:
+                return
+            with self._lock:
+                item = self._pending[sender][0]
+            try:
+                self.handler(sender, item)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Queued message from {sender} failed: {e}", exc_info=True)
+            with self._lock:
+                backlog = self._pending[sender]
+                backlog.popleft()
+                self._depth -= 1
+                if not backlog:
+                    del self._pending[sender]
+                    continue
+            self._ready.put(sender)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "depth": self._depth,
+                "max_depth": self.max_depth,
+                "senders": len(self._pending),
+                "workers": len(self._threads),
+                "processed": self.processed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+            }
@@ -0,0 +1,181 @@
+import base64
+import io
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+try:
+    from PIL import Image
+    from ultralytics import YOLO
+except ImportError:  # ultralytics missing: every image goes to the vision model.
+    YOLO = None
+
+logger = logging.getLogger(__name__)
+
+# Weights of the YOLO11n detector trained on the Roboflow wound set (see
+# data.yaml and yolo_evaluation/); they are not kept in the repository.
+WOUND_DETECTOR_WEIGHTS = os.getenv("WOUND_DETECTOR_WEIGHTS", os.path.join(os.path.dirname(__file__), "best.pt"))
+WOUND_DETECTOR_IMGSZ = int(os.getenv("WOUND_DETECTOR_IMGSZ", "640"))
+# Boxes below this confidence are ignored.
+WOUND_MIN_CONFIDENCE = float(os.getenv("WOUND_MIN_CONFIDENCE", "0.25"))
+# "no abnormality" must be at least this sure before the vision model is skipped.
+NO_ABNORMALITY_CONFIDENCE = float(os.getenv("NO_ABNORMALITY_CONFIDENCE", "0.6"))
+WOUND_CLASSES = {"Abrasions", "Bruise", "Burn", "Cut"}
+NO_ABNORMALITY = "no abnormality"
+# The analysis may be shorter when the detector has already named the injury.
+HINTED_MAX_TOKENS = 700
+
+# Verdicts answered from a template instead of the vision model. A photo with
+# nothing detected is not one of them: the detector only knows four kinds of
+# wound and misses others (bites, rashes, swelling), so the vision model looks.
+FAST_REPLIES = {
+    "no_abnormality": {
+        "en": "I looked at your photo and could not see a visible wound, burn, bruise or cut. "
+              "If you have pain, swelling, numbness or trouble moving the area, please describe it "
+              "in a message and I will help further.",
+        "hi": "मैंने आपकी फ़ोटो देखी, इसमें कोई घाव, जलन, चोट का निशान या कट दिखाई नहीं दे रहा। "
+              "अगर दर्द, सूजन, सुन्नपन या हिलाने में परेशानी है, तो कृपया संदेश में बताएं, मैं आगे मदद करूंगी।",
+        "mr": "मी तुमचा फोटो पाहिला, त्यात कोणतीही जखम, भाजणे, मुका मार किंवा कापलेले दिसत नाही. "
+              "वेदना, सूज, बधिरपणा किंवा हालचाल करताना त्रास होत असल्यास कृपया संदेशात सांगा, मी पुढे मदत करेन.",
+    },
+}
+
+
+class Detection(NamedTuple):
+    label: str
+    confidence: float
+    # Corners as fractions of the image width and height.
+    box: Tuple[float, float, float, float]
+
+
+class Triage(NamedTuple):
+    # "wound", "no_abnormality", "no_detection", "uncertain" or "unavailable"
+    verdict: str
+    detections: List[Detection]
+    seconds: float
+
+
+def classify(detections: List[Detection]) -> str:
+    if any(d.label in WOUND_CLASSES for d in detections):
+        return "wound"
+    if not detections:
+        return "no_detection"
+    if max((d.confidence for d in detections if d.label == NO_ABNORMALITY), default=0) >= NO_ABNORMALITY_CONFIDENCE:
+        return "no_abnormality"
+    return "uncertain"
+
+
+def prompt_note(triage: Triage) -> str:
+    """What the detector found, for the vision model's prompt."""
+    if triage.verdict == "wound":
+        found = "; ".join(
+            f"{d.label} ({d.confidence:.0%}) at {d.box[0]:.0%}-{d.box[2]:.0%} across, {d.box[1]:.0%}-{d.box[3]:.0%} down"
+            for d in triage.detections if d.label in WOUND_CLASSES
+        )
+        return (f"A wound detector marked this photo: {found}. Use this as a hint, check it against the image, "
+                "and keep the answer brief, focused on the injury found.")
+    if triage.verdict in ("uncertain", "no_detection", "no_abnormality"):
+        return "A wound detector found no clear wound in this photo, but was unsure; look closely before concluding."
+    return ""
+
+
+class WoundDetector:
+    """Local YOLO pre-filter for injury photos, run before the vision model.
+
+    ``triage`` takes the downscaled image and returns the detections above
+    ``WOUND_MIN_CONFIDENCE`` and a verdict. Only a confident "no abnormality"
+    on a photo sent without a caption is answered from ``FAST_REPLIES``;
+    every other image goes to the vision model with ``prompt_note`` added, a
+    hint for detected wounds and a warning to look closely otherwise. The
+    model is loaded on first use and shared by the worker's threads, one
+    prediction at a time. Without ultralytics or the weights every verdict
+    is "unavailable" and images take the usual path.
+    """
+
+    def __init__(self, weights: str = WOUND_DETECTOR_WEIGHTS, imgsz: int = WOUND_DETECTOR_IMGSZ) -> None:
+        self.weights = weights
+        self.imgsz = imgsz
+        self._model = None
+        self._load_failed = False
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.verdicts: Dict[str, int] = {}
+        self.detect_seconds = 0.0
+
+    def _get_model(self):
+        if self._model is None and not self._load_failed:
+            if YOLO is None or not os.path.exists(self.weights):
+                self._load_failed = True
+                logger.warning(f"Wound detector disabled: {'ultralytics not installed' if YOLO is None else f'no weights at {self.weights}'}")
+            else:
+                try:
+                    self._model = YOLO(self.weights)
+                except Exception as e:
+                    self._load_failed = True
+                    logger.error(f"Could not load wound detector from {self.weights}: {str(e)}")
+        return self._model
+
+    def detect(self, image: bytes) -> Optional[List[Detection]]:
+        with self._lock:
+            model = self._get_model()
+            if model is None:
+                return None
+            with Image.open(io.BytesIO(image)) as picture:
+                result = model.predict(picture.convert("RGB"), imgsz=self.imgsz, conf=WOUND_MIN_CONFIDENCE,
+                                       verbose=False)[0]
+        boxes = result.boxes
+        return sorted(
+            (Detection(result.names[int(cls)], round(float(conf), 3), tuple(round(float(v), 3) for v in box))
+             for cls, conf, box in zip(boxes.cls.tolist(), boxes.conf.tolist(), boxes.xyxyn.tolist())),
+            key=lambda d: d.confidence, reverse=True,
+        )
+
+    def triage(self, image: bytes) -> Triage:
+        started = time.perf_counter()
+        try:
+            detections = self.detect(image)
+        except Exception as e:
+            logger.error(f"Wound detection failed: {str(e)}")
+            detections = None
+        seconds = time.perf_counter() - started
+        verdict = "unavailable" if detections is None else classify(detections)
+        with self._stats_lock:
+            self.verdicts[verdict] = self.verdicts.get(verdict, 0) + 1
+            if detections is not None:
+                self.detect_seconds += seconds
+        return Triage(verdict, detections or [], seconds)
+
+    def triage_data_url(self, data_url: str) -> Triage:
+        return self.triage(base64.b64decode(data_url.split(",", 1)[1]))
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            checked = sum(count for verdict, count in self.verdicts.items() if verdict != "unavailable")
+            return {
+                "enabled": self._model is not None,
+                "weights": self.weights,
+                "verdicts": dict(self.verdicts),
+                "avg_detect_ms": round(self.detect_seconds / checked * 1000, 1) if checked else 0.0,
+            }
+
+
+def fast_reply(verdict: str, language: str) -> Optional[str]:
+    templates = FAST_REPLIES.get(verdict)
+    if templates is None:
+        return None
+    return templates.get(language, templates["en"])
+
+
+_detector: Optional[WoundDetector] = None
+_detector_lock = threading.Lock()
+
+
+def get_wound_detector() -> WoundDetector:
+    global _detector
+    if _detector is None:
+        with _detector_lock:
+            if _detector is None:
+                _detector = WoundDetector()
+    return _detector